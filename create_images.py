@@ -0,0 +1,81 @@
+import argparse
+import functools
+import json
+import os
+import time
+
+from src.batch import collect_images, create_generator, plan_jobs, run_batch, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate paint by numbers images for a batch of images.')
+    parser.add_argument('source', help='directory of images or manifest file with one image path per line')
+    parser.add_argument('output_root', help='every image gets a folder named after it in here')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default: cores / threads')
+    parser.add_argument('--threads', type=int, default=1, help='BLAS / OpenMP / OpenCV threads per worker')
+    parser.add_argument('--colors', type=int, default=20)
+    parser.add_argument('--segmenter', choices=('kmeans', 'octree', 'median_cut', 'superpixel'), default='kmeans')
+    parser.add_argument('--merge-small-regions', action='store_true')
+    parser.add_argument('--tiled', action='store_true', help='out-of-core generator for very large images')
+    parser.add_argument('--vector', nargs='*', choices=('svg', 'pdf'), default=(), help='vector outline outputs')
+    parser.add_argument('--compact', action='store_true', help='narrow dtypes for lower peak memory')
+    parser.add_argument(
+        '--preprocess', nargs='*', default=(), metavar='STEP[:VALUE]',
+        help='e.g. downscale:2 bilateral label_median:5, steps: downscale, gaussian_blur, bilateral, mean_shift, guided'
+    )
+    parser.add_argument('--scale', type=int, default=1, help='output pixels per image pixel, for print resolution')
+    parser.add_argument('--line-width', type=float, default=None, help='outline width in output pixels')
+    parser.add_argument('--antialias', action='store_true', help='soft outline edges')
+    parser.add_argument('--dpi', type=int, default=None, help='resolution stored in the images')
+    parser.add_argument('--force', action='store_true', help='also regenerate images that are already done')
+    parser.add_argument('--max-tasks-per-child', type=int, default=None)
+    arguments = parser.parse_args()
+
+    generator_factory = functools.partial(
+        create_generator,
+        segmenter=arguments.segmenter,
+        number_of_colors=arguments.colors,
+        merge_small_regions=arguments.merge_small_regions,
+        tiled=arguments.tiled,
+        vector_formats=tuple(arguments.vector),
+        compact=arguments.compact,
+        preprocessing=tuple(arguments.preprocess),
+        render_scale=arguments.scale,
+        line_width=arguments.line_width,
+        antialias=arguments.antialias,
+        dpi=arguments.dpi
+    )
+
+    # options the generator does not support fail here, not once per image in the workers
+    try:
+        generator_factory()
+    except ValueError as error:
+        parser.error(str(error))
+
+    os.makedirs(arguments.output_root, exist_ok=True)
+
+    jobs = plan_jobs(collect_images(arguments.source), arguments.output_root)
+
+    start = time.perf_counter()
+    results = run_batch(
+        jobs,
+        generator_factory,
+        workers=arguments.workers,
+        threads_per_worker=arguments.threads,
+        report_path=os.path.join(arguments.output_root, 'batch_report.jsonl'),
+        skip_completed=not arguments.force,
+        max_tasks_per_child=arguments.max_tasks_per_child
+    )
+    summary = summarize(results, time.perf_counter() - start)
+
+    for result in results:
+        if result.status == 'failed':
+            print(f'Failed: {result.image_path}\n{result.error}')
+
+    print(json.dumps(summary, indent=2))
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
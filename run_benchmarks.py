@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+
+from src.benchmark import BenchmarkConfig, compare_to_baseline, load_results, run_benchmarks, save_results
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on the reference images.')
+    parser.add_argument('--quick', action='store_true', help='three images, two small scales, one palette size')
+    parser.add_argument('--images', nargs='*', default=None, help='file names in test-images-mnz')
+    parser.add_argument('--scales', type=float, nargs='*', default=None)
+    parser.add_argument('--colors', type=int, nargs='*', default=None)
+    parser.add_argument('--repeats', type=int, default=None)
+    parser.add_argument('--no-end-to-end', action='store_true')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slow down / memory growth')
+    parser.add_argument(
+        '--update-baseline', action='store_true',
+        help='store the results as the new baseline, it is machine specific: regenerate it on the comparing host'
+    )
+    arguments = parser.parse_args()
+
+    config = BenchmarkConfig.quick() if arguments.quick else BenchmarkConfig()
+    if arguments.images is not None:
+        config.images = arguments.images
+    if arguments.scales is not None:
+        config.scales = tuple(arguments.scales)
+    if arguments.colors is not None:
+        config.palette_sizes = tuple(arguments.colors)
+    if arguments.repeats is not None:
+        config.repeats = arguments.repeats
+    if arguments.no_end_to_end:
+        config.end_to_end = False
+
+    def progress(result):
+        summary = result.to_dict()
+        p90 = f'{summary["p90"] * 1000:9.1f} ms' if summary['p90'] is not None else f'{"-":>12s}'
+        print(
+            f'{result.name:70s} p50 {summary["p50"] * 1000:9.1f} ms  p90 {p90}  '
+            f'{summary["megapixels_per_second"]:8.2f} MP/s  peak rss {summary["peak_rss"] / 2 ** 20:7.1f} MiB'
+        )
+
+    results = run_benchmarks(config, progress=progress)
+    save_results(arguments.output, results, config)
+
+    if arguments.update_baseline:
+        os.makedirs(os.path.dirname(arguments.baseline), exist_ok=True)
+        save_results(arguments.baseline, results, config)
+        print(f'Baseline saved to {arguments.baseline}')
+        return 0
+
+    if not os.path.exists(arguments.baseline):
+        print(f'No baseline at {arguments.baseline}, run with --update-baseline to create one')
+        return 0
+
+    comparison = compare_to_baseline(results, load_results(arguments.baseline), arguments.threshold)
+    print(json.dumps(
+        {key: comparison[key] for key in ('passed', 'host_speed', 'regressions', 'new_cases', 'missing_cases')}, indent=2
+    ))
+
+    return 0 if comparison['passed'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import functools
+
+from src.batch import create_generator
+from src.service import GenerationService, serve
+
+
+async def run(arguments):
+    generator_factory = functools.partial(
+        create_generator,
+        segmenter=arguments.segmenter,
+        number_of_colors=arguments.colors,
+        merge_small_regions=arguments.merge_small_regions,
+        compact=arguments.compact,
+        preprocessing=tuple(arguments.preprocess)
+    )
+
+    async with GenerationService(
+            generator_factory,
+            workers=arguments.workers,
+            threads_per_worker=arguments.threads,
+            queue_size=arguments.queue_size,
+            batch_window=arguments.batch_window
+    ) as service:
+        server = await serve(service, arguments.host, arguments.port)
+        print(f'Serving POST /generate on {arguments.host}:{server.sockets[0].getsockname()[1]}')
+
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the paint by numbers generator over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='BLAS / OpenMP / OpenCV threads per worker')
+    parser.add_argument('--queue-size', type=int, default=16, help='waiting requests before 503 is answered')
+    parser.add_argument('--batch-window', type=float, default=0.01, help='seconds small requests are collected')
+    parser.add_argument('--colors', type=int, default=20)
+    parser.add_argument('--segmenter', choices=('kmeans', 'octree', 'median_cut', 'superpixel'), default='kmeans')
+    parser.add_argument('--merge-small-regions', action='store_true')
+    parser.add_argument('--compact', action='store_true', help='narrow dtypes for lower peak memory')
+    parser.add_argument(
+        '--preprocess', nargs='*', default=(), metavar='STEP[:VALUE]',
+        help='e.g. downscale:2 bilateral label_median:5, steps: downscale, gaussian_blur, bilateral, mean_shift, guided'
+    )
+    arguments = parser.parse_args()
+
+    try:
+        asyncio.run(run(arguments))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
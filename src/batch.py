@@ -0,0 +1,283 @@
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List
+
+# Heavy modules (numpy, sklearn, cv2) are only imported inside the worker processes, after the thread
+# limits are in place, so the scheduling side stays light.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+# environment variables read by the OpenMP / BLAS runtimes when they are loaded
+THREAD_LIMIT_VARIABLES = (
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS'
+)
+
+# written into the output folder of an image once all of its outputs are saved
+COMPLETION_REPORT = 'timing.json'
+
+
+class BatchJob:
+    def __init__(self, image_path: str, output_folder: str):
+        self.image_path: str = image_path
+        self.output_folder: str = output_folder
+
+
+class BatchResult:
+    def __init__(
+            self, image_path, output_folder, status, wall_time=0.0, cpu_time=0.0, worker=None, error=None, stages=None
+    ):
+        self.image_path: str = image_path
+        self.output_folder: str = output_folder
+        # 'done', 'skipped' or 'failed'
+        self.status: str = status
+        self.wall_time: float = wall_time
+        self.cpu_time: float = cpu_time
+        # process id of the worker that generated the image
+        self.worker: int = worker
+        # traceback of the failure
+        self.error: str = error
+        # stage report of the generator, see StageTimer.report
+        self.stages: dict = stages
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def create_generator(
+        segmenter: str = 'kmeans',
+        number_of_colors: int = 20,
+        merge_small_regions: bool = False,
+        tiled: bool = False,
+        vector_formats=(),
+        compact: bool = False,
+        preprocessing=(),
+        render_scale: int = 1,
+        line_width: float = None,
+        antialias: bool = False,
+        dpi: int = None
+):
+    # preprocessing specs, see parse_preprocessor, smoothing filters in there replace the blur of the segmenters
+    preprocessor = None
+    blur_size = 5
+    if preprocessing:
+        from src.segmentation.preprocessing import parse_preprocessor
+        preprocessor = parse_preprocessor(preprocessing)
+        if preprocessor.smoothing:
+            blur_size = None
+
+    if segmenter == 'kmeans':
+        from src.segmentation.k_means import KMeansSegmenter
+        # arrays passed to generate() are read-only views, only images the generator decodes are blurred in place
+        image_segmenter = KMeansSegmenter(
+            number_of_colors, compact=compact, blur_in_place=compact, blur_size=blur_size
+        )
+    elif segmenter == 'octree':
+        from src.segmentation.octree import OctreeSegmenter
+        image_segmenter = OctreeSegmenter(number_of_colors, blur_size=blur_size)
+    elif segmenter == 'median_cut':
+        from src.segmentation.median_cut import MedianCutSegmenter
+        image_segmenter = MedianCutSegmenter(number_of_colors, blur_size=blur_size)
+    elif segmenter == 'superpixel':
+        from src.segmentation.superpixel import SuperpixelSegmenter
+        image_segmenter = SuperpixelSegmenter(number_of_colors)
+    else:
+        raise ValueError(f'Unknown segmenter {segmenter!r}')
+
+    if tiled:
+        if preprocessor is not None:
+            raise ValueError('The tiled generator does not support preprocessing')
+        if merge_small_regions:
+            raise ValueError('The tiled generator drops small regions, it cannot merge them')
+        if vector_formats:
+            raise ValueError('The tiled generator does not write vector outputs')
+        if compact:
+            raise ValueError('The tiled generator has no compact mode, its memory is bounded by the tile size')
+        if render_scale != 1 or line_width is not None or antialias or dpi is not None:
+            raise ValueError('The tiled generator renders at the image resolution only')
+
+        from src.tiled_paint_by_numbers_image_generator import TiledPaintByNumbersImageGenerator
+        return TiledPaintByNumbersImageGenerator(image_segmenter)
+
+    from src.paint_by_numbers_image_generator import PaintByNumbersImageGenerator
+    from src.rendering import Renderer
+    from src.vector_output.pdf import PdfWriter
+    from src.vector_output.svg import SvgWriter
+
+    vector_writers = {'svg': SvgWriter, 'pdf': PdfWriter}
+    return PaintByNumbersImageGenerator(
+        image_segmenter,
+        merge_small_regions=merge_small_regions,
+        vector_writers=[vector_writers[vector_format]() for vector_format in vector_formats],
+        compact=compact,
+        preprocessor=preprocessor,
+        renderer=Renderer(scale=render_scale, line_width=line_width, antialias=antialias, dpi=dpi)
+    )
+
+
+def collect_images(source: str) -> List[str]:
+    # all images of a directory, or the paths listed in a manifest file (one per line, relative to the manifest)
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+
+    manifest_directory = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+
+    return [
+        os.path.join(manifest_directory, line)
+        for line in lines
+        if line and not line.startswith('#')
+    ]
+
+
+def plan_jobs(image_paths: List[str], output_root: str) -> List[BatchJob]:
+    # every image gets a folder named after it in the output root
+    jobs = []
+    output_folders = {}
+
+    for image_path in image_paths:
+        name = os.path.splitext(os.path.basename(image_path))[0]
+
+        if name in output_folders:
+            raise ValueError(f'{image_path} and {output_folders[name]} would share the output folder {name!r}')
+
+        output_folders[name] = image_path
+        jobs.append(BatchJob(image_path, os.path.join(output_root, name)))
+
+    return jobs
+
+
+def is_completed(output_folder: str) -> bool:
+    return os.path.exists(os.path.join(output_folder, COMPLETION_REPORT))
+
+
+def limit_threads(threads: int):
+    # for runtimes loaded later, then for the ones that are already loaded
+    for variable in THREAD_LIMIT_VARIABLES:
+        os.environ[variable] = str(threads)
+
+    import cv2
+    from threadpoolctl import threadpool_limits
+
+    cv2.setNumThreads(threads)
+    threadpool_limits(limits=threads)
+
+
+def _run_job(generator_factory: Callable, job: BatchJob) -> BatchResult:
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    try:
+        # a new generator per image, nothing is carried over between the images of a worker
+        generator = generator_factory()
+        stages = generator.generate_image(job.image_path, job.output_folder)
+    except Exception:
+        return BatchResult(
+            job.image_path, job.output_folder, 'failed',
+            wall_time=time.perf_counter() - wall_start,
+            cpu_time=time.process_time() - cpu_start,
+            worker=os.getpid(),
+            error=traceback.format_exc()
+        )
+
+    result = BatchResult(
+        job.image_path, job.output_folder, 'done',
+        wall_time=time.perf_counter() - wall_start,
+        cpu_time=time.process_time() - cpu_start,
+        worker=os.getpid(),
+        stages=stages
+    )
+
+    with open(os.path.join(job.output_folder, COMPLETION_REPORT), 'w') as f:
+        json.dump(result.to_dict(), f, indent=2)
+
+    return result
+
+
+def run_batch(
+        jobs: List[BatchJob],
+        generator_factory: Callable,
+        workers: int = None,
+        threads_per_worker: int = 1,
+        report_path: str = None,
+        skip_completed: bool = True,
+        max_tasks_per_child: int = None
+) -> List[BatchResult]:
+    # Generates the images on a pool of worker processes. Every worker is limited to threads_per_worker
+    # threads, so workers * threads_per_worker should not exceed the number of cores. The results are
+    # appended to the report (JSON lines) as soon as they arrive, in completion order.
+    if workers is None:
+        workers = max((os.cpu_count() or 1) // threads_per_worker, 1)
+
+    results = []
+    pending = []
+
+    for job in jobs:
+        if skip_completed and is_completed(job.output_folder):
+            results.append(BatchResult(job.image_path, job.output_folder, 'skipped'))
+        else:
+            pending.append(job)
+
+    report = open(report_path, 'a') if report_path is not None else None
+
+    def record(result: BatchResult):
+        results.append(result)
+
+        if report is not None:
+            report.write(json.dumps(result.to_dict()) + '\n')
+            report.flush()
+
+    try:
+        for result in results:
+            if report is not None:
+                report.write(json.dumps(result.to_dict()) + '\n')
+
+        if not pending:
+            return results
+
+        # spawned workers do not inherit loaded BLAS / OpenMP runtimes from this process
+        with ProcessPoolExecutor(
+                max_workers=min(workers, len(pending)),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=limit_threads,
+                initargs=(threads_per_worker,),
+                max_tasks_per_child=max_tasks_per_child
+        ) as executor:
+            futures = {executor.submit(_run_job, generator_factory, job): job for job in pending}
+
+            for future in as_completed(futures):
+                job = futures[future]
+
+                try:
+                    record(future.result())
+                except Exception:
+                    # the worker died (e.g. out of memory), the pool reports it for every unfinished job
+                    record(BatchResult(job.image_path, job.output_folder, 'failed', error=traceback.format_exc()))
+    finally:
+        if report is not None:
+            report.close()
+
+    return results
+
+
+def summarize(results: List[BatchResult], wall_time: float) -> dict:
+    done = [result for result in results if result.status == 'done']
+
+    return {
+        'images': len(results),
+        'done': len(done),
+        'skipped': sum(result.status == 'skipped' for result in results),
+        'failed': sum(result.status == 'failed' for result in results),
+        'wall_time': wall_time,
+        'images_per_second': len(done) / wall_time if wall_time > 0 else 0.0,
+        'mean_image_wall_time': sum(result.wall_time for result in done) / len(done) if done else 0.0,
+        'mean_image_cpu_time': sum(result.cpu_time for result in done) / len(done) if done else 0.0,
+    }
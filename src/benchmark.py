@@ -0,0 +1,318 @@
+import json
+import os
+import tempfile
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from src.instrumentation import StageTimer
+from src.label_placement.distance_transform import DistanceTransformLabelPlacer
+from src.paint_by_numbers_image_generator import PaintByNumbersImageGenerator
+from src.rendering import Renderer
+from src.sections import RegionDetector
+from src.segmentation.k_means import KMeansSegmenter
+from src.segmentation.preprocessing import STEPS, median_filter_labels
+from src.utility import load_image
+
+REFERENCE_IMAGE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test-images-mnz')
+
+# fixed numpy workload measured with every run. Latencies are compared to the baseline relative to it, so a
+# faster or slower host does not show up as a change of every case
+CALIBRATION_CASE = 'calibration/sort'
+
+# runs needed before a tail percentile (p90) is reported, with fewer it is just the slowest run
+MIN_RUNS_FOR_TAIL = 10
+
+
+class BenchmarkConfig:
+    def __init__(
+            self,
+            image_folder: str = REFERENCE_IMAGE_FOLDER,
+            images: List[str] = None,
+            scales=(0.25, 0.5, 1.0),
+            palette_sizes=(8, 20),
+            repeats: int = 3,
+            mask_size: int = 1024,
+            end_to_end: bool = True,
+            preprocessing_steps=('gaussian_blur', 'bilateral', 'guided', 'mean_shift'),
+            label_median_size: int = 5,
+            compact: bool = True
+    ):
+        self.image_folder: str = image_folder
+        # file names in image_folder, all images if None
+        self.images: List[str] = images
+        # the images are resized by these factors before every stage
+        self.scales = tuple(scales)
+        self.palette_sizes = tuple(palette_sizes)
+        # measured runs per case, after one warm up run
+        self.repeats: int = repeats
+        # side length of the synthetic RegionDetector masks
+        self.mask_size: int = mask_size
+        self.end_to_end: bool = end_to_end
+        # names of the preprocessing steps measured per image and scale, with their default parameters
+        self.preprocessing_steps = tuple(preprocessing_steps)
+        # median of the label maps measured per case, None to skip it
+        self.label_median_size: int = label_median_size
+        # the segmentation and the end to end run once more in compact mode, for its peak memory
+        self.compact: bool = compact
+
+    @classmethod
+    def quick(cls) -> 'BenchmarkConfig':
+        return cls(
+            images=['two_adventureres.jpg', 'cat.jpg', 'new_york_city.jpg'],
+            scales=(0.25, 0.5),
+            palette_sizes=(8,),
+            repeats=3,
+            mask_size=512
+        )
+
+
+class BenchmarkResult:
+    def __init__(self, name: str, pixels: int, latencies: List[float], peak_rss: int):
+        self.name: str = name
+        self.pixels: int = pixels
+        self.latencies: List[float] = latencies
+        self.peak_rss: int = peak_rss
+
+    def percentile(self, q) -> float:
+        return float(np.percentile(self.latencies, q))
+
+    @property
+    def p90(self):
+        # None with fewer than MIN_RUNS_FOR_TAIL runs
+        return self.percentile(90) if len(self.latencies) >= MIN_RUNS_FOR_TAIL else None
+
+    @property
+    def megapixels_per_second(self) -> float:
+        return self.pixels / 1e6 / self.percentile(50)
+
+    def to_dict(self) -> dict:
+        return {
+            'pixels': self.pixels,
+            'p50': self.percentile(50),
+            'p90': self.p90,
+            'megapixels_per_second': self.megapixels_per_second,
+            'peak_rss': self.peak_rss,
+            'latencies': list(self.latencies),
+        }
+
+
+def worst_case_masks(size: int) -> Dict[str, np.ndarray]:
+    # extremes for RegionDetector.get_regions: one region with the most runs possible, the most regions possible
+    giant_region = np.ones((size, size), dtype=bool)
+
+    # a comb: every second column is cut, the region is still connected through the first row
+    comb = np.ones((size, size), dtype=bool)
+    comb[1:, 1::2] = False
+
+    # 4-connected single pixel regions
+    checkerboard = (np.indices((size, size)).sum(axis=0) % 2).astype(bool)
+
+    # tiny 2x2 blocks, many regions with several runs each
+    blocks = np.kron(checkerboard[:size // 2, :size // 2], np.ones((2, 2), dtype=bool))
+
+    return {
+        'giant_region': giant_region,
+        'comb': comb,
+        'checkerboard': checkerboard,
+        'blocks_2x2': blocks,
+    }
+
+
+def measure(name: str, function: Callable, pixels: int, repeats: int) -> BenchmarkResult:
+    # one warm up run, then the latency and the peak RSS of every measured run
+    function()
+
+    timer = StageTimer()
+    for _ in range(repeats):
+        with timer.stage(name):
+            function()
+
+    records = timer.records
+    return BenchmarkResult(
+        name,
+        pixels,
+        [record.wall_time for record in records],
+        max(record.peak_rss for record in records)
+    )
+
+
+def _scaled(image: np.ndarray, scale: float) -> np.ndarray:
+    if scale == 1.0:
+        return image
+
+    height, width = image.shape[:2]
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def _image_benchmarks(config: BenchmarkConfig, image_name: str, report: Callable):
+    image = load_image(os.path.join(config.image_folder, image_name))
+    generator = PaintByNumbersImageGenerator(image_segmenter=None)
+    label_placer = DistanceTransformLabelPlacer()
+    renderer = Renderer()
+
+    for scale in config.scales:
+        scaled_image = _scaled(image, scale)
+        pixels = scaled_image.shape[0] * scaled_image.shape[1]
+
+        for step_name in config.preprocessing_steps:
+            step = STEPS[step_name]()
+            report(measure(
+                f'preprocess/{step_name}/{image_name}@{scale}', lambda: step.apply(scaled_image), pixels, config.repeats
+            ))
+
+        for number_of_colors in config.palette_sizes:
+            case = f'{image_name}@{scale}/k={number_of_colors}'
+            segmenter = KMeansSegmenter(number_of_colors)
+
+            # the later stages run on the output of the earlier ones
+            segmentation_result = segmenter.segment(scaled_image)
+            segment_labels = segmentation_result.segment_labels
+            color_regions, palette_indexes = generator._detect_regions_by_color(segment_labels)
+            labeled_regions = generator._filter_small_regions(color_regions, min_size=150)
+            region_numbers = {region_label: 1 for region_label in range(1, int(labeled_regions.max()) + 1)}
+
+            report(measure(
+                f'segment/{case}', lambda: segmenter.segment(scaled_image), pixels, config.repeats
+            ))
+            if config.compact:
+                compact_segmenter = KMeansSegmenter(number_of_colors, compact=True)
+                report(measure(
+                    f'segment_compact/{case}', lambda: compact_segmenter.segment(scaled_image), pixels, config.repeats
+                ))
+            if config.label_median_size:
+                report(measure(
+                    f'label_median/{case}',
+                    lambda: median_filter_labels(segment_labels, config.label_median_size, segmentation_result.colors),
+                    pixels, config.repeats
+                ))
+            report(measure(
+                f'detect_regions_by_color/{case}',
+                lambda: generator._detect_regions_by_color(segment_labels), pixels, config.repeats
+            ))
+            report(measure(
+                f'filter_small_regions/{case}',
+                lambda: generator._filter_small_regions(color_regions, min_size=150), pixels, config.repeats
+            ))
+            report(measure(
+                f'merge_small_regions/{case}',
+                lambda: generator._filter_small_regions(color_regions, min_size=150, merge=True),
+                pixels, config.repeats
+            ))
+            report(measure(
+                f'place_labels/{case}',
+                lambda: label_placer.place_labels(labeled_regions, region_numbers), pixels, config.repeats
+            ))
+            placements = label_placer.place_labels(labeled_regions, region_numbers)
+            report(measure(
+                f'label_layer/{case}',
+                lambda: renderer.label_layer(placements, labeled_regions.shape), pixels, config.repeats
+            ))
+
+            if config.end_to_end:
+                report(_measure_end_to_end(f'generate_image/{case}', scaled_image, number_of_colors, config.repeats))
+                if config.compact:
+                    report(_measure_end_to_end(
+                        f'generate_image_compact/{case}', scaled_image, number_of_colors, config.repeats, compact=True
+                    ))
+
+
+def _measure_end_to_end(
+        name: str, image: np.ndarray, number_of_colors: int, repeats: int, compact: bool = False
+) -> BenchmarkResult:
+    with tempfile.TemporaryDirectory() as directory:
+        image_path = os.path.join(directory, 'input.png')
+        cv2.imwrite(image_path, image[:, :, ::-1])
+
+        def generate():
+            # like create_generator(compact=True), the image loaded by generate_image is blurred in place
+            generator = PaintByNumbersImageGenerator(
+                KMeansSegmenter(number_of_colors, compact=compact, blur_in_place=compact), compact=compact
+            )
+            generator.generate_image(image_path, os.path.join(directory, 'output'))
+
+        return measure(name, generate, image.shape[0] * image.shape[1], repeats)
+
+
+def run_benchmarks(config: BenchmarkConfig, progress: Callable = None) -> Dict[str, dict]:
+    results = {}
+
+    def report(result: BenchmarkResult):
+        results[result.name] = result.to_dict()
+        if progress is not None:
+            progress(result)
+
+    calibration_data = np.random.default_rng(0).random(2 ** 21)
+    report(measure(CALIBRATION_CASE, lambda: np.sort(calibration_data), calibration_data.size, config.repeats))
+
+    region_detector = RegionDetector()
+    for mask_name, mask in worst_case_masks(config.mask_size).items():
+        report(measure(
+            f'get_regions/{mask_name}@{config.mask_size}',
+            lambda: region_detector.get_regions(mask), mask.size, config.repeats
+        ))
+
+    image_names = config.images
+    if image_names is None:
+        image_names = sorted(
+            name for name in os.listdir(config.image_folder)
+            if name.lower().endswith(('.jpg', '.jpeg', '.png'))
+        )
+
+    for image_name in image_names:
+        _image_benchmarks(config, image_name, report)
+
+    return results
+
+
+def compare_to_baseline(
+        results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = 0.25, reference_case: str = CALIBRATION_CASE
+) -> dict:
+    # A case regresses when its median latency or its peak RSS is more than threshold above the baseline.
+    # The latencies are scaled by how much faster or slower reference_case ran than in the baseline (if both
+    # have it), which takes out most of the difference between hosts. The baseline is still best regenerated
+    # (run_benchmarks.py --update-baseline) on the machine that is compared against it, peak RSS and the
+    # relative speed of the stages differ between hosts too.
+    # Cases only in one of both are listed, but do not fail the comparison.
+    regressions = {}
+    changes = {}
+
+    host_speed = 1.0
+    if reference_case in results and reference_case in baseline:
+        host_speed = results[reference_case]['p50'] / baseline[reference_case]['p50']
+
+    for name, result in results.items():
+        if name not in baseline or name == reference_case:
+            continue
+
+        reference = baseline[name]
+        latency_change = result['p50'] / (reference['p50'] * host_speed) - 1
+        memory_change = result['peak_rss'] / reference['peak_rss'] - 1
+        changes[name] = {'p50': latency_change, 'peak_rss': memory_change}
+
+        if latency_change > threshold or memory_change > threshold:
+            regressions[name] = changes[name]
+
+    return {
+        'passed': not regressions,
+        'threshold': threshold,
+        'host_speed': host_speed,
+        'regressions': regressions,
+        'changes': changes,
+        'new_cases': sorted(set(results) - set(baseline)),
+        'missing_cases': sorted(set(baseline) - set(results)),
+    }
+
+
+def load_results(path: str) -> Dict[str, dict]:
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def save_results(path: str, results: Dict[str, dict], config: BenchmarkConfig):
+    with open(path, 'w') as f:
+        # the folder name only, the results are compared across checkouts
+        config = dict(vars(config), image_folder=os.path.basename(config.image_folder))
+        json.dump({'config': config, 'results': results}, f, indent=2)
@@ -0,0 +1,255 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+def _current_rss() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, AttributeError, ValueError):
+        return _peak_rss()
+
+
+def _peak_rss() -> int:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # process lifetime peak, kilobytes on linux and bytes on macOS, not available on windows
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _reset_peak_rss():
+    # linux only, without it the peak of a stage is the process peak up to the end of the stage
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+# the peak RSS is process wide, a timer only resets it while no other timer has a stage running. The peaks of
+# stages that overlap with the stages of other timers (e.g. concurrent generate() calls) are the process peaks
+# since the last reset, they include the memory of the other runs.
+_peak_rss_lock = threading.Lock()
+_running_timers = 0
+
+
+class StageRecord:
+    def __init__(self, name: str, depth: int = 0):
+        self.name: str = name
+        # nesting level, stages inside stages have depth > 0
+        self.depth: int = depth
+        self.wall_time: float = 0.0
+        self.cpu_time: float = 0.0
+        self.rss_before: int = 0
+        self.rss_after: int = 0
+        self.peak_rss: int = 0
+        # peak of the traced (python and numpy) allocations, only with trace_allocations
+        self.peak_allocated: int = None
+        # bytes of the arrays recorded in the stage, by name
+        self.arrays: Dict[str, int] = {}
+
+    @property
+    def allocated_bytes(self) -> int:
+        return sum(self.arrays.values())
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'rss_before': self.rss_before,
+            'rss_after': self.rss_after,
+            'peak_rss': self.peak_rss,
+            'peak_allocated': self.peak_allocated,
+            'allocated_bytes': self.allocated_bytes,
+            'arrays': dict(self.arrays),
+        }
+
+
+class StageHook:
+    # Receives the stage events of a StageTimer, all methods do nothing by default.
+
+    def stage_started(self, name: str):
+        pass
+
+    def stage_finished(self, record: StageRecord):
+        pass
+
+    def progress(self, iterable: Iterable, description: str = None, total: int = None) -> Iterable:
+        return iterable
+
+
+class TqdmHook(StageHook):
+    # Progress bars for the iterations reported to the timer and a line per finished stage.
+
+    def __init__(self, print_stages: bool = True):
+        self._print_stages = print_stages
+
+    def stage_finished(self, record: StageRecord):
+        if self._print_stages:
+            from tqdm import tqdm
+
+            tqdm.write(
+                f'{"  " * record.depth}{record.name}: {record.wall_time:.3f}s wall, {record.cpu_time:.3f}s cpu, '
+                f'peak rss {record.peak_rss / 2 ** 20:.1f} MiB'
+            )
+
+    def progress(self, iterable: Iterable, description: str = None, total: int = None) -> Iterable:
+        from tqdm import tqdm
+
+        return tqdm(iterable, desc=description, total=total)
+
+
+class StageTimer:
+    # Records wall time, CPU time, RSS and the sizes of the recorded arrays for named (nestable) stages:
+    #
+    #     with timer.stage('segment'):
+    #         result = segmenter.segment(image)
+    #         timer.record_array('segment_labels', result.segment_labels)
+    #
+    # trace_allocations additionally measures the peak of the python / numpy allocations with tracemalloc,
+    # which slows the allocations down.
+
+    def __init__(self, hooks: List[StageHook] = None, trace_allocations: bool = False):
+        self._hooks: List[StageHook] = list(hooks or [])
+        self._trace_allocations = trace_allocations
+        self._records: List[StageRecord] = []
+        # stages that are running, innermost last
+        self._active: List[dict] = []
+
+    def clone(self) -> 'StageTimer':
+        # empty timer with the same hooks and settings, for a run that goes on concurrently with this one
+        return StageTimer(self._hooks, self._trace_allocations)
+
+    def add_hook(self, hook: StageHook):
+        self._hooks.append(hook)
+
+    def clear(self):
+        global _running_timers
+
+        with _peak_rss_lock:
+            if self._active:
+                _running_timers -= 1
+            self._records = []
+            self._active = []
+
+    @property
+    def records(self) -> List[StageRecord]:
+        return list(self._records)
+
+    @contextmanager
+    def stage(self, name: str):
+        record = StageRecord(name, depth=len(self._active))
+        self._records.append(record)
+
+        for hook in self._hooks:
+            hook.stage_started(name)
+
+        started_tracing = self._trace_allocations and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+
+        # peaks are reset per stage, the peaks of nested stages are handed up to the enclosing ones
+        frame = {'record': record, 'children_peak_rss': 0, 'children_peak_traced': 0, 'traced_before': 0}
+        if self._trace_allocations:
+            frame['traced_before'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        record.rss_before = _current_rss()
+        self._start_measuring(frame)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        try:
+            yield record
+        finally:
+            record.wall_time = time.perf_counter() - wall_start
+            record.cpu_time = time.process_time() - cpu_start
+            record.rss_after = _current_rss()
+            record.peak_rss = max(_peak_rss(), frame['children_peak_rss'], record.rss_after)
+
+            if self._trace_allocations:
+                traced_peak = max(tracemalloc.get_traced_memory()[1], frame['children_peak_traced'])
+                record.peak_allocated = max(traced_peak - frame['traced_before'], 0)
+                if started_tracing:
+                    tracemalloc.stop()
+
+            self._stop_measuring()
+
+            if self._active:
+                parent = self._active[-1]
+                parent['children_peak_rss'] = max(parent['children_peak_rss'], record.peak_rss)
+                if self._trace_allocations:
+                    parent['children_peak_traced'] = max(parent['children_peak_traced'], traced_peak)
+
+            for hook in self._hooks:
+                hook.stage_finished(record)
+
+    def _start_measuring(self, frame: dict):
+        global _running_timers
+
+        with _peak_rss_lock:
+            if not self._active:
+                _running_timers += 1
+
+            if _running_timers == 1:
+                # the peak so far belongs to the enclosing stage
+                if self._active:
+                    parent = self._active[-1]
+                    parent['children_peak_rss'] = max(parent['children_peak_rss'], _peak_rss())
+                _reset_peak_rss()
+
+            self._active.append(frame)
+
+    def _stop_measuring(self):
+        global _running_timers
+
+        with _peak_rss_lock:
+            self._active.pop()
+            if not self._active:
+                _running_timers -= 1
+
+    def record_array(self, name: str, array):
+        if self._active:
+            self._active[-1]['record'].arrays[name] = int(np.asarray(array).nbytes)
+
+    def progress(self, iterable: Iterable, description: str = None, total: int = None) -> Iterable:
+        for hook in self._hooks:
+            iterable = hook.progress(iterable, description, total)
+        return iterable
+
+    def report(self) -> dict:
+        top_level = [record for record in self._records if record.depth == 0]
+
+        return {
+            'stages': [record.to_dict() for record in self._records],
+            'wall_time': sum(record.wall_time for record in top_level),
+            'cpu_time': sum(record.cpu_time for record in top_level),
+            'peak_rss': max((record.peak_rss for record in self._records), default=0),
+        }
+
+    def dump_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
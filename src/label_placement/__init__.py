@@ -0,0 +1,45 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class LabelPlacement:
+    def __init__(self, region_label, number, position, anchor, font, leader=False, clearance=None):
+        self.region_label: int = region_label
+        self.number = number
+        # top left corner of the text
+        self.position: Tuple[int, int] = position
+        # point inside the region the label belongs to
+        self.anchor: Tuple[int, int] = anchor
+        self.font = font
+        # the label did not fit into its region and is connected to the anchor with a line
+        self.leader: bool = leader
+        # distance from the anchor to the region border, if the placer measured it
+        self.clearance = clearance
+
+
+class LabelPlacer(ABC):
+
+    @abstractmethod
+    def place_labels(self, labeled_regions: np.ndarray, region_numbers: Dict[int, object]) -> List[LabelPlacement]:
+        raise NotImplementedError()
+
+
+def draw_leader(draw, placement: LabelPlacement, fill='black', line_width: int = 1, text_size=None):
+    # connects the anchor with the closest point of the text box of a placement, text_size (width, height)
+    # saves the layout of the text when the caller knows it
+    text_width, text_height = text_size or placement.font.getsize(str(placement.number))
+    x, y = placement.position
+
+    closest_x = min(max(placement.anchor[0], x), x + text_width)
+    closest_y = min(max(placement.anchor[1], y), y + text_height)
+    draw.line((placement.anchor, (closest_x, closest_y)), fill=fill, width=line_width)
+
+
+def draw_label(draw, placement: LabelPlacement, fill='black', line_width: int = 1):
+    # draws the number of a placement with PIL ImageDraw, with its leader line if it has one
+    if placement.leader:
+        draw_leader(draw, placement, fill, line_width)
+
+    draw.text(placement.position, str(placement.number), fill=fill, font=placement.font)
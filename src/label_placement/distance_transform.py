@@ -0,0 +1,185 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import ImageFont
+
+from src.label_placement import LabelPlacer, LabelPlacement
+
+
+def _argmax_per_label(values: np.ndarray, labeled_regions: np.ndarray, number_of_labels: int) -> Tuple[np.ndarray, np.ndarray]:
+    # maximum value and flat index of its first occurrence for every label, ties go to the lowest flat index
+    flat_labels = labeled_regions.ravel()
+    flat_values = values.ravel()
+
+    maxima = np.full(number_of_labels, -np.inf, dtype=flat_values.dtype)
+    np.maximum.at(maxima, flat_labels, flat_values)
+
+    candidates = np.flatnonzero(flat_values == maxima[flat_labels])
+    candidate_labels, first_candidates = np.unique(flat_labels[candidates], return_index=True)
+
+    positions = np.full(number_of_labels, -1, dtype=np.intp)
+    positions[candidate_labels] = candidates[first_candidates]
+
+    return maxima, positions
+
+
+def _integral_image(array: np.ndarray) -> np.ndarray:
+    integral = np.zeros((array.shape[0] + 1, array.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(array, axis=0, dtype=np.int32), axis=1, out=integral[1:, 1:])
+    return integral
+
+
+def _box_sums(integral: np.ndarray, box_height: int, box_width: int) -> np.ndarray:
+    rows, cols = integral.shape
+
+    return (
+            integral[box_height:, box_width:] -
+            integral[:rows - box_height, box_width:] -
+            integral[box_height:, :cols - box_width] +
+            integral[:rows - box_height, :cols - box_width]
+    )
+
+
+class DistanceTransformLabelPlacer(LabelPlacer):
+    # Places every label at the most inscribed point ("pole of inaccessibility") of its region where the full
+    # text box fits. Regions without room get a smaller font and finally a label next to them with a leader line.
+
+    def __init__(
+            self,
+            font_path: str = None,
+            font_size: int = 20,
+            min_font_size: int = 8,
+            font_size_step: int = 4,
+            leader_offset: int = 4
+    ):
+        if font_path:
+            self._fonts = [
+                ImageFont.truetype(font_path, size)
+                for size in range(font_size, min_font_size - 1, -font_size_step)
+            ]
+        else:
+            self._fonts = [ImageFont.load_default()]
+
+        self._leader_offset = leader_offset
+
+    def place_labels(self, labeled_regions: np.ndarray, region_numbers: Dict[int, object]) -> List[LabelPlacement]:
+        labeled_regions = np.asarray(labeled_regions)
+        height, width = labeled_regions.shape
+
+        number_of_labels = int(labeled_regions.max()) + 1
+        region_labels = np.flatnonzero(np.bincount(labeled_regions.ravel(), minlength=number_of_labels))
+        region_labels = region_labels[region_labels != 0]
+
+        texts = {region_label: str(region_numbers.get(region_label, '?')) for region_label in region_labels.tolist()}
+
+        distance = self._distance_to_region_border(labeled_regions)
+        _, poles = _argmax_per_label(distance, labeled_regions, number_of_labels)
+
+        # label changes between horizontal / vertical neighbours, a text box fits where it covers none of them
+        horizontal_changes = _integral_image(labeled_regions[:, 1:] != labeled_regions[:, :-1])
+        vertical_changes = _integral_image(labeled_regions[1:, :] != labeled_regions[:-1, :])
+
+        placements = {}
+        unplaced = region_labels
+
+        for font in self._fonts:
+            if len(unplaced) == 0:
+                break
+
+            text_sizes = {text: font.getsize(text) for text in set(texts.values())}
+
+            # one box per text length, so only a handful of full image passes are needed per font
+            box_sizes = {}
+            for text, (text_width, text_height) in text_sizes.items():
+                box_width, box_height = box_sizes.get(len(text), (0, 0))
+                box_sizes[len(text)] = max(box_width, text_width), max(box_height, text_height)
+
+            unplaced_lengths = np.array([len(texts[region_label]) for region_label in unplaced.tolist()])
+
+            for text_length, (box_width, box_height) in box_sizes.items():
+                group = unplaced[unplaced_lengths == text_length]
+
+                if len(group) == 0:
+                    continue
+
+                fits = self._box_fits(horizontal_changes, vertical_changes, (height, width), box_width, box_height)
+
+                scores, positions = _argmax_per_label(
+                    np.where(fits, distance + 1, np.float32(0)), labeled_regions, number_of_labels
+                )
+
+                for region_label in group[scores[group] > 0].tolist():
+                    cy, cx = divmod(int(positions[region_label]), width)
+                    text_width, text_height = text_sizes[texts[region_label]]
+
+                    placements[region_label] = LabelPlacement(
+                        region_label=region_label,
+                        number=region_numbers.get(region_label, '?'),
+                        position=(cx - text_width // 2, cy - text_height // 2),
+                        anchor=(cx, cy),
+                        font=font,
+                        clearance=float(scores[region_label]) - 1
+                    )
+
+            unplaced = np.array(
+                [region_label for region_label in unplaced.tolist() if region_label not in placements], dtype=np.intp
+            )
+
+        font = self._fonts[-1]
+        for region_label in unplaced.tolist():
+            ay, ax = divmod(int(poles[region_label]), width)
+            text_width, text_height = font.getsize(texts[region_label])
+
+            placements[region_label] = LabelPlacement(
+                region_label=region_label,
+                number=region_numbers.get(region_label, '?'),
+                position=(
+                    min(max(ax + self._leader_offset, 0), max(width - text_width, 0)),
+                    min(max(ay - self._leader_offset - text_height, 0), max(height - text_height, 0))
+                ),
+                anchor=(ax, ay),
+                font=font,
+                leader=True,
+                clearance=float(distance[ay, ax])
+            )
+
+        return [placements[region_label] for region_label in region_labels.tolist()]
+
+    @staticmethod
+    def _distance_to_region_border(labeled_regions: np.ndarray) -> np.ndarray:
+        import cv2
+
+        # pixels on the image border or next to another region count as border
+        interior = np.zeros(labeled_regions.shape, dtype=bool)
+        center = labeled_regions[1:-1, 1:-1]
+        interior[1:-1, 1:-1] = (
+                (center == labeled_regions[:-2, 1:-1]) &
+                (center == labeled_regions[2:, 1:-1]) &
+                (center == labeled_regions[1:-1, :-2]) &
+                (center == labeled_regions[1:-1, 2:])
+        )
+
+        distance = cv2.distanceTransform(interior.view(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+        # the precise transform is not bit-stable between calls, rounding keeps ties (and so the first of
+        # them by flat index) the same from run to run
+        return np.round(distance, 3)
+
+    @staticmethod
+    def _box_fits(horizontal_changes, vertical_changes, shape, box_width: int, box_height: int) -> np.ndarray:
+        # True where a box_width x box_height box centered on the pixel lies inside the image and one region
+        height, width = shape
+        fits = np.zeros(shape, dtype=bool)
+
+        if box_width > width or box_height > height or box_width < 1 or box_height < 1:
+            return fits
+
+        fits[
+            box_height // 2:box_height // 2 + height - box_height + 1,
+            box_width // 2:box_width // 2 + width - box_width + 1
+        ] = (
+                (_box_sums(horizontal_changes, box_height, box_width - 1) == 0) &
+                (_box_sums(vertical_changes, box_height - 1, box_width) == 0)
+        )
+
+        return fits
@@ -0,0 +1,104 @@
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import ImageFont
+from skimage.measure import regionprops
+
+from src.label_placement import LabelPlacer, LabelPlacement
+from src.sections import RegionDetector
+
+
+class RowCenterLabelPlacer(LabelPlacer):
+    # Tries the middle of every region row and takes the first one where the label corners are inside the region.
+
+    def __init__(self, font_path: str = None, font_size: int = 20, progress: Callable = None):
+        # wraps the iteration over the regions, e.g. tqdm or StageTimer.progress, no progress output without it
+        self._progress = progress
+
+        if font_path:
+            self._font = ImageFont.truetype(font_path, font_size)
+        else:
+            self._font = ImageFont.load_default()
+
+    def place_labels(self, labeled_regions: np.ndarray, region_numbers: Dict[int, object]) -> List[LabelPlacement]:
+        placements = []
+
+        # Pro Region einmal durchgehen
+        regions = regionprops(labeled_regions)
+        if self._progress is not None:
+            regions = self._progress(regions)
+
+        for region in regions:
+            # War bereits vorher so im code. Ich nehme an, dass ist der Hintergrund?!
+            if region.label == 0:
+                continue
+
+            number = region_numbers.get(region.label, '?')
+            font_size = self._font.getsize(str(number))
+
+            # Only the bounding box crop of the region is looked at, a full image mask per region
+            # would make this O(regions x pixels).
+            min_row, min_col, _, _ = region.bbox
+            cx, cy = self._find_field_center(region.image, font_size)
+            cx, cy = cx + min_col, cy + min_row
+
+            font_width, font_height = font_size
+
+            placements.append(LabelPlacement(
+                region_label=region.label,
+                number=number,
+                position=(cx - int(font_width / 2), cy - int(font_height / 2)),
+                anchor=(cx, cy),
+                font=self._font
+            ))
+
+        return placements
+
+    def _find_field_center(self, mask: np.ndarray, font_size) -> Tuple[int, int]:
+        image_height = len(mask) - 1
+        image_width = len(mask[0]) - 1
+
+        font_width, font_height = font_size
+
+        def outside_image(index):
+            index_y, index_x = index
+
+            return (
+                    (index_y < 0) or (index_y > image_height) or
+                    (index_x < 0) or (index_x > image_width)
+            )
+
+        region_detector = RegionDetector()
+
+        regions = region_detector.get_regions(mask)
+
+        for region in regions:
+            for middle_pixel in region.get_region_center_middle_positions():
+                current_x, current_y = middle_pixel
+
+                center_index = current_y, current_x
+
+                high_x_index = current_y, (current_x + int(font_width / 2))
+                low_x_index = current_y, (current_x - int(font_width / 2))
+                high_y_index = (current_y + int(font_height / 2)), current_x
+                low_y_index = (current_y - int(font_height / 2)), current_x
+
+                if (
+                        outside_image(center_index) or
+                        (outside_image(high_x_index)) or
+                        (outside_image(low_x_index)) or
+                        (outside_image(high_y_index)) or
+                        (outside_image(low_y_index))
+                ):
+                    continue
+
+                if (
+                        (mask[center_index] == True) and
+                        (mask[high_x_index] == True) and
+                        (mask[low_x_index] == True) and
+                        (mask[high_y_index] == True) and
+                        (mask[low_y_index] == True)
+                ):
+                    return current_x, current_y
+
+        return 0, 0
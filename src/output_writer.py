@@ -0,0 +1,129 @@
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import numpy as np
+from PIL import Image
+
+
+class OutputWriter:
+    # Encodes and writes the outputs of a run on a background thread pool, the pipeline goes on meanwhile.
+    # With an output folder the outputs become files, without one they are kept as in-memory buffers.
+    # close() waits for all pending outputs and raises the first error.
+
+    def __init__(
+            self,
+            output_folder: str = None,
+            max_workers: int = 2,
+            png_compress_level: int = 6,
+            jpeg_quality: int = 75
+    ):
+        self._output_folder = output_folder
+        # zlib level of the PNG outputs, 1 is fastest, 9 the smallest
+        self._png_compress_level = png_compress_level
+        self._jpeg_quality = jpeg_quality
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='output-writer')
+        self._futures: List[Future] = []
+        self._buffers: Dict[str, bytes] = {}
+        self._paths: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        if self._output_folder is not None:
+            os.makedirs(self._output_folder, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def in_memory(self) -> bool:
+        return self._output_folder is None
+
+    @property
+    def buffers(self) -> Dict[str, bytes]:
+        # encoded outputs by name, in memory mode
+        with self._lock:
+            return dict(self._buffers)
+
+    @property
+    def paths(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._paths)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self._output_folder, name) if self._output_folder is not None else name
+
+    def submit(self, name: str, encode: Callable[[], bytes]) -> Future:
+        # encode runs on the pool, it must not depend on objects the caller changes afterwards
+        future = self._executor.submit(self._write, name, encode)
+        self._futures.append(future)
+        return future
+
+    def submit_image(self, name: str, image, image_format: str = None) -> Future:
+        # the format follows the extension of the name if it is not given
+        if image_format is None:
+            image_format = Image.registered_extensions()[os.path.splitext(name)[1].lower()]
+
+        return self.submit(name, lambda: self.encode_image(image, image_format))
+
+    def submit_text(self, name: str, text: str) -> Future:
+        return self.submit(name, lambda: text.encode())
+
+    def encode_image(self, image, image_format: str) -> bytes:
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+
+        image_format = image_format.upper()
+        options = {}
+
+        if image_format == 'PNG':
+            options['compress_level'] = self._png_compress_level
+        elif image_format == 'JPEG':
+            options['quality'] = self._jpeg_quality
+            if image.mode not in ('RGB', 'L', '1'):
+                image = image.convert('RGB')
+
+        # print resolution set by the Renderer
+        if 'dpi' in image.info and image_format in ('PNG', 'JPEG', 'TIFF'):
+            options['dpi'] = image.info['dpi']
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, **options)
+        return buffer.getvalue()
+
+    def _write(self, name: str, encode: Callable[[], bytes]):
+        data = encode()
+
+        if self._output_folder is None:
+            with self._lock:
+                self._buffers[name] = data
+            return
+
+        path = self.path(name)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        with self._lock:
+            self._paths[name] = path
+
+    def wait(self):
+        futures, self._futures = self._futures, []
+        errors = [future.exception() for future in futures]
+        errors = [error for error in errors if error is not None]
+
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
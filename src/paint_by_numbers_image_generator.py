@@ -1,205 +1,496 @@
-import os
-from typing import Tuple
+import functools
+import io
+from typing import Callable, List, Union
 
 import numpy as np
-import skimage
-from PIL import Image, ImageDraw, ImageFont
-from matplotlib import pyplot as plt
-from skimage.measure import regionprops, label
-from tqdm import tqdm
+from PIL import Image
 
-from src.sections import RegionDetector
-from src.segmentation import ImageSegmenter
-from src.utility import load_image, get_color_pallete
+from src.label_placement import LabelPlacer, LabelPlacement
+from src.instrumentation import StageTimer
+from src.output_writer import OutputWriter
+from src.rendering import Renderer, find_boundaries
+from src.label_placement.distance_transform import DistanceTransformLabelPlacer
+from src.segmentation import ImageSegmenter, SegmentationResult
+from src.segmentation.preprocessing import Preprocessor
+from src.vector_output import BoundaryGraph, VectorWriter
+from src.utility import legend_text, load_image, read_only, render_palette
+
+# pixels per chunk of the label map lookups in compact mode. numpy casts a narrow index array to a full size
+# intp copy first, in chunks only one chunk of it exists at a time
+COMPACT_CHUNK_PIXELS = 2 ** 18
+
+
+def _label_counts(labels: np.ndarray, minlength: int = 0, chunk_pixels: int = None) -> np.ndarray:
+    # np.bincount of the label map, in chunks of chunk_pixels for narrow label dtypes
+    flat = labels.ravel()
+    if chunk_pixels is None or flat.dtype == np.intp:
+        return np.bincount(flat, minlength=minlength)
+
+    counts = np.zeros(max(minlength, int(flat.max(initial=0)) + 1), dtype=np.intp)
+    for start in range(0, len(flat), chunk_pixels):
+        counts += np.bincount(flat[start:start + chunk_pixels], minlength=len(counts))
+    return counts
+
+
+def _lookup(table: np.ndarray, labels: np.ndarray, chunk_pixels: int = None) -> np.ndarray:
+    # table[labels], in chunks of chunk_pixels for narrow label dtypes
+    if chunk_pixels is None or labels.dtype == np.intp:
+        return table[labels]
+
+    flat = labels.ravel()
+    looked_up = np.empty(flat.shape + table.shape[1:], dtype=table.dtype)
+    for start in range(0, len(flat), chunk_pixels):
+        looked_up[start:start + chunk_pixels] = table[flat[start:start + chunk_pixels]]
+    return looked_up.reshape(labels.shape + table.shape[1:])
+
+
+class SegmentedImage:
+    # Segmentation and same color regions of an image, the part of a run that min_size does not change.
+
+    def __init__(self, segmentation_result, color_regions, color_region_palette_indexes):
+        self.segmentation_result: SegmentationResult = segmentation_result
+        self.color_regions: np.ndarray = color_regions
+        # palette index of every color region (index 0 is unused)
+        self.color_region_palette_indexes: np.ndarray = color_region_palette_indexes
+
+
+class PaintByNumbersResult:
+    # Everything a run produces, in memory. The images are rendered on first access.
+
+    def __init__(
+            self,
+            labeled_regions,
+            palette,
+            region_palette_indexes,
+            quantized_image,
+            boundaries,
+            placements,
+            color_to_number,
+            stages=None,
+            renderer: Renderer = None
+    ):
+        # region label of every pixel, 0 where small regions were dropped
+        self.labeled_regions: np.ndarray = labeled_regions
+        # uint8 RGB palette, the number of a color is its index + 1
+        self.palette: np.ndarray = palette
+        # palette index of every region label (index 0 is unused)
+        self.region_palette_indexes: np.ndarray = region_palette_indexes
+        self.quantized_image: np.ndarray = quantized_image
+        # True on the pixels outside a region that border it
+        self.boundaries: np.ndarray = boundaries
+        self.placements: List[LabelPlacement] = placements
+        self.color_to_number: dict = color_to_number
+        # stage report of the run, see StageTimer.report
+        self.stages: dict = stages
+        # print resolution and line style of the images
+        self.renderer: Renderer = renderer or Renderer()
+
+        self._colored_image = None
+        self._outline_image = None
+        self._palette_image = None
+
+    @property
+    def region_numbers(self) -> dict:
+        return {
+            region_label: palette_index + 1
+            for region_label, palette_index in enumerate(self.region_palette_indexes.tolist())
+            if region_label != 0
+        }
+
+    @property
+    def region_colors(self) -> dict:
+        return {
+            region_label: tuple(self.palette[palette_index])
+            for region_label, palette_index in enumerate(self.region_palette_indexes.tolist())
+            if region_label != 0
+        }
+
+    @property
+    def colored_image(self) -> Image.Image:
+        if self._colored_image is None:
+            self.render()
+        return self._colored_image
+
+    @property
+    def outline_image(self) -> Image.Image:
+        if self._outline_image is None:
+            self.render()
+        return self._outline_image
+
+    @property
+    def palette_image(self) -> Image.Image:
+        if self._palette_image is None:
+            self._palette_image = render_palette(self.color_to_number)
+        return self._palette_image
+
+    @property
+    def legend(self) -> str:
+        return legend_text(self.color_to_number)
+
+    def render(self):
+        # both images at once, the labels are drawn a single time for them
+        self._colored_image, self._outline_image = self.renderer.render(self)
 
 
 class PaintByNumbersImageGenerator:
-    def __init__(self, image_segmenter: ImageSegmenter):
+    # generate() keeps no state between calls, one generator can be shared by threads. generate_image()
+    # times its runs on the stage_timer of the generator, so concurrent calls of it need one generator each.
+
+    def __init__(
+            self,
+            image_segmenter: ImageSegmenter,
+            label_placer: LabelPlacer = None,
+            merge_small_regions: bool = False,
+            stage_timer: StageTimer = None,
+            vector_writers: List[VectorWriter] = None,
+            simplification_tolerance: float = 0.75,
+            image_format: str = 'png',
+            png_compress_level: int = 6,
+            output_workers: int = 2,
+            min_size: int = 150,
+            compact: bool = False,
+            preprocessor: Preprocessor = None,
+            renderer: Renderer = None
+    ):
         self._image_segmenter = image_segmenter
-        self._labels = []
+        self._label_placer = label_placer
+        # absorb small regions into their neighbours instead of leaving unlabeled holes
+        self._merge_small_regions = merge_small_regions
+        # regions with fewer pixels are dropped or merged
+        self._min_size = min_size
+        # memory-lean mode: the region label maps get the narrowest unsigned dtype for their number of regions,
+        # lookups in them and the boundaries are computed in chunks
+        self._compact = compact
+        self._chunk_pixels = COMPACT_CHUNK_PIXELS if compact else None
+        # filters in front of the segmenter and on its label map, e.g. an edge-preserving smoothing
+        self._preprocessor = preprocessor
+        # print resolution and line style of the colored and the outline image
+        self._renderer = renderer or Renderer()
+
+        if self._label_placer is None:
+            self._label_placer = DistanceTransformLabelPlacer()
+
+        # per stage timing and memory of generate_image, hooks (e.g. TqdmHook) can be added to it
+        self._stage_timer = stage_timer or StageTimer()
+
+        # additional vector outputs (e.g. SvgWriter, PdfWriter) of the outline, written as paint_by_numbers.<extension>
+        self._vector_writers = list(vector_writers or [])
+        # maximum distance in pixels of the simplified borders to the pixel borders
+        self._simplification_tolerance = simplification_tolerance
+
+        # format of the colored output (png, webp, ...), the outputs are encoded on output_workers threads
+        self._image_format = image_format
+        self._png_compress_level = png_compress_level
+        self._output_workers = output_workers
+
+    @property
+    def stage_timer(self) -> StageTimer:
+        return self._stage_timer
+
+    @property
+    def output_image_name(self) -> str:
+        return f'paint_by_numbers_output.{self._image_format}'
+
+    def generate(
+            self,
+            image: Union[np.ndarray, bytes],
+            stage_timer: StageTimer = None,
+            on_partial: Callable[[str, object], None] = None
+    ) -> PaintByNumbersResult:
+        # image is an RGB array or an encoded image file. The run is timed on stage_timer, by default on a
+        # clone of the stage_timer of the generator, and its report is in the stages of the result.
+        # on_partial is called with the intermediate results as soon as they are ready: ('quantized_image',
+        # array), ('boundaries', array) and finally ('placements', result) before the report is added.
+        # An array is left unchanged, only an image decoded here can be blurred in place.
+        timer = stage_timer or self._stage_timer.clone()
+        timer.clear()
+
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            with timer.stage('load_image'):
+                image = load_image(io.BytesIO(image))
+                timer.record_array('image', image)
+        else:
+            image = read_only(image)
+
+        result = self._generate(image, timer, on_partial)
+        result.stages = timer.report()
+
+        return result
+
+    def generate_image(self, image_path: str, output_folder: str = None, output_writer: OutputWriter = None) -> dict:
+        # Writes the outputs into output_folder, or hands them to output_writer (e.g. an in-memory one), which
+        # is then left open for the caller to close. Returns the stage report of the run, see StageTimer.report.
+        timer = self._stage_timer
+        timer.clear()
+
+        owns_output_writer = output_writer is None
+        if owns_output_writer:
+            output_writer = OutputWriter(
+                output_folder, max_workers=self._output_workers, png_compress_level=self._png_compress_level
+            )
+
+        try:
+            with timer.stage('load_image'):
+                image_array = load_image(image_path)
+                timer.record_array('image', image_array)
+
+            result = self._generate(image_array, timer)
+
+            with timer.stage('render'):
+                result.render()
+                final_image = result.colored_image
+                to_draw_image = result.outline_image
 
-    def generate_image(self, image_path: str, output_folder: str):
-        image_array = load_image(image_path)
+            # the outputs are encoded on the writer threads while the rest goes on
+            with timer.stage('submit_outputs'):
+                output_writer.submit_image(self.output_image_name, final_image)
+                output_writer.submit_image('paint.jpg', to_draw_image)
+                output_writer.submit_image('pallete.jpg', result.palette_image)
+                output_writer.submit_text('legend.txt', result.legend)
 
-        os.makedirs(output_folder, exist_ok=True)
+            if self._vector_writers:
+                with timer.stage('vector_outputs'):
+                    self._submit_vector_outputs(result, output_writer, timer)
+        finally:
+            # also when the run fails, so the writer threads and the queued outputs do not leak
+            if owns_output_writer:
+                with timer.stage('wait_for_outputs'):
+                    output_writer.close()
 
-        image_array = load_image(image_path)
+        if owns_output_writer and not output_writer.in_memory:
+            print(f"Paint-by-numbers image saved to {output_writer.path(self.output_image_name)}")
+            print(f"Legend saved to {output_writer.path('legend.txt')}")
 
-        segmentation_result = self._image_segmenter.segment(image_array)
+        return timer.report()
 
-        labeled_regions = segmentation_result.quantized_image
-        labeled_regions = self._detect_regions_by_color(labeled_regions)
-        labeled_regions = self._filter_small_regions(labeled_regions, min_size=150)  # tweak size
+    def _generate(self, image_array: np.ndarray, timer: StageTimer, on_partial=None) -> PaintByNumbersResult:
+        return self.build_result(self.segment(image_array, timer, on_partial), timer, on_partial)
 
-        color_to_number = self._assign_numbers(segmentation_result.colors)
+    def segment(
+            self,
+            image_array: np.ndarray,
+            stage_timer: StageTimer = None,
+            on_partial: Callable[[str, object], None] = None,
+            image_segmenter: ImageSegmenter = None,
+            preprocessor: Preprocessor = None
+    ) -> SegmentedImage:
+        # first half of generate, everything that does not depend on min_size
+        timer = stage_timer or self._stage_timer.clone()
+        image_segmenter = image_segmenter or self._image_segmenter
+        preprocessor = preprocessor or self._preprocessor
+
+        with timer.stage('segment'):
+            if preprocessor is not None:
+                segmentation_result = preprocessor.segment(image_segmenter, image_array, timer)
+            else:
+                segmentation_result = image_segmenter.segment(image_array)
+            timer.record_array('segment_labels', segmentation_result.segment_labels)
+            timer.record_array('quantized_image', segmentation_result.quantized_image)
+
+        # a preview, the merge of small regions can still change the colors of some pixels
+        if on_partial is not None:
+            on_partial('quantized_image', segmentation_result.quantized_image)
+
+        with timer.stage('detect_regions_by_color'):
+            color_regions, color_region_palette_indexes = self._detect_regions_by_color(
+                segmentation_result.segment_labels
+            )
+            timer.record_array('color_regions', color_regions)
+
+        return SegmentedImage(segmentation_result, color_regions, color_region_palette_indexes)
+
+    def build_result(
+            self,
+            segmented_image: SegmentedImage,
+            stage_timer: StageTimer = None,
+            on_partial: Callable[[str, object], None] = None,
+            min_size: int = None
+    ) -> PaintByNumbersResult:
+        # second half of generate, min_size overrides the one of the generator
+        timer = stage_timer or self._stage_timer.clone()
+        if on_partial is None:
+            on_partial = lambda name, value: None
+        if min_size is None:
+            min_size = self._min_size
+
+        segmentation_result = segmented_image.segmentation_result
+        color_regions = segmented_image.color_regions
+
+        palette = np.asarray(segmentation_result.colors).astype('uint8')
+        quantized_image = segmentation_result.quantized_image
+
+        with timer.stage('filter_small_regions'):
+            labeled_regions = self._filter_small_regions(
+                color_regions,
+                min_size=min_size,
+                merge=self._merge_small_regions
+            )
+            region_palette_indexes = self._filtered_region_palette_indexes(
+                color_regions, segmented_image.color_region_palette_indexes, labeled_regions
+            )
+            timer.record_array('labeled_regions', labeled_regions)
+
+            if self._merge_small_regions:
+                # merged regions take the color of the largest color region they absorbed
+                quantized_image = _lookup(palette[region_palette_indexes], labeled_regions, self._chunk_pixels)
+                timer.record_array('quantized_image', quantized_image)
+
+        with timer.stage('find_boundaries'):
+            band_rows = None
+            if self._chunk_pixels is not None:
+                band_rows = max(self._chunk_pixels // labeled_regions.shape[1], 1)
+            boundaries = find_boundaries(labeled_regions, band_rows=band_rows)
+            timer.record_array('boundaries', boundaries)
+
+        on_partial('boundaries', boundaries)
 
-        boundaries = skimage.segmentation.find_boundaries(
+        result = PaintByNumbersResult(
             labeled_regions,
-            mode='outer'
-            #mode = 'subpixel'
+            palette,
+            region_palette_indexes,
+            quantized_image,
+            boundaries,
+            placements=[],
+            color_to_number=self._assign_numbers(segmentation_result.colors),
+            renderer=self._renderer
         )
 
-        boundaries = ~boundaries
+        # numbers follow the palette order, see _assign_numbers
+        with timer.stage('place_labels'):
+            result.placements = self._label_placer.place_labels(labeled_regions, result.region_numbers)
 
-        final_image = self._overlay_numbers(segmentation_result.quantized_image, labeled_regions, color_to_number)
-        to_draw_image = Image.fromarray(boundaries)
-        draw = ImageDraw.Draw(to_draw_image)
-        font = ImageFont.load_default()
+        on_partial('placements', result)
 
-        for number, position in self._labels:
-            draw.text(position, str(number), fill='black', font=font)
+        return result
 
-        # Save image
-        output_image_path = os.path.join(output_folder, "paint_by_numbers_output.png")
-        final_image.save(output_image_path)
-        print(f"Paint-by-numbers image saved to {output_image_path}")
+    def _submit_vector_outputs(self, result: PaintByNumbersResult, output_writer: OutputWriter, timer: StageTimer):
+        # the boundary graph is extracted and simplified once for all writers
+        with timer.stage('extract_boundaries'):
+            boundary_graph = BoundaryGraph.from_labels(result.labeled_regions).simplified(
+                self._simplification_tolerance
+            )
 
-        to_draw_image.save(f'{output_folder}/paint.jpg')
+        for vector_writer in self._vector_writers:
+            output_writer.submit(
+                f'paint_by_numbers.{vector_writer.extension}',
+                functools.partial(vector_writer.encode, boundary_graph, result.region_colors, result.placements)
+            )
 
-        fig, ax = get_color_pallete(color_to_number)
-        fig.savefig(f'{output_folder}/pallete.jpg')
+    def _detect_regions_by_color(self, segment_labels):
+        # Same color connected components of the palette index map in a single labeling pass.
+        # Returns the component labels and the palette index of every component (index 0 is unused).
+        from skimage.measure import label
 
-        # Save legend
-        self._save_legend(color_to_number, output_folder)
+        segment_labels = np.asarray(segment_labels)
 
-    def _detect_regions_by_color(self, quantized_image):
-        h, w, _ = quantized_image.shape
-        labeled_image = np.zeros((h, w), dtype=int)
-        current_label = 1
+        # every pixel is foreground, the background value must not occur (unsigned labels are not widened for it)
+        background = -1
+        if segment_labels.dtype.kind == 'u':
+            background = np.iinfo(segment_labels.dtype).max
+            if segment_labels.max(initial=0) == background:
+                segment_labels = segment_labels.astype(np.int64)
+                background = -1
 
-        unique_colors = np.unique(quantized_image.reshape(-1, 3), axis=0)
-        for color in unique_colors:
-            mask = np.all(quantized_image == color, axis=-1)
-            labeled_mask = label(mask, connectivity=1)
-            labeled_mask[labeled_mask > 0] += current_label - 1
-            labeled_image += labeled_mask
-            current_label = labeled_image.max() + 1
+        labeled_image, number_of_regions = label(
+            segment_labels, background=background, connectivity=1, return_num=True
+        )
+        if self._compact:
+            labeled_image = labeled_image.astype(np.min_scalar_type(number_of_regions))
 
-        return labeled_image
+        palette_indexes = np.zeros(number_of_regions + 1, dtype=segment_labels.dtype)
+        palette_indexes[labeled_image.ravel()] = segment_labels.ravel()
 
-    def _find_field_center(self, mask: np.ndarray, font_size) -> Tuple[int, int]:
-        image_height = len(mask) - 1
-        image_width = len(mask[0]) - 1
+        return labeled_image, palette_indexes
 
-        padding = 5
+    def _filter_small_regions(self, labeled_image, min_size=100, merge=False):
+        if merge:
+            labeled_image = self._merge_regions_into_neighbors(labeled_image, min_size)
 
-        font_width, font_height = font_size
+        # relabel with one lookup table: kept regions get consecutive labels, the rest becomes 0
+        areas = _label_counts(labeled_image, chunk_pixels=self._chunk_pixels)
+        keep = areas > 0 if merge else areas >= min_size
+        keep[0] = False
 
-        font_width = font_width
-        font_height = font_height
+        number_kept = np.count_nonzero(keep)
+        lookup = np.zeros(len(areas), dtype=np.min_scalar_type(number_kept) if self._compact else labeled_image.dtype)
+        lookup[keep] = np.arange(1, number_kept + 1)
 
-        def outside_image(index):
-            index_y, index_x = index
+        return _lookup(lookup, labeled_image, self._chunk_pixels)
 
-            return (
-                    (index_y < 0) or (index_y > image_height) or
-                    (index_x < 0) or (index_x > image_width)
-            )
+    def _region_adjacency(self, labeled_image, number_of_labels):
+        # (region, neighbour, shared border length) for every pair of 4-adjacent regions, both directions
+        horizontal = labeled_image[:, :-1] != labeled_image[:, 1:]
+        vertical = labeled_image[:-1, :] != labeled_image[1:, :]
 
-        region_detector = RegionDetector()
-
-        regions = region_detector.get_regions(mask)
-
-        for region in regions:
-            for middle_pixel in region.get_region_center_middle_positions():
-                current_x, current_y = middle_pixel
-
-                center_index = current_y, current_x
-
-                high_x_index = current_y, (current_x + int(font_width / 2))
-                low_x_index = current_y, (current_x - int(font_width / 2))
-                high_y_index = (current_y + int(font_height / 2)), current_x
-                low_y_index = (current_y - int(font_height / 2)), current_x
-
-                if (
-                        outside_image(center_index) or
-                        (outside_image(high_x_index)) or
-                        (outside_image(low_x_index)) or
-                        (outside_image(high_y_index)) or
-                        (outside_image(low_y_index))
-                ):
-                    continue
-
-                if (
-                        (mask[center_index] == True) and
-                        (mask[high_x_index] == True) and
-                        (mask[low_x_index] == True) and
-                        (mask[high_y_index] == True) and
-                        (mask[low_y_index] == True)
-                ):
-                    return current_x, current_y
-
-        # print('no position found')
-        # print('no center found')
-        return 0, 0
-
-    def _filter_small_regions(self, labeled_image, min_size=100):
-        new_labeled = np.zeros_like(labeled_image)
-
-        current_label = 1
-        for region in regionprops(labeled_image):
-            if region.area >= min_size:
-                coords = region.coords
-                for y, x in coords:
-                    new_labeled[y, x] = current_label
-                current_label += 1
-        return new_labeled
+        first = np.concatenate((labeled_image[:, :-1][horizontal], labeled_image[:-1, :][vertical]))
+        second = np.concatenate((labeled_image[:, 1:][horizontal], labeled_image[1:, :][vertical]))
 
-    def _assign_numbers(self, cluster_centers):
-        color_to_number = {tuple(center.astype(int)): idx + 1 for idx, center in enumerate(cluster_centers)}
-        return color_to_number
+        pairs = np.concatenate((
+            first.astype(np.int64) * number_of_labels + second,
+            second.astype(np.int64) * number_of_labels + first
+        ))
+        pairs, border_lengths = np.unique(pairs, return_counts=True)
+        regions, neighbors = np.divmod(pairs, number_of_labels)
 
-    def _save_legend(self, color_to_number, output_folder):
-        legend_path = os.path.join(output_folder, "legend.txt")
-        with open(legend_path, "w") as f:
-            for color, number in color_to_number.items():
-                f.write(f"{number}: RGB{color}\n")
-        print(f"Legend saved to {legend_path}")
+        return regions, neighbors, border_lengths
 
-    def _overlay_numbers(
-            self,
-            image_array: np.ndarray,
-            labeled_regions: np.ndarray,
-            color_to_number: dict,
-            font_path: str = None,
-            font_size: int = 20,
-            num_samples: int = 200
-    ) -> Image.Image:
-        image = Image.fromarray(image_array)
-        draw = ImageDraw.Draw(image)
-        if font_path:
-            font = ImageFont.truetype(font_path, font_size)
-        else:
-            font = ImageFont.load_default()
+    def _merge_regions_into_neighbors(self, labeled_image, min_size):
+        # Every region smaller than min_size is absorbed by the neighbour it shares the longest border with.
+        # A region only merges into a neighbour that is larger (ties by label), so the merges never form
+        # cycles and whole chains resolve in one pass with pointer jumping. Label 0 is left untouched.
+        number_of_labels = int(labeled_image.max()) + 1
 
-        # Pro Region einmal durchgehen
-        for region in tqdm(regionprops(labeled_regions)):
-            # War bereits vorher so im code. Ich nehme an, dass ist der Hintergrund?!
-            if region.label == 0:
-                continue
+        while True:
+            areas = np.bincount(labeled_image.ravel(), minlength=number_of_labels)
+            regions, neighbors, border_lengths = self._region_adjacency(labeled_image, number_of_labels)
 
-            mask_full = (labeled_regions == region.label)
+            candidates = (
+                    (areas[regions] < min_size) & (regions != 0) & (neighbors != 0) &
+                    ((areas[neighbors] > areas[regions]) | ((areas[neighbors] == areas[regions]) & (neighbors > regions)))
+            )
+            regions = regions[candidates]
+            neighbors = neighbors[candidates]
+            border_lengths = border_lengths[candidates]
+
+            if len(regions) == 0:
+                return labeled_image
+
+            # dominant neighbour: longest shared border, then largest area
+            order = np.lexsort((areas[neighbors], border_lengths, regions))
+            regions = regions[order]
+            neighbors = neighbors[order]
+            last_per_region = np.r_[regions[1:] != regions[:-1], True]
 
-            color = tuple(image_array[mask_full][0])
-            number = color_to_number.get(color, '?')
+            parents = np.arange(number_of_labels, dtype=labeled_image.dtype)
+            parents[regions[last_per_region]] = neighbors[last_per_region]
 
-            font_size = font.getsize(str(number))
+            while True:
+                grand_parents = parents[parents]
+                if np.array_equal(grand_parents, parents):
+                    break
+                parents = grand_parents
 
-            # Hier wird meine neue Funktion aufgerufen.
-            cx, cy = self._find_field_center(mask_full, font_size)
+            labeled_image = parents[labeled_image]
 
-            # Übernahme von Pascal seinem Code
+    def _filtered_region_palette_indexes(self, color_regions, color_region_palette_indexes, filtered_regions):
+        # palette index of every filtered region: the one of the largest color region it contains
+        targets = np.zeros(len(color_region_palette_indexes), dtype=filtered_regions.dtype)
+        color_regions_flat = color_regions.ravel()
+        filtered_regions_flat = filtered_regions.ravel()
+        chunk_pixels = self._chunk_pixels or len(color_regions_flat)
+        for start in range(0, len(color_regions_flat), max(chunk_pixels, 1)):
+            targets[color_regions_flat[start:start + chunk_pixels]] = filtered_regions_flat[start:start + chunk_pixels]
+        areas = _label_counts(color_regions, len(color_region_palette_indexes), self._chunk_pixels)
 
-            font_width, font_height = font_size
+        order = np.lexsort((areas, targets))
+        targets = targets[order]
+        last_per_target = np.r_[targets[1:] != targets[:-1], True]
 
-            draw.text((cx - int(font_width / 2), cy - int(font_height / 2)), str(number), fill='black', font=font)
-            self._labels.append((number, ((cx - int(font_width / 2), cy - int(font_height / 2)))))
+        palette_indexes = np.zeros(int(filtered_regions.max()) + 1, dtype=color_region_palette_indexes.dtype)
+        palette_indexes[targets[last_per_target]] = color_region_palette_indexes[order][last_per_target]
 
-        return image
+        return palette_indexes
 
-    def _save_legend(self, color_to_number, output_folder):
-        legend_path = os.path.join(output_folder, "legend.txt")
-        with open(legend_path, "w") as f:
-            for color, number in color_to_number.items():
-                f.write(f"{number}: RGB{color}\n")
-        print(f"Legend saved to {legend_path}")
+    def _assign_numbers(self, cluster_centers):
+        color_to_number = {tuple(center.astype(int)): idx + 1 for idx, center in enumerate(cluster_centers)}
+        return color_to_number
@@ -0,0 +1,128 @@
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Union
+
+import numpy as np
+from PIL import Image
+
+from src.instrumentation import StageTimer
+from src.label_placement import LabelPlacer
+from src.paint_by_numbers_image_generator import PaintByNumbersImageGenerator, PaintByNumbersResult, SegmentedImage
+from src.segmentation import ImageSegmenter
+from src.segmentation.k_means import KMeansSegmenter
+from src.segmentation.preprocessing import Preprocessor
+from src.utility import load_image, read_only
+
+
+def pyramid_factor(pixels: int, max_pixels: int) -> int:
+    # smallest power of two downscale factor that brings the image within max_pixels
+    factor = 1
+    while pixels / factor ** 2 > max_pixels:
+        factor *= 2
+    return factor
+
+
+def scaled_min_size(min_size: int, factor: int) -> int:
+    # areas shrink with the square of the factor, so a region is kept at every level or at none (up to rounding)
+    return max(int(round(min_size / factor ** 2)), 1)
+
+
+class PreviewSession:
+    # Interactive tuning of one image. preview() runs on a pyramid level, downscaled by a power of two within
+    # preview_pixels, render() on the full resolution image with the segmenter warm started from the palette
+    # of the preview (K-means starts from it), which also keeps the numbers of the colors the same.
+    # The segmentations are cached per level and number of colors, changing min_size only reruns the region
+    # filter, the boundaries and the label placement. start_render() renders on a background thread meanwhile.
+
+    def __init__(
+            self,
+            image: Union[np.ndarray, bytes, str],
+            segmenter_factory: Callable[[int], ImageSegmenter] = KMeansSegmenter,
+            label_placer: LabelPlacer = None,
+            merge_small_regions: bool = False,
+            preview_pixels: int = 2 ** 18,
+            max_cached_segmentations: int = 8,
+            preprocessor: Preprocessor = None
+    ):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            image = load_image(io.BytesIO(image))
+        elif isinstance(image, str):
+            image = load_image(image)
+
+        self._segmenter_factory = segmenter_factory
+        self._generator = PaintByNumbersImageGenerator(
+            image_segmenter=None, label_placer=label_placer, merge_small_regions=merge_small_regions,
+            preprocessor=preprocessor
+        )
+
+        height, width = image.shape[:2]
+        self._factor = pyramid_factor(height * width, preview_pixels)
+        # every level is segmented again for other numbers of colors, the segmenters must not blur them in place
+        self._levels = {1: read_only(image)}
+        if self._factor > 1:
+            # box filter, every preview pixel is the mean of a factor x factor block
+            self._levels[self._factor] = read_only(Image.fromarray(self._levels[1]).reduce(self._factor))
+
+        self._max_cached_segmentations = max_cached_segmentations
+        self._segmentations: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview-render')
+        self._render: Future = None
+
+    @property
+    def preview_factor(self) -> int:
+        # the preview results are downscaled by this factor
+        return self._factor
+
+    def preview(self, number_of_colors: int = 20, min_size: int = 150) -> PaintByNumbersResult:
+        # min_size is given in full resolution pixels
+        return self._result(self._factor, number_of_colors, min_size)
+
+    def render(self, number_of_colors: int = 20, min_size: int = 150) -> PaintByNumbersResult:
+        return self._result(1, number_of_colors, min_size)
+
+    def start_render(self, number_of_colors: int = 20, min_size: int = 150) -> Future:
+        # a render that has not started yet is replaced by the new one
+        if self._render is not None:
+            self._render.cancel()
+
+        self._render = self._executor.submit(self.render, number_of_colors, min_size)
+        return self._render
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _segmented(self, factor: int, number_of_colors: int, timer: StageTimer) -> SegmentedImage:
+        key = (factor, number_of_colors)
+
+        with self._lock:
+            if key in self._segmentations:
+                self._segmentations.move_to_end(key)
+                return self._segmentations[key]
+
+        image_segmenter = self._segmenter_factory(number_of_colors)
+
+        if factor == 1 and self._factor > 1 and hasattr(image_segmenter, 'warm_started'):
+            preview = self._segmented(self._factor, number_of_colors, timer)
+            image_segmenter = image_segmenter.warm_started(preview.segmentation_result.colors)
+
+        segmented_image = self._generator.segment(self._levels[factor], timer, image_segmenter=image_segmenter)
+
+        with self._lock:
+            self._segmentations[key] = segmented_image
+            while len(self._segmentations) > self._max_cached_segmentations:
+                self._segmentations.popitem(last=False)
+
+        return segmented_image
+
+    def _result(self, factor: int, number_of_colors: int, min_size: int) -> PaintByNumbersResult:
+        timer = StageTimer()
+
+        segmented_image = self._segmented(factor, number_of_colors, timer)
+        result = self._generator.build_result(segmented_image, timer, min_size=scaled_min_size(min_size, factor))
+        result.stages = timer.report()
+
+        return result
@@ -0,0 +1,269 @@
+import copy
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from src.label_placement import LabelPlacement, draw_leader
+
+# pairs of neighbor slices (pixel, neighbor): right and down, then the two diagonals
+_CROSS_NEIGHBORS = (
+    ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+    ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+)
+_DIAGONAL_NEIGHBORS = (
+    ((slice(None, -1), slice(None, -1)), (slice(1, None), slice(1, None))),
+    ((slice(None, -1), slice(1, None)), (slice(1, None), slice(None, -1))),
+)
+
+
+def find_boundaries(labels: np.ndarray, background: int = 0, band_rows: int = None) -> np.ndarray:
+    # Same pixels as skimage.segmentation.find_boundaries(labels, mode='outer'), from comparisons of the label
+    # map with its shifted self: a pixel with a 4-neighbor of another label is a boundary if it is background,
+    # or if one of its 8-neighbors belongs to another region (the line is then on both sides of the border).
+    # With band_rows the map is processed in bands of that many rows (plus one row of context on each side),
+    # so only the boundary map is of full size.
+    labels = np.asarray(labels)
+    height = labels.shape[0]
+
+    if band_rows is None or band_rows >= height:
+        return _find_boundaries(labels, background)
+
+    boundaries = np.empty(labels.shape, dtype=bool)
+    for y0 in range(0, height, band_rows):
+        y1 = min(y0 + band_rows, height)
+        top = max(y0 - 1, 0)
+        band = _find_boundaries(labels[top:min(y1 + 1, height)], background)
+        boundaries[y0:y1] = band[y0 - top:y1 - top]
+
+    return boundaries
+
+
+def _find_boundaries(labels: np.ndarray, background: int) -> np.ndarray:
+    differs = np.zeros(labels.shape, dtype=bool)
+    other_region = np.zeros(labels.shape, dtype=bool)
+    foreground = labels != background
+
+    for neighbors, cross in ((_CROSS_NEIGHBORS, True), (_DIAGONAL_NEIGHBORS, False)):
+        for pixel, neighbor in neighbors:
+            different = labels[pixel] != labels[neighbor]
+            between_regions = different & foreground[pixel] & foreground[neighbor]
+            other_region[pixel] |= between_regions
+            other_region[neighbor] |= between_regions
+
+            if cross:
+                differs[pixel] |= different
+                differs[neighbor] |= different
+
+    return differs & (~foreground | other_region)
+
+
+def edge_mask(labels: np.ndarray, scale: int = 1) -> np.ndarray:
+    # one output pixel wide lines on the borders between the pixels of different labels, scale output
+    # pixels per label pixel. The line of a border lies on the first output pixel after it.
+    height, width = labels.shape
+    mask = np.zeros((height * scale, width * scale), dtype=bool)
+
+    vertical = labels[:, 1:] != labels[:, :-1]
+    mask[:, scale::scale] |= np.repeat(vertical, scale, axis=0)
+
+    horizontal = labels[1:] != labels[:-1]
+    mask[scale::scale, :] |= np.repeat(horizontal, scale, axis=1)
+
+    return mask
+
+
+def darken(image_array: np.ndarray, covered: np.ndarray, coverage: np.ndarray):
+    # blends black into the pixels at the flat indexes covered, by their coverage (0 - 255), in place.
+    # Only the covered pixels are touched, labels cover a small part of the image.
+    channels = image_array.shape[2] if image_array.ndim == 3 else 1
+    pixels = image_array.reshape(-1, channels)
+    weights = (255 - coverage.astype(np.uint16))[:, None]
+    pixels[covered] = ((pixels[covered] * weights + 127) // 255).astype(image_array.dtype)
+
+
+class GlyphAtlas:
+    # Coverage bitmaps of the label texts in one font, every text is rasterized once. The labels are
+    # blitted from here with numpy instead of drawn one by one, so the cost does not depend on the font
+    # and grows with the covered pixels only.
+
+    def __init__(self, font):
+        self._font = font
+        # text -> rows, columns (relative to the text position) and coverage of the covered pixels
+        self._glyphs: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        # text -> width and height as of font.getsize, for the leader lines
+        self._sizes: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def glyph(self, text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            if text not in self._glyphs:
+                self._glyphs[text] = self._rasterize(text)
+            return self._glyphs[text]
+
+    def text_size(self, text: str) -> Tuple[int, int]:
+        with self._lock:
+            if text not in self._sizes:
+                self._sizes[text] = self._font.getsize(text)
+            return self._sizes[text]
+
+    def _rasterize(self, text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # drawn exactly like ImageDraw.text at an integer position, which it is shifted to
+        left, top, right, bottom = self._font.getbbox(text)
+        x, y = max(-left, 0), max(-top, 0)
+
+        canvas = Image.new('L', (max(right + x, 1), max(bottom + y, 1)), 0)
+        ImageDraw.Draw(canvas).text((x, y), text, fill=255, font=self._font)
+
+        coverage = np.asarray(canvas)
+        rows, columns = np.nonzero(coverage)
+        return rows - y, columns - x, coverage[rows, columns]
+
+    def blit(self, layer: np.ndarray, texts: List[str], positions: np.ndarray):
+        # adds the texts at their positions (x, y) to a coverage layer in place, overlaps keep the maximum
+        height, width = layer.shape
+        texts = np.asarray(texts)
+
+        for text in np.unique(texts).tolist():
+            glyph_rows, glyph_columns, coverage = self.glyph(text)
+            text_positions = positions[texts == text]
+
+            rows = text_positions[:, 1:2] + glyph_rows
+            columns = text_positions[:, 0:1] + glyph_columns
+            inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+
+            np.maximum.at(
+                layer, (rows[inside], columns[inside]), np.broadcast_to(coverage, rows.shape)[inside]
+            )
+
+
+class Renderer:
+    # Draws the colored and the outline image of a result in one pass. The labels are blitted once from
+    # glyph atlases into a coverage layer that is composited onto both images.
+    #
+    # scale: output pixels per image pixel (an integer), e.g. 300 DPI prints of a 1200 pixel wide image at
+    # 20 cm need scale 2. line_width: width of the outlines in output pixels, None for the boundary pixels
+    # of find_boundaries (two image pixels between regions). antialias: soft edges of the outlines (a one
+    # pixel line on the pixel grid has none to soften) and bilinear instead of nearest scaling of labels in
+    # the bitmap font, the text itself is always anti-aliased. dpi: resolution stored in the image files.
+
+    def __init__(self, scale: int = 1, line_width: float = None, antialias: bool = False, dpi: int = None):
+        if int(scale) != scale or scale < 1:
+            raise ValueError(f'scale must be a positive integer, got {scale!r}')
+
+        self.scale: int = int(scale)
+        self.line_width: float = line_width
+        self.antialias: bool = antialias
+        self.dpi: int = dpi
+
+        # glyph atlases and print size variants of the fonts, shared by the renders of all threads
+        self._atlases: Dict[object, GlyphAtlas] = {}
+        self._scaled_fonts: Dict[object, object] = {}
+        self._lock = threading.Lock()
+
+    def render(self, result) -> Tuple[Image.Image, Image.Image]:
+        # colored and outline image of a PaintByNumbersResult
+        label_ink = self.label_layer(result.placements, result.labeled_regions.shape)
+        covered = np.flatnonzero(label_ink)
+        coverage = label_ink.ravel()[covered]
+
+        colored = self._scaled(result.quantized_image)
+        if colored is result.quantized_image:
+            colored = colored.copy()
+        outline = 255 - self.outline_ink(result.labeled_regions, result.boundaries)
+
+        images = []
+        for image_array in (colored, outline):
+            darken(image_array, covered, coverage)
+
+            image = Image.fromarray(image_array)
+            if self.dpi:
+                image.info['dpi'] = (self.dpi, self.dpi)
+            images.append(image)
+
+        return images[0], images[1]
+
+    def outline_ink(self, labeled_regions: np.ndarray, boundaries: np.ndarray = None) -> np.ndarray:
+        # coverage of the outlines, 255 on the lines
+        import cv2
+
+        if self.line_width is None and not self.antialias:
+            if boundaries is None:
+                boundaries = find_boundaries(labeled_regions)
+            return self._scaled(boundaries.astype(np.uint8) * 255)
+
+        line_width = self.line_width or self.scale
+        lines = edge_mask(labeled_regions, self.scale)
+
+        if self.antialias:
+            # distance of every pixel center to the closest line pixel, the coverage falls off over one pixel
+            distances = cv2.distanceTransform((~lines).astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            coverage = np.clip((line_width + 1) / 2 - distances, 0, 1)
+            return (coverage * 255 + 0.5).astype(np.uint8)
+
+        ink = lines.astype(np.uint8) * 255
+        if line_width > 1:
+            size = int(round(line_width))
+            ink = cv2.dilate(ink, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size)))
+        return ink
+
+    def label_layer(self, placements: List[LabelPlacement], shape) -> np.ndarray:
+        # coverage of all labels. Scalable fonts are drawn at the output size, the bitmap default font is
+        # drawn at the image size and the layer is scaled up
+        height, width = shape[:2]
+        scalable = all(isinstance(placement.font, ImageFont.FreeTypeFont) for placement in placements)
+        scale = self.scale if scalable else 1
+
+        if scale != 1:
+            placements = [self._scaled_placement(placement) for placement in placements]
+
+        layer = Image.new('L', (width * scale, height * scale), 0)
+        leaders = [placement for placement in placements if placement.leader]
+        if leaders:
+            draw = ImageDraw.Draw(layer)
+            for placement in leaders:
+                text_size = self.atlas(placement.font).text_size(str(placement.number))
+                draw_leader(draw, placement, fill=255, line_width=scale, text_size=text_size)
+        layer = np.array(layer)
+
+        by_font: Dict[object, List[LabelPlacement]] = {}
+        for placement in placements:
+            by_font.setdefault(placement.font, []).append(placement)
+
+        for font, font_placements in by_font.items():
+            self.atlas(font).blit(
+                layer,
+                [str(placement.number) for placement in font_placements],
+                np.array([placement.position for placement in font_placements], dtype=np.intp).reshape(-1, 2)
+            )
+
+        if scale != self.scale:
+            resample = Image.BILINEAR if self.antialias else Image.NEAREST
+            layer = np.asarray(Image.fromarray(layer).resize((width * self.scale, height * self.scale), resample))
+
+        return layer
+
+    def atlas(self, font) -> GlyphAtlas:
+        # one atlas per font, kept for the next renders
+        with self._lock:
+            if font not in self._atlases:
+                self._atlases[font] = GlyphAtlas(font)
+            return self._atlases[font]
+
+    def _scaled(self, image_array: np.ndarray) -> np.ndarray:
+        if self.scale == 1:
+            return image_array
+        return np.repeat(np.repeat(image_array, self.scale, axis=0), self.scale, axis=1)
+
+    def _scaled_placement(self, placement: LabelPlacement) -> LabelPlacement:
+        with self._lock:
+            if placement.font not in self._scaled_fonts:
+                self._scaled_fonts[placement.font] = placement.font.font_variant(size=placement.font.size * self.scale)
+            font = self._scaled_fonts[placement.font]
+
+        placement = copy.copy(placement)
+        placement.position = tuple(coordinate * self.scale for coordinate in placement.position)
+        placement.anchor = tuple(coordinate * self.scale for coordinate in placement.anchor)
+        placement.font = font
+        return placement
@@ -1,77 +1,155 @@
-from typing import List
+from typing import List, Tuple
 
 import numpy as np
 from skimage.measure import regionprops, label
 
 
-class Region:
-    def __init__(self, region_pixels=None):
-        self._region_pixels: List[tuple[int, int]] = region_pixels
+def _runs_from_label_image(labeled_image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Horizontal runs of equal, non zero labels as [y, x_start, x_end] (x_end inclusive), in raster order.
+    height, width = labeled_image.shape
 
-        if self._region_pixels is None:
-            self._region_pixels = []
+    padded = np.zeros((height, width + 2), dtype=labeled_image.dtype)
+    padded[:, 1:-1] = labeled_image
 
-    def add_region_pixel(self, region_pixel: tuple[int, int]):
-        self._region_pixels.append(region_pixel)
+    changes = padded[:, 1:] != padded[:, :-1]
+    start_y, start_x = np.nonzero(changes[:, :-1] & (labeled_image != 0))
+    _, end_x = np.nonzero(changes[:, 1:] & (labeled_image != 0))
 
-    def get_region_center_middle_positions(self):
-        y_coords = list(set([pixel[1] for pixel in self._region_pixels]))
+    runs = np.stack((start_y, start_x, end_x), axis=1).astype(np.intp, copy=False)
+    return runs, labeled_image[start_y, start_x]
 
-        y_groups = {
-            y_cord: [] for y_cord in y_coords
-        }
 
-        for pixel in self._region_pixels:
-            y_groups[pixel[1]].append(pixel[0])
+def _runs_from_coordinates(x_coordinates: np.ndarray, y_coordinates: np.ndarray) -> np.ndarray:
+    x_coordinates = np.asarray(x_coordinates, dtype=np.intp).ravel()
+    y_coordinates = np.asarray(y_coordinates, dtype=np.intp).ravel()
 
-        middle_positons = []
-        for y_position, x_positions in y_groups.items():
-            min_x = min(x_positions)
-            max_x = max(x_positions)
+    if len(x_coordinates) == 0:
+        return np.empty((0, 3), dtype=np.intp)
 
-            center_index = min_x + int((max_x - min_x) // 2)
-            middle_positons.append((center_index, y_position))
+    pixels = np.unique(np.stack((y_coordinates, x_coordinates), axis=1), axis=0)
+    y_coordinates, x_coordinates = pixels[:, 0], pixels[:, 1]
 
-        return middle_positons
+    breaks = np.flatnonzero(
+        (y_coordinates[1:] != y_coordinates[:-1]) | (x_coordinates[1:] != x_coordinates[:-1] + 1)
+    ) + 1
+    starts = np.r_[0, breaks]
+    ends = np.r_[breaks, len(x_coordinates)] - 1
 
+    return np.stack((y_coordinates[starts], x_coordinates[starts], x_coordinates[ends]), axis=1)
 
-class RegionDetector:
-    def __init__(self):
-        self._regions: List[Region] = []
 
-        self._pixels_to_explore_for_region = []
+def _summarize_runs(runs: np.ndarray, offsets: np.ndarray):
+    # Per region (runs[offsets[i]:offsets[i + 1]], raster ordered) row spans, bounding box, area and centroid.
+    number_of_regions = len(offsets) - 1
+    run_regions = np.repeat(np.arange(number_of_regions), np.diff(offsets))
+
+    y, x_start, x_end = runs[:, 0], runs[:, 1], runs[:, 2]
+    run_lengths = x_end - x_start + 1
 
-        self._current_region = None
-        self._in_region_lookup = None
+    row_starts = np.flatnonzero(np.r_[
+        True, (y[1:] != y[:-1]) | (run_regions[1:] != run_regions[:-1])
+    ])
+    row_ends = np.r_[row_starts[1:], len(runs)] - 1
+    row_spans = np.stack((y[row_starts], x_start[row_starts], x_end[row_ends]), axis=1)
+    row_offsets = np.searchsorted(row_starts, offsets)
 
-        self._image_height = None
-        self._image_width = None
+    areas = np.bincount(run_regions, weights=run_lengths, minlength=number_of_regions)
+    x_sums = np.bincount(run_regions, weights=(x_start + x_end) * run_lengths / 2, minlength=number_of_regions)
+    y_sums = np.bincount(run_regions, weights=y * run_lengths, minlength=number_of_regions)
 
-        self._binary_mask = None
+    region_starts = offsets[:-1]
+    region_ends = offsets[1:] - 1
+    bounding_boxes = np.stack((
+        np.minimum.reduceat(x_start, region_starts),
+        y[region_starts],
+        np.maximum.reduceat(x_end, region_starts),
+        y[region_ends],
+    ), axis=1)
 
-    def _coord_is_outside_image(self, coord):
-        x, y = coord
+    return row_spans, row_offsets, bounding_boxes, areas.astype(np.intp), np.stack((x_sums, y_sums), axis=1) / areas[:, None]
 
-        return (
-                (x < 0) or (y < 0) or
-                (x > self._image_width) or (y > self._image_height)
+
+class Region:
+    # Pixels are kept run length encoded: one [y, x_start, x_end] row per horizontal run.
+    __slots__ = ('_runs', '_row_spans', 'bounding_box', 'area', 'centroid')
+
+    def __init__(self, region_pixels=None):
+        if region_pixels is None:
+            region_pixels = []
+
+        region_pixels = np.asarray(region_pixels, dtype=np.intp).reshape(-1, 2)
+        self._set_runs(_runs_from_coordinates(region_pixels[:, 0], region_pixels[:, 1]))
+
+    @classmethod
+    def from_coordinates(cls, x_coordinates: np.ndarray, y_coordinates: np.ndarray) -> 'Region':
+        region = cls.__new__(cls)
+        region._set_runs(_runs_from_coordinates(x_coordinates, y_coordinates))
+        return region
+
+    @classmethod
+    def from_runs(cls, runs: np.ndarray, row_spans: np.ndarray, bounding_box, area: int, centroid) -> 'Region':
+        region = cls.__new__(cls)
+        region._runs = runs
+        region._row_spans = row_spans
+        region.bounding_box = bounding_box
+        region.area = area
+        region.centroid = centroid
+        return region
+
+    def _set_runs(self, runs: np.ndarray):
+        self._runs = runs
+
+        if len(runs) == 0:
+            self._row_spans = runs
+            self.bounding_box = None
+            self.area = 0
+            self.centroid = None
+            return
+
+        row_spans, _, bounding_boxes, areas, centroids = _summarize_runs(runs, np.array([0, len(runs)]))
+
+        self._row_spans = row_spans
+        self.bounding_box = tuple(bounding_boxes[0].tolist())
+        self.area = int(areas[0])
+        self.centroid = tuple(centroids[0].tolist())
+
+    @property
+    def runs(self) -> np.ndarray:
+        return self._runs
+
+    @property
+    def row_spans(self) -> np.ndarray:
+        return self._row_spans
+
+    @property
+    def _region_pixels(self) -> List[tuple[int, int]]:
+        run_lengths = self._runs[:, 2] - self._runs[:, 1] + 1
+
+        y_coordinates = np.repeat(self._runs[:, 0], run_lengths)
+        x_coordinates = (
+                np.arange(run_lengths.sum()) -
+                np.repeat(np.cumsum(run_lengths) - run_lengths - self._runs[:, 1], run_lengths)
         )
+        return list(zip(x_coordinates.tolist(), y_coordinates.tolist()))
 
-    def _add_pixel_to_explore_for_pixel(self, pixel):
-        x, y = pixel
+    def add_region_pixel(self, region_pixel: tuple[int, int]):
+        region_pixels = np.asarray(self._region_pixels + [region_pixel], dtype=np.intp).reshape(-1, 2)
+        self._set_runs(_runs_from_coordinates(region_pixels[:, 0], region_pixels[:, 1]))
+
+    def get_middle_positions(self) -> np.ndarray:
+        # (x, y) of the middle between the leftmost and rightmost pixel of every row
+        min_x = self._row_spans[:, 1]
+        max_x = self._row_spans[:, 2]
 
-        top = x, (y - 1)
-        bottom = x, (y + 1)
-        left = (x - 1), y
-        right = (x + 1), y
+        return np.stack((min_x + (max_x - min_x) // 2, self._row_spans[:, 0]), axis=1)
 
-        for neighbor_pixel in [top, bottom, left, right]:
-            if (
-                    (not self._coord_is_outside_image(neighbor_pixel)) and
-                    self._binary_mask[neighbor_pixel[1], neighbor_pixel[0]] and
-                    (not self._in_region_lookup[neighbor_pixel])
-            ):
-                self._pixels_to_explore_for_region.append(neighbor_pixel)
+    def get_region_center_middle_positions(self):
+        return [tuple(position) for position in self.get_middle_positions().tolist()]
+
+
+class RegionDetector:
+    def __init__(self):
+        self._regions: List[Region] = []
 
     def get_regions_old(self, binary_mask: np.ndarray):
         pass
@@ -92,49 +170,41 @@ class RegionDetector:
         return regions
 
     def get_regions(self, binary_mask: np.ndarray) -> List[Region]:
-        self._binary_mask = binary_mask
-        region_y_indexes, region_x_indexes = np.where(binary_mask)
+        # Single 4-connected labeling pass, afterwards the horizontal runs are grouped
+        # per label (stable sort by label + offsets) and summarized all at once.
+        labeled_mask, number_of_regions = label(
+            np.asarray(binary_mask).astype(bool, copy=False),
+            connectivity=1,
+            return_num=True
+        )
 
-        self._image_width = binary_mask.shape[1] - 1
-        self._image_height = binary_mask.shape[0] - 1
+        if number_of_regions == 0:
+            self._regions = []
+            return self._regions
 
-        mask_xy_coordinates = list(zip(region_x_indexes, region_y_indexes))
+        runs, run_labels = _runs_from_label_image(labeled_mask)
 
-        self._in_region_lookup = {
-            coords: False for coords in mask_xy_coordinates
-        }
+        # stable sort keeps the raster order (y, then x) inside every region
+        order = np.argsort(run_labels, kind='stable')
+        runs = runs[order]
 
-        regions = []
+        offsets = np.zeros(number_of_regions + 1, dtype=np.intp)
+        np.cumsum(np.bincount(run_labels, minlength=number_of_regions + 1)[1:], out=offsets[1:])
 
-        while len(mask_xy_coordinates) > 0:
-            region = Region()
-            current_xy_coordinates = mask_xy_coordinates.pop()
+        row_spans, row_offsets, bounding_boxes, areas, centroids = _summarize_runs(runs, offsets)
 
-            if self._in_region_lookup[current_xy_coordinates]:
-                continue
+        bounding_boxes = bounding_boxes.tolist()
+        areas = areas.tolist()
+        centroids = centroids.tolist()
 
-            region.add_region_pixel(current_xy_coordinates)
-            self._in_region_lookup[current_xy_coordinates] = True
-            self._add_pixel_to_explore_for_pixel(
-                current_xy_coordinates
+        self._regions = [
+            Region.from_runs(
+                runs[offsets[index]:offsets[index + 1]],
+                row_spans[row_offsets[index]:row_offsets[index + 1]],
+                tuple(bounding_boxes[index]),
+                areas[index],
+                tuple(centroids[index])
             )
-
-            while len(self._pixels_to_explore_for_region) > 0:
-                current_xy_coordinates = self._pixels_to_explore_for_region.pop()
-                current_x, current_y = current_xy_coordinates
-
-                if (
-                        self._in_region_lookup[current_xy_coordinates] or
-                        (not binary_mask[current_y, current_x])
-                ):
-                    continue
-
-                self._add_pixel_to_explore_for_pixel(
-                    current_xy_coordinates
-                )
-
-                self._in_region_lookup[current_xy_coordinates] = True
-                region.add_region_pixel(current_xy_coordinates)
-
-            regions.append(region)
-        return regions
+            for index in range(number_of_regions)
+        ]
+        return self._regions
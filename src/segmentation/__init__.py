@@ -1,13 +1,16 @@
+import hashlib
 from abc import ABC, abstractmethod
 
 import numpy as np
 
 
 class SegmentationResult:
-    def __init__(self, segment_labels, colors, quantized_image):
+    def __init__(self, segment_labels, colors, quantized_image, quantization_error=None):
         self.segment_labels = segment_labels
         self.colors = colors
         self.quantized_image = quantized_image
+        # mean squared distance of the pixels to their palette color, if the segmenter measured it
+        self.quantization_error = quantization_error
 
 
 class ImageSegmenter(ABC):
@@ -15,3 +18,29 @@ class ImageSegmenter(ABC):
     @abstractmethod
     def segment(self, image_array: np.ndarray) -> SegmentationResult:
         raise NotImplementedError()
+
+    def cache_parameters(self) -> dict:
+        # the configuration as primitive values, by default all attributes of the segmenter. Segmenters with
+        # attributes of other types override it: their repr can contain a memory address, which differs
+        # between runs and processes
+        parameters = {}
+
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                value = hashlib.blake2b(np.ascontiguousarray(value).tobytes(), digest_size=16).hexdigest()
+            elif isinstance(value, np.generic):
+                # numpy scalars, e.g. read from an array or a config, key like the python value
+                value = value.item()
+
+            if not isinstance(value, (bool, int, float, str, type(None))):
+                raise TypeError(
+                    f'{type(self).__name__}.{name} is a {type(value).__name__}, override cache_parameters'
+                )
+            parameters[name] = value
+
+        return parameters
+
+    def cache_key(self) -> str:
+        # identifies the segmenter configuration, results are only reused for the same key
+        parameters = self.cache_parameters()
+        return ';'.join([type(self).__name__] + [f'{name}={parameters[name]!r}' for name in sorted(parameters)])
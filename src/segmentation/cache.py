@@ -0,0 +1,214 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.segmentation import ImageSegmenter, SegmentationResult
+
+
+class SegmentationCache:
+    # Segmentation results keyed by a hash of the image content and the segmenter configuration.
+    # The most recently used results are kept in memory, all of them optionally as .npz files in a
+    # directory. Both stores evict the least recently used entries first.
+    # For warm started results it also records, per cold key, the key the result was stored under.
+
+    def __init__(self, directory: str = None, max_entries: int = 8, max_disk_entries: int = 256):
+        self._directory = directory
+        self._max_entries = max_entries
+        self._max_disk_entries = max_disk_entries
+
+        self._entries: OrderedDict = OrderedDict()
+        self._warm_keys: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self._directory is not None:
+            os.makedirs(self._directory, exist_ok=True)
+
+    @staticmethod
+    def key(image_array: np.ndarray, image_segmenter: ImageSegmenter) -> str:
+        image_array = np.ascontiguousarray(image_array)
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f'{image_array.shape}{image_array.dtype}{image_segmenter.cache_key()}'.encode())
+        digest.update(image_array.data)
+
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, f'{key}.npz')
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        if self._directory is None or not os.path.exists(self._path(key)):
+            return None
+
+        try:
+            with np.load(self._path(key)) as stored:
+                quantization_error = float(stored['quantization_error'])
+                result = SegmentationResult(
+                    segment_labels=stored['segment_labels'],
+                    colors=stored['colors'],
+                    quantized_image=stored['quantized_image'],
+                    quantization_error=None if np.isnan(quantization_error) else quantization_error
+                )
+        except (OSError, ValueError, KeyError):
+            # unreadable or half written by another process, treat as a miss
+            return None
+
+        # the modification time is the last use for the disk eviction
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            return None
+        self._remember(key, result)
+
+        return result
+
+    def put(self, key: str, result: SegmentationResult):
+        self._remember(key, result)
+
+        if self._directory is None:
+            return
+
+        temporary_path = f'{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.savez(
+                f,
+                segment_labels=result.segment_labels,
+                colors=result.colors,
+                quantized_image=result.quantized_image,
+                quantization_error=np.nan if result.quantization_error is None else result.quantization_error
+            )
+        os.replace(temporary_path, self._path(key))
+
+        self._evict_disk_entries()
+
+    def _warm_key_path(self, key: str) -> str:
+        return os.path.join(self._directory, f'{key}.warm')
+
+    def warm_key(self, key: str):
+        # key of the warm started result stored for the cold key, if any
+        with self._lock:
+            if key in self._warm_keys:
+                self._warm_keys.move_to_end(key)
+                return self._warm_keys[key]
+
+        if self._directory is None:
+            return None
+
+        try:
+            with open(self._warm_key_path(key)) as f:
+                warm_key = f.read().strip()
+            os.utime(self._warm_key_path(key))
+        except FileNotFoundError:
+            return None
+
+        self._remember_warm_key(key, warm_key)
+
+        return warm_key or None
+
+    def put_warm_key(self, key: str, warm_key: str):
+        self._remember_warm_key(key, warm_key)
+
+        if self._directory is None:
+            return
+
+        temporary_path = f'{self._warm_key_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'w') as f:
+            f.write(warm_key)
+        os.replace(temporary_path, self._warm_key_path(key))
+
+        self._evict_disk_entries('.warm')
+
+    def _remember_warm_key(self, key: str, warm_key: str):
+        with self._lock:
+            self._warm_keys[key] = warm_key
+            self._warm_keys.move_to_end(key)
+
+            while len(self._warm_keys) > self._max_entries:
+                self._warm_keys.popitem(last=False)
+
+    def latest_palette(self, number_of_colors: int):
+        # palette of the most recently used result with the given number of colors, for warm starts
+        with self._lock:
+            for result in reversed(self._entries.values()):
+                if len(result.colors) == number_of_colors:
+                    return np.asarray(result.colors)
+        return None
+
+    def _remember(self, key: str, result: SegmentationResult):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict_disk_entries(self, extension: str = '.npz'):
+        entries = [entry for entry in os.scandir(self._directory) if entry.name.endswith(extension)]
+
+        if len(entries) <= self._max_disk_entries:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self._max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class CachingSegmenter(ImageSegmenter):
+    # Wraps another segmenter: repeated runs on the same image skip the segmentation, and with warm_start
+    # a miss starts from the palette of the last cached result (segmenters that support warm_started).
+    # Warm started results depend on that palette, they are cached under the key of the warm started
+    # segmenter (which includes the palette) and never returned for a run without warm starts. The cache
+    # records which warm key a result was stored under for the image, so re-renders still hit.
+
+    def __init__(self, image_segmenter: ImageSegmenter, cache: SegmentationCache = None, warm_start: bool = False):
+        self._image_segmenter = image_segmenter
+        self._cache = cache if cache is not None else SegmentationCache()
+        self._warm_start = warm_start
+
+    def cache_key(self) -> str:
+        return self._image_segmenter.cache_key()
+
+    def segment(self, image_array: np.ndarray) -> SegmentationResult:
+        key = self._cache.key(image_array, self._image_segmenter)
+
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+
+        image_segmenter = self._image_segmenter
+        if self._warm_start and hasattr(image_segmenter, 'warm_started'):
+            warm_key = self._cache.warm_key(key)
+            if warm_key is not None:
+                result = self._cache.get(warm_key)
+                if result is not None:
+                    return result
+
+            palette = self._cache.latest_palette(image_segmenter.number_of_colors)
+            if palette is not None:
+                image_segmenter = image_segmenter.warm_started(palette)
+                warm_key = self._cache.key(image_array, image_segmenter)
+
+                result = self._cache.get(warm_key)
+                if result is None:
+                    result = image_segmenter.segment(image_array)
+                    self._cache.put(warm_key, result)
+                self._cache.put_warm_key(key, warm_key)
+
+                return result
+
+        result = image_segmenter.segment(image_array)
+        self._cache.put(key, result)
+
+        return result
@@ -0,0 +1,98 @@
+from abc import abstractmethod
+
+import numpy as np
+
+from src.segmentation import ImageSegmenter, SegmentationResult
+from src.segmentation.palette_assignment import PaletteAssigner
+
+
+def _spread_bits(depth: int, offset: int) -> np.ndarray:
+    # lookup table that moves the top depth bits of a channel value to every third bit of a morton code
+    values = np.arange(256, dtype=np.uint32) >> (8 - depth)
+    spread = np.zeros(256, dtype=np.uint32)
+
+    for bit in range(depth):
+        spread |= ((values >> bit) & 1) << (3 * bit + offset)
+
+    return spread
+
+
+def _weighted_means(cell_labels: np.ndarray, counts: np.ndarray, color_sums: np.ndarray):
+    # mean color and pixel count of every used label, in label order
+    labels, cell_labels = np.unique(cell_labels, return_inverse=True)
+    cell_labels = cell_labels.ravel()
+
+    label_counts = np.bincount(cell_labels, weights=counts)
+    label_sums = np.stack([np.bincount(cell_labels, weights=color_sums[:, channel]) for channel in range(3)], axis=1)
+
+    return label_sums / label_counts[:, None], label_counts
+
+
+class HistogramSegmenter(ImageSegmenter):
+    # Base for quantizers that only look at a color histogram: the pixels are counted once in the
+    # (2 ** depth) ** 3 cells of the RGB cube (cells are numbered by morton code, i.e. octree order), the
+    # palette is built from the occupied cells and every pixel is mapped through a per cell lookup table.
+
+    def __init__(self, number_of_colors, depth: int = 6, refinement_steps: int = 2, blur_size: int = 5):
+        self._number_of_colors: int = number_of_colors
+        self._depth: int = depth
+        # nearest color / mean updates on the cells after the palette is built
+        self._refinement_steps: int = refinement_steps
+        # Gaussian blur kernel, None when a Preprocessor smooths the image already
+        self._blur_size: int = blur_size
+
+    @abstractmethod
+    def _initial_cell_labels(self, cells: np.ndarray, counts: np.ndarray, cell_colors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError()
+
+    def segment(self, image_array: np.ndarray) -> SegmentationResult:
+        import cv2
+
+        # same smoothing as the K-means segmenter, so both produce comparable regions
+        blurred = image_array
+        if self._blur_size:
+            blurred = cv2.GaussianBlur(image_array, (self._blur_size, self._blur_size), 0)
+
+        h, w, c = blurred.shape
+        image_flat = blurred.reshape(-1, 3)
+
+        cells = (
+                _spread_bits(self._depth, 2)[image_flat[:, 0]] |
+                _spread_bits(self._depth, 1)[image_flat[:, 1]] |
+                _spread_bits(self._depth, 0)[image_flat[:, 2]]
+        )
+
+        counts = np.bincount(cells, minlength=8 ** self._depth)
+        occupied = np.flatnonzero(counts)
+        counts = counts[occupied]
+        color_sums = np.stack([
+            np.bincount(cells, weights=image_flat[:, channel], minlength=8 ** self._depth)[occupied]
+            for channel in range(3)
+        ], axis=1)
+        cell_colors = color_sums / counts[:, None]
+
+        cell_labels = self._initial_cell_labels(occupied, counts, cell_colors)
+
+        # mapping the cells (not the pixels) to the nearest color avoids the blocky boundaries of the tree / boxes
+        for _ in range(self._refinement_steps):
+            colors, _ = _weighted_means(cell_labels, counts, color_sums)
+            cell_labels = PaletteAssigner(colors).assign(cell_colors)
+
+        colors, color_counts = _weighted_means(cell_labels, counts, color_sums)
+
+        lookup = np.zeros(8 ** self._depth, dtype=np.uint8 if len(colors) <= 256 else np.uint16)
+        lookup[occupied] = np.unique(cell_labels, return_inverse=True)[1].ravel()
+        labels = lookup[cells]
+
+        # colors are the means of their pixels: sum |p - c|^2 = sum |p|^2 - sum n |c|^2
+        squared_error = (
+                np.einsum('ij,ij->', image_flat, image_flat, dtype=np.float64) -
+                (color_counts * (colors ** 2).sum(axis=1)).sum()
+        )
+
+        return SegmentationResult(
+            segment_labels=labels.reshape(h, w),
+            colors=colors,
+            quantized_image=colors.astype('uint8')[labels].reshape(h, w, 3),
+            quantization_error=max(squared_error, 0) / len(image_flat)
+        )
@@ -1,28 +1,138 @@
+import copy
+
 import numpy as np
-from sklearn.cluster import KMeans
-import cv2
 
 from src.segmentation import ImageSegmenter, SegmentationResult
+from src.segmentation.palette_assignment import PaletteAssigner
+
+
+def relative_quality_loss(result: SegmentationResult, reference_result: SegmentationResult) -> float:
+    # how much larger the quantization error is compared to a reference, e.g. the full K-means fit
+    return result.quantization_error / reference_result.quantization_error - 1
 
 
 class KMeansSegmenter(ImageSegmenter):
 
-    def __init__(self, number_of_colors):
+    def __init__(
+            self,
+            number_of_colors,
+            sample_size: int = None,
+            batch_size: int = None,
+            max_memory_bytes: int = 64 * 2 ** 20,
+            lut_bits: int = None,
+            initial_palette: np.ndarray = None,
+            compact: bool = False,
+            blur_in_place: bool = False,
+            blur_size: int = 5
+    ):
         self._number_of_colors: int = number_of_colors
+        # fast mode: fit the centroids on a stratified subsample of sample_size pixels and / or with
+        # MiniBatch K-means, then assign all pixels with the tiled PaletteAssigner
+        self._sample_size: int = sample_size
+        self._batch_size: int = batch_size
+        self._max_memory_bytes: int = max_memory_bytes
+        self._lut_bits: int = lut_bits
+        # warm start: K-means starts from this palette instead of k-means++ and runs only once
+        self._initial_palette: np.ndarray = None
+        if initial_palette is not None:
+            self._initial_palette = np.asarray(initial_palette, dtype=np.float64).reshape(number_of_colors, 3)
+        # memory-lean mode: float32 instead of float64 pixels for K-means, uint8 / uint16 segment labels
+        self._compact: bool = compact
+        # overwrite the image with its blurred version instead of blurring into a copy, for callers that do
+        # not need the image afterwards. Read-only or non C-contiguous images are blurred into a copy anyway
+        self._blur_in_place: bool = blur_in_place
+        # Gaussian blur kernel, None when a Preprocessor smooths the image already
+        self._blur_size: int = blur_size
+
+    @property
+    def number_of_colors(self) -> int:
+        return self._number_of_colors
+
+    def warm_started(self, palette: np.ndarray) -> 'KMeansSegmenter':
+        segmenter = copy.copy(self)
+        segmenter._initial_palette = np.asarray(palette, dtype=np.float64).reshape(self._number_of_colors, 3)
+        return segmenter
+
+    def _kmeans(self):
+        from sklearn.cluster import KMeans
+
+        # in compact mode the float32 pixels are our own copy, K-means may center them in place
+        copy_x = not self._compact
+        if self._initial_palette is not None:
+            return KMeans(
+                n_clusters=self._number_of_colors, init=self._initial_palette, n_init=1, random_state=42, copy_x=copy_x
+            )
+        return KMeans(n_clusters=self._number_of_colors, random_state=42, copy_x=copy_x)
+
+    def _fit_pixels(self, pixels: np.ndarray) -> np.ndarray:
+        # sklearn converts uint8 input to a float64 copy itself, float32 input is used as it is
+        return pixels.astype(np.float32) if self._compact else pixels
 
     def segment(self, image_array: np.ndarray) -> SegmentationResult:
+        # sklearn and OpenCV are imported on first use, they dominate the import time of the package
+        import cv2
+        from sklearn.cluster import MiniBatchKMeans
+
         # Apply Gaussian blur to smooth transitions and reduce small color noise
-        blurred = cv2.GaussianBlur(image_array, (5, 5), 0)
+        blurred = image_array
+        if self._blur_size:
+            in_place = self._blur_in_place and image_array.flags.writeable and image_array.flags.c_contiguous
+            blurred = cv2.GaussianBlur(
+                image_array, (self._blur_size, self._blur_size), 0, dst=image_array if in_place else None
+            )
 
         h, w, c = blurred.shape
         image_flat = blurred.reshape(-1, 3)
-        kmeans = KMeans(n_clusters=self._number_of_colors, random_state=42).fit(image_flat)
-        labels = kmeans.labels_
-        quantized_flat = kmeans.cluster_centers_[labels].astype('uint8')
+
+        if self._sample_size is None and self._batch_size is None:
+            kmeans = self._kmeans().fit(self._fit_pixels(image_flat))
+            labels = kmeans.labels_
+            if self._compact:
+                labels = labels.astype(np.min_scalar_type(self._number_of_colors - 1))
+            quantization_error = kmeans.inertia_ / len(image_flat)
+        else:
+            fit_pixels = image_flat
+            if self._sample_size is not None:
+                fit_pixels = self._stratified_sample(blurred, self._sample_size)
+
+            if self._batch_size is not None:
+                kmeans = MiniBatchKMeans(
+                    n_clusters=self._number_of_colors,
+                    batch_size=self._batch_size,
+                    init='k-means++' if self._initial_palette is None else self._initial_palette,
+                    n_init=3 if self._initial_palette is None else 1,
+                    random_state=42
+                ).fit(self._fit_pixels(fit_pixels))
+            else:
+                kmeans = self._kmeans().fit(self._fit_pixels(fit_pixels))
+
+            palette_assigner = PaletteAssigner(
+                kmeans.cluster_centers_, max_memory_bytes=self._max_memory_bytes, lut_bits=self._lut_bits
+            )
+            labels, squared_error = palette_assigner.assign(image_flat, return_squared_error=True)
+            quantization_error = squared_error / len(image_flat)
+
+        # the palette is cast once, not every pixel
+        quantized_flat = kmeans.cluster_centers_.astype('uint8')[labels]
         quantized_image = quantized_flat.reshape(h, w, 3)
 
         return SegmentationResult(
             segment_labels=labels.reshape(h, w),
             colors=kmeans.cluster_centers_,
-            quantized_image=quantized_image
-        )
\ No newline at end of file
+            quantized_image=quantized_image,
+            quantization_error=quantization_error
+        )
+
+    @staticmethod
+    def _stratified_sample(image_array: np.ndarray, sample_size: int) -> np.ndarray:
+        # one random pixel per cell of a regular grid, so every part of the image is represented. The cells at
+        # the right and bottom border can be smaller, their pixel is drawn from the part inside the image
+        h, w, c = image_array.shape
+        step = max(int(np.ceil(np.sqrt(h * w / sample_size))), 1)
+
+        rng = np.random.default_rng(42)
+        row_starts, col_starts = np.meshgrid(np.arange(0, h, step), np.arange(0, w, step), indexing='ij')
+        rows = row_starts + rng.integers(0, np.minimum(step, h - row_starts))
+        cols = col_starts + rng.integers(0, np.minimum(step, w - col_starts))
+
+        return image_array[rows, cols].reshape(-1, c)
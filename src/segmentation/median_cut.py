@@ -0,0 +1,43 @@
+import numpy as np
+
+from src.segmentation.histogram import HistogramSegmenter
+
+
+class MedianCutSegmenter(HistogramSegmenter):
+    # Median cut on the color histogram: the box with the most pixels times the widest channel range is
+    # split at the pixel weighted median of that channel until there are number_of_colors boxes.
+
+    def _initial_cell_labels(self, cells: np.ndarray, counts: np.ndarray, cell_colors: np.ndarray) -> np.ndarray:
+        cell_labels = np.zeros(len(cells), dtype=np.intp)
+        boxes = [np.arange(len(cells))]
+
+        while len(boxes) < self._number_of_colors:
+            scores = []
+            for box in boxes:
+                if len(box) < 2:
+                    scores.append(-1)
+                    continue
+
+                color_range = cell_colors[box].max(axis=0) - cell_colors[box].min(axis=0)
+                scores.append(counts[box].sum() * color_range.max())
+
+            box_index = int(np.argmax(scores))
+            if scores[box_index] <= 0:
+                break
+
+            box = boxes[box_index]
+            colors = cell_colors[box]
+            channel = int(np.argmax(colors.max(axis=0) - colors.min(axis=0)))
+
+            box = box[np.argsort(colors[:, channel], kind='stable')]
+            cumulative_counts = np.cumsum(counts[box])
+            split = int(np.searchsorted(cumulative_counts, cumulative_counts[-1] / 2)) + 1
+            split = min(max(split, 1), len(box) - 1)
+
+            boxes[box_index] = box[:split]
+            boxes.append(box[split:])
+
+        for box_label, box in enumerate(boxes):
+            cell_labels[box] = box_label
+
+        return cell_labels
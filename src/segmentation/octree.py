@@ -0,0 +1,43 @@
+import numpy as np
+
+from src.segmentation.histogram import HistogramSegmenter
+
+
+class OctreeSegmenter(HistogramSegmenter):
+    # Octree color quantization without building the tree node by node: the histogram cells are the leaves
+    # of an octree of the given depth and the tree is reduced bottom up by folding the least populated
+    # nodes into their parent until at most number_of_colors leaves are left.
+
+    def _initial_cell_labels(self, cells: np.ndarray, counts: np.ndarray, cell_colors: np.ndarray) -> np.ndarray:
+        # Levels are folded completely as long as that still leaves more than number_of_colors leaves,
+        # the last level is folded only partially.
+        cells = cells.astype(np.int64)
+
+        for level in range(self._depth, 0, -1):
+            leaves, cell_leaves = np.unique(cells >> (3 * (self._depth - level)), return_inverse=True)
+            cell_leaves = cell_leaves.ravel()
+
+            if len(leaves) <= self._number_of_colors:
+                return cell_leaves
+
+            parents, leaf_parents = np.unique(leaves >> 3, return_inverse=True)
+            leaf_parents = leaf_parents.ravel()
+
+            if len(parents) > self._number_of_colors:
+                continue
+
+            # Fold the least populated leaves into their parent node. Every folded leaf removes one leaf,
+            # except the first one per parent, which turns the parent into a leaf.
+            order = np.argsort(np.bincount(cell_leaves, weights=counts), kind='stable')
+            first_of_parent = np.zeros(len(leaves), dtype=bool)
+            first_of_parent[np.unique(leaf_parents[order], return_index=True)[1]] = True
+            removed = np.arange(1, len(leaves) + 1) - np.cumsum(first_of_parent)
+
+            folded = np.zeros(len(leaves), dtype=bool)
+            folded[order[:np.searchsorted(removed, len(leaves) - self._number_of_colors) + 1]] = True
+
+            # folded leaves are replaced by their parent, parents get ids after all leaf ids of this level
+            nodes = np.where(folded[cell_leaves], len(leaves) + leaf_parents[cell_leaves], cell_leaves)
+            return np.unique(nodes, return_inverse=True)[1].ravel()
+
+        return np.zeros(len(cells), dtype=np.intp)
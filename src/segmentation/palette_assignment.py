@@ -0,0 +1,124 @@
+import numpy as np
+
+
+class PaletteAssigner:
+    # Maps every pixel of a HxWx3 uint8 image to the index of the nearest palette color.
+    #
+    # The image is processed in tiles so that the temporary buffers stay below max_memory_bytes.
+    # With lut_bits the nearest color is looked up in a precomputed (2 ** lut_bits) ** 3 color cube
+    # instead of computing distances; pixels are then matched by the center of their cube cell.
+
+    # upper bound for the tile size, larger tiles fall out of the CPU caches and get slower
+    max_tile_pixels = 2 ** 18
+
+    def __init__(self, palette: np.ndarray, max_memory_bytes: int = 64 * 2 ** 20, lut_bits: int = None):
+        self._palette = np.asarray(palette, dtype=np.float32).reshape(-1, 3)
+        self._palette_norms = (self._palette ** 2).sum(axis=1)
+        self._max_memory_bytes = max_memory_bytes
+
+        self._label_dtype = np.uint8 if len(self._palette) <= 256 else np.uint16
+
+        self._lut_bits = lut_bits
+        self._lut = None
+        if lut_bits is not None:
+            self._lut = self._build_lut(lut_bits)
+
+    @property
+    def palette(self) -> np.ndarray:
+        return self._palette
+
+    def _tile_pixels(self, bytes_per_pixel: int) -> int:
+        return max(min(self._max_memory_bytes // bytes_per_pixel, self.max_tile_pixels), 1)
+
+    def _build_lut(self, lut_bits: int) -> np.ndarray:
+        shift = 8 - lut_bits
+        cell_centers = (np.arange(2 ** lut_bits, dtype=np.float32) * 2 ** shift) + (2 ** shift - 1) / 2
+
+        cube = np.stack(np.meshgrid(cell_centers, cell_centers, cell_centers, indexing='ij'), axis=-1)
+        return self._assign_exact(cube.reshape(-1, 3))
+
+    def _assign_exact(self, pixels: np.ndarray, squared_errors: list = None) -> np.ndarray:
+        palette_size = len(self._palette)
+        labels = np.empty(len(pixels), dtype=self._label_dtype)
+
+        # float32 pixel copy, distance matrix and argmin result per pixel
+        tile_pixels = self._tile_pixels(3 * 4 + palette_size * 4 + 8)
+        tile_pixels = max(min(tile_pixels, len(pixels)), 1)
+
+        pixel_buffer = np.empty((tile_pixels, 3), dtype=np.float32)
+        distance_buffer = np.empty((tile_pixels, palette_size), dtype=np.float32)
+        scaled_palette = -2 * self._palette.T
+
+        for start in range(0, len(pixels), tile_pixels):
+            tile = pixels[start:start + tile_pixels]
+            count = len(tile)
+
+            tile_buffer = pixel_buffer[:count]
+            tile_buffer[...] = tile
+
+            # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, |p|^2 does not change the nearest color
+            distances = distance_buffer[:count]
+            np.matmul(tile_buffer, scaled_palette, out=distances)
+            distances += self._palette_norms
+
+            tile_labels = distances.argmin(axis=1)
+            labels[start:start + count] = tile_labels
+
+            if squared_errors is not None:
+                squared_errors.append(
+                    float(np.take_along_axis(distances, tile_labels[:, None], axis=1).sum()) +
+                    float(np.einsum('ij,ij->', tile_buffer, tile_buffer))
+                )
+
+        return labels
+
+    def _assign_lut(self, pixels: np.ndarray, squared_errors: list = None) -> np.ndarray:
+        labels = np.empty(len(pixels), dtype=self._label_dtype)
+        shift = 8 - self._lut_bits
+        index_dtype = np.uint16 if 3 * self._lut_bits <= 16 else np.uint32
+
+        # cube index and channel buffer per pixel, plus a float32 copy when the error is measured
+        tile_pixels = self._tile_pixels(
+            2 * np.dtype(index_dtype).itemsize + (12 if squared_errors is not None else 0)
+        )
+        index_buffer = np.empty(min(tile_pixels, len(pixels)), dtype=index_dtype)
+        channel_buffer = np.empty_like(index_buffer)
+
+        for start in range(0, len(pixels), tile_pixels):
+            tile = pixels[start:start + tile_pixels]
+            count = len(tile)
+
+            index = index_buffer[:count]
+            channel = channel_buffer[:count]
+
+            np.right_shift(tile[:, 0], shift, out=index, dtype=index_dtype, casting='unsafe')
+            for channel_index in (1, 2):
+                np.left_shift(index, self._lut_bits, out=index)
+                np.right_shift(tile[:, channel_index], shift, out=channel, dtype=index_dtype, casting='unsafe')
+                index |= channel
+
+            tile_labels = labels[start:start + count]
+            np.take(self._lut, index, out=tile_labels)
+
+            if squared_errors is not None:
+                difference = tile.astype(np.float32) - self._palette[tile_labels]
+                squared_errors.append(float(np.einsum('ij,ij->', difference, difference)))
+
+        return labels
+
+    def assign(self, image_array: np.ndarray, return_squared_error: bool = False):
+        image_array = np.asarray(image_array)
+        pixels = image_array.reshape(-1, 3)
+
+        squared_errors = [] if return_squared_error else None
+
+        if self._lut is not None and image_array.dtype == np.uint8:
+            labels = self._assign_lut(pixels, squared_errors)
+        else:
+            labels = self._assign_exact(pixels, squared_errors)
+
+        labels = labels.reshape(image_array.shape[:-1])
+
+        if return_squared_error:
+            return labels, sum(squared_errors)
+        return labels
@@ -0,0 +1,277 @@
+import math
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+from src.instrumentation import StageTimer
+from src.segmentation import ImageSegmenter, SegmentationResult
+from src.utility import read_only
+
+# Rec. 601 luma of an RGB color
+LUMINANCE_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+
+class PreprocessingStep(ABC):
+    # name of the stage the step is timed as
+    name: str = None
+    # whether the step smooths the image, in place of the blur of the segmenters
+    smoothing: bool = False
+
+    @abstractmethod
+    def apply(self, image_array: np.ndarray) -> np.ndarray:
+        raise NotImplementedError()
+
+
+class Downscale(PreprocessingStep):
+    # area resampling to at most megapixels, the label map is scaled back to the size of the image afterwards
+    name = 'downscale'
+
+    def __init__(self, megapixels: float = 2.0):
+        self._megapixels: float = megapixels
+
+    def apply(self, image_array: np.ndarray) -> np.ndarray:
+        import cv2
+
+        height, width = image_array.shape[:2]
+        max_pixels = self._megapixels * 10 ** 6
+        if height * width <= max_pixels:
+            return image_array
+
+        scale = math.sqrt(max_pixels / (height * width))
+        size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        return cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
+
+
+class GaussianBlur(PreprocessingStep):
+    # the smoothing the segmenters apply themselves by default
+    name = 'gaussian_blur'
+    smoothing = True
+
+    def __init__(self, size: int = 5):
+        self._size: int = size
+
+    def apply(self, image_array: np.ndarray) -> np.ndarray:
+        import cv2
+
+        return cv2.GaussianBlur(image_array, (self._size, self._size), 0)
+
+
+class BilateralFilter(PreprocessingStep):
+    # smooths within areas of similar color and keeps the edges between them, OpenCV spreads it over its threads
+    name = 'bilateral_filter'
+    smoothing = True
+
+    def __init__(self, diameter: int = 9, sigma_color: float = 40.0, sigma_space: float = 5.0, iterations: int = 1):
+        self._diameter: int = diameter
+        self._sigma_color: float = sigma_color
+        self._sigma_space: float = sigma_space
+        self._iterations: int = iterations
+
+    def apply(self, image_array: np.ndarray) -> np.ndarray:
+        import cv2
+
+        for _ in range(self._iterations):
+            image_array = cv2.bilateralFilter(image_array, self._diameter, self._sigma_color, self._sigma_space)
+        return image_array
+
+
+class MeanShiftFilter(PreprocessingStep):
+    # flattens textures into patches of one color, the strongest of the filters and by far the slowest. OpenCV
+    # runs it on a single thread, so it runs on horizontal bands in parallel instead (threads defaults to the
+    # OpenCV threads), the result can differ from a single run close to the band borders
+    name = 'mean_shift_filter'
+    smoothing = True
+
+    def __init__(self, spatial_radius: int = 8, color_radius: float = 20.0, max_level: int = 1, threads: int = None):
+        self._spatial_radius: int = spatial_radius
+        self._color_radius: float = color_radius
+        self._max_level: int = max_level
+        self._threads: int = threads
+
+    def apply(self, image_array: np.ndarray) -> np.ndarray:
+        import cv2
+
+        def mean_shift(band: np.ndarray) -> np.ndarray:
+            return cv2.pyrMeanShiftFiltering(band, self._spatial_radius, self._color_radius, maxLevel=self._max_level)
+
+        overlap = 2 * self._spatial_radius * 2 ** self._max_level
+        return in_bands(mean_shift, image_array, overlap, self._threads or cv2.getNumThreads())
+
+
+class GuidedFilter(PreprocessingStep):
+    # self guided filter (He et al.) per channel, edge-preserving smoothing from box filters only. eps is the
+    # variance (on the 0..1 scale) below which an area is flattened
+    name = 'guided_filter'
+    smoothing = True
+
+    def __init__(self, radius: int = 4, eps: float = 0.01):
+        self._radius: int = radius
+        self._eps: float = eps
+
+    def apply(self, image_array: np.ndarray) -> np.ndarray:
+        import cv2
+
+        size = (2 * self._radius + 1, 2 * self._radius + 1)
+        image = image_array.astype(np.float32) / 255
+
+        mean = cv2.boxFilter(image, -1, size)
+        variance = cv2.boxFilter(image * image, -1, size) - mean * mean
+        a = variance / (variance + self._eps)
+        b = mean - a * mean
+
+        filtered = cv2.boxFilter(a, -1, size) * image + cv2.boxFilter(b, -1, size)
+        return np.clip(filtered * 255 + 0.5, 0, 255).astype(np.uint8)
+
+
+# name of a step in a preprocessing spec, see parse_preprocessor
+STEPS = {
+    'downscale': Downscale,
+    'gaussian_blur': GaussianBlur,
+    'bilateral': BilateralFilter,
+    'mean_shift': MeanShiftFilter,
+    'guided': GuidedFilter,
+}
+
+
+def in_bands(function: Callable[[np.ndarray], np.ndarray], image_array: np.ndarray, overlap: int, bands: int):
+    # runs a size preserving function on overlapping horizontal bands in parallel threads (OpenCV releases
+    # the GIL) and stitches the results together without the overlaps
+    height = image_array.shape[0]
+    bands = max(min(bands, height // max(overlap, 1)), 1)
+    if bands == 1:
+        return function(image_array)
+
+    bounds = np.linspace(0, height, bands + 1).astype(int)
+
+    def run(index: int) -> np.ndarray:
+        start, stop = bounds[index], bounds[index + 1]
+        top, bottom = max(start - overlap, 0), min(stop + overlap, height)
+        return function(image_array[top:bottom])[start - top:stop - top]
+
+    with ThreadPoolExecutor(max_workers=bands) as executor:
+        return np.concatenate(list(executor.map(run, range(bands))), axis=0)
+
+
+def resize_labels(labels: np.ndarray, shape) -> np.ndarray:
+    # nearest neighbor, every pixel takes the label of the pixel its center falls into
+    height, width = shape
+    rows = ((np.arange(height) + 0.5) * labels.shape[0] / height).astype(np.intp)
+    cols = ((np.arange(width) + 0.5) * labels.shape[1] / width).astype(np.intp)
+    return labels[np.ix_(rows, cols)]
+
+
+def median_filter_labels(labels: np.ndarray, size: int, colors: np.ndarray = None) -> np.ndarray:
+    # label numbers are arbitrary, with the colors of the labels the median is taken in the order of their
+    # luminance, so a pixel gets a label that is present around it and of a similar brightness.
+    # OpenCV filters uint8 maps with any size, uint16 ones up to 5
+    import cv2
+
+    order = None
+    if colors is not None:
+        order = np.argsort(np.asarray(colors, dtype=np.float64) @ LUMINANCE_WEIGHTS)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        ranked = rank[labels]
+    else:
+        ranked = labels
+
+    number_of_labels = int(ranked.max(initial=0)) + 1
+    if number_of_labels <= 256:
+        filtered = cv2.medianBlur(ranked.astype(np.uint8), size)
+    elif number_of_labels <= 2 ** 16 and size <= 5:
+        filtered = cv2.medianBlur(ranked.astype(np.uint16), size)
+    else:
+        from scipy.ndimage import median_filter
+        filtered = median_filter(ranked, size=size)
+
+    if order is not None:
+        filtered = order[filtered]
+    return filtered.astype(labels.dtype, copy=False)
+
+
+def quantization_error(image_array: np.ndarray, quantized_image: np.ndarray) -> float:
+    difference = image_array.astype(np.int16) - quantized_image
+    return float(np.square(difference, dtype=np.int32).sum(dtype=np.int64)) / (difference.size // 3)
+
+
+class Preprocessor:
+    # Pipeline in front of any ImageSegmenter. The steps run on the image in order before the segmentation,
+    # afterwards the label map is scaled back to the size of the image (if a step downscaled it) and optionally
+    # median filtered, which removes speckles before they become regions of their own. Every step is timed
+    # as a nested stage. The quantization error is measured against the unfiltered image, the filters are
+    # part of the approximation.
+
+    def __init__(self, steps: Sequence[PreprocessingStep] = (), label_median_size: int = None):
+        if label_median_size and (label_median_size < 3 or label_median_size % 2 == 0):
+            raise ValueError(f'label_median_size must be odd and at least 3, got {label_median_size!r}')
+
+        self._steps: List[PreprocessingStep] = list(steps)
+        # odd, in pixels
+        self._label_median_size: int = label_median_size
+
+    @property
+    def steps(self) -> List[PreprocessingStep]:
+        return list(self._steps)
+
+    @property
+    def smoothing(self) -> bool:
+        return any(step.smoothing for step in self._steps)
+
+    def segment(
+            self, image_segmenter: ImageSegmenter, image_array: np.ndarray, stage_timer: StageTimer = None
+    ) -> SegmentationResult:
+        timer = stage_timer or StageTimer()
+
+        preprocessed = image_array
+        for step in self._steps:
+            with timer.stage(step.name):
+                preprocessed = step.apply(preprocessed)
+
+        # the quantization error is measured against the image, it must not be blurred in place
+        if preprocessed is image_array:
+            preprocessed = read_only(image_array)
+
+        with timer.stage('segment_preprocessed'):
+            result = image_segmenter.segment(preprocessed)
+
+        if not self._steps and not self._label_median_size:
+            return result
+
+        labels = result.segment_labels
+        if labels.shape != image_array.shape[:2]:
+            with timer.stage('upscale_labels'):
+                labels = resize_labels(labels, image_array.shape[:2])
+
+        if self._label_median_size:
+            with timer.stage('label_median'):
+                labels = median_filter_labels(labels, self._label_median_size, result.colors)
+
+        quantized_image = np.asarray(result.colors).astype('uint8')[labels]
+        return SegmentationResult(
+            segment_labels=labels,
+            colors=result.colors,
+            quantized_image=quantized_image,
+            quantization_error=quantization_error(image_array, quantized_image)
+        )
+
+
+def parse_preprocessor(specs: Sequence[str]) -> Preprocessor:
+    # 'name' or 'name:value' per step, the value is the first parameter of the step, e.g.
+    # ('downscale:2', 'bilateral', 'label_median:5') for 2 megapixels and a 5x5 median of the label map
+    steps = []
+    label_median_size = None
+
+    for spec in specs:
+        name, _, value = spec.partition(':')
+        value = (int(value) if value.isdigit() else float(value)) if value else None
+
+        if name == 'label_median':
+            label_median_size = value or 5
+        elif name in STEPS:
+            steps.append(STEPS[name]() if value is None else STEPS[name](value))
+        else:
+            raise ValueError(f'Unknown preprocessing step {name!r}, expected one of {sorted(STEPS) + ["label_median"]}')
+
+    return Preprocessor(steps, label_median_size)
@@ -0,0 +1,481 @@
+import asyncio
+import base64
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from src.batch import limit_threads
+
+# Asyncio front-end of the generator. Requests wait in a bounded queue and are run on a pool of worker
+# processes, every worker keeps one generator. Small requests that arrive together while all other workers
+# are busy are sent to a worker as one batch. The workers report the progress of a request over one multiprocessing queue, as events:
+#
+#     queued, started, stage (one per finished pipeline stage), artifact (preview.png, outline.png,
+#     labels.json, paint_by_numbers.png, paint.png, legend.txt, in this order), then done or failed
+#
+# serve() exposes the service over HTTP: POST /generate with the image file as body answers with a chunked
+# stream of JSON lines, one event per line with the artifact data base64 encoded.
+
+# zlib level of the previews, they are sent once and should be fast to encode
+PREVIEW_COMPRESS_LEVEL = 1
+
+# state of a worker process, set by _initialize_worker
+_worker = {}
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class ServiceEvent:
+    def __init__(self, job_id: int, kind: str, info: dict = None, data: bytes = None):
+        self.job_id: int = job_id
+        # queued, started, stage, artifact, done or failed
+        self.kind: str = kind
+        self.info: dict = info or {}
+        # content of an artifact
+        self.data: bytes = data
+
+    def to_dict(self) -> dict:
+        event = {'job': self.job_id, 'kind': self.kind, **self.info}
+        if self.data is not None:
+            event['data'] = base64.b64encode(self.data).decode('ascii')
+        return event
+
+    @classmethod
+    def from_dict(cls, event: dict) -> 'ServiceEvent':
+        event = dict(event)
+        data = event.pop('data', None)
+        return cls(event.pop('job'), event.pop('kind'), event, base64.b64decode(data) if data is not None else None)
+
+    @property
+    def finished(self) -> bool:
+        return self.kind in ('done', 'failed')
+
+
+class ServiceJob:
+    def __init__(self, job_id: int, image: bytes, pixels: int):
+        self.job_id: int = job_id
+        self.image: bytes = image
+        self.pixels: int = pixels
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._finished = False
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def _put(self, event: ServiceEvent):
+        if not self._finished:
+            self._finished = event.finished
+            self._events.put_nowait(event)
+
+    async def events(self) -> AsyncIterator[ServiceEvent]:
+        while True:
+            event = await self._events.get()
+            yield event
+
+            if event.finished:
+                return
+
+    async def artifacts(self) -> Dict[str, bytes]:
+        # waits for the job, raises a RuntimeError with the worker traceback if it failed
+        artifacts = {}
+
+        async for event in self.events():
+            if event.kind == 'artifact':
+                artifacts[event.info['name']] = event.data
+            elif event.kind == 'failed':
+                raise RuntimeError(event.info.get('error'))
+
+        return artifacts
+
+
+def _png(image, compress_level: int = 6) -> bytes:
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def _initialize_worker(generator_factory: Callable, threads: int, events):
+    limit_threads(threads)
+    _worker['generator'] = generator_factory()
+    _worker['events'] = events
+
+
+def _run_jobs(jobs: List[Tuple[int, bytes]]):
+    from src.instrumentation import StageHook, StageTimer
+
+    generator = _worker['generator']
+    events = _worker['events']
+
+    class EventHook(StageHook):
+        def __init__(self, job_id):
+            self._job_id = job_id
+
+        def stage_finished(self, record):
+            if record.depth == 0:
+                events.put((self._job_id, 'stage', {'name': record.name, 'wall_time': record.wall_time}, None))
+
+    for job_id, image in jobs:
+        def on_partial(name, value, job_id=job_id):
+            if name == 'quantized_image':
+                events.put((job_id, 'artifact', {'name': 'preview.png'}, _png(value, PREVIEW_COMPRESS_LEVEL)))
+            elif name == 'boundaries':
+                events.put((job_id, 'artifact', {'name': 'outline.png'}, _png(~value, PREVIEW_COMPRESS_LEVEL)))
+            elif name == 'placements':
+                labels = [
+                    {
+                        'region': placement.region_label,
+                        'number': placement.number,
+                        'position': [int(coordinate) for coordinate in placement.position],
+                        'anchor': [int(coordinate) for coordinate in placement.anchor],
+                        'leader': placement.leader
+                    }
+                    for placement in value.placements
+                ]
+                events.put((job_id, 'artifact', {'name': 'labels.json'}, json.dumps(labels).encode()))
+
+        try:
+            events.put((job_id, 'started', {'worker': os.getpid(), 'batch_size': len(jobs)}, None))
+            result = generator.generate(image, StageTimer([EventHook(job_id)]), on_partial)
+
+            events.put((job_id, 'artifact', {'name': 'paint_by_numbers.png'}, _png(result.colored_image)))
+            events.put((job_id, 'artifact', {'name': 'paint.png'}, _png(result.outline_image)))
+            events.put((job_id, 'artifact', {'name': 'legend.txt'}, result.legend.encode()))
+            events.put((job_id, 'done', {'stages': result.stages}, None))
+        except Exception:
+            events.put((job_id, 'failed', {'error': traceback.format_exc()}, None))
+
+
+class GenerationService:
+    # Use as async context manager (or start() / close()), then submit() the images and iterate the events
+    # of the returned jobs. At most workers batches run at a time, queue_size more requests can wait, further
+    # ones are rejected with ServiceBusy (or wait for room with wait=True).
+
+    def __init__(
+            self,
+            generator_factory: Callable,
+            workers: int = 1,
+            threads_per_worker: int = 1,
+            queue_size: int = 16,
+            small_image_pixels: int = 512 * 512,
+            max_batch_size: int = 8,
+            batch_window: float = 0.01
+    ):
+        self._generator_factory = generator_factory
+        self._workers = workers
+        self._threads_per_worker = threads_per_worker
+        self._queue_size = queue_size
+        # images up to small_image_pixels are batched when no other worker is free, up to max_batch_size of
+        # them that arrive within batch_window seconds of the first one. With free workers the waiting ones
+        # are spread over them
+        self._small_image_pixels = small_image_pixels
+        self._max_batch_size = max_batch_size
+        self._batch_window = batch_window
+
+        self._job_ids = itertools.count(1)
+        self._jobs: Dict[int, ServiceJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        # a large job taken from the queue while a batch of small ones was filled
+        self._held: Optional[ServiceJob] = None
+        # workers without a batch, set by the dispatcher
+        self._free_workers: int = workers
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._events = None
+        self._event_thread: Optional[threading.Thread] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+
+        # spawned like the batch workers, see run_batch
+        context = multiprocessing.get_context('spawn')
+        self._events = context.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=context,
+            initializer=_initialize_worker,
+            initargs=(self._generator_factory, self._threads_per_worker, self._events)
+        )
+
+        self._event_thread = threading.Thread(target=self._forward_events, name='service-events', daemon=True)
+        self._event_thread.start()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+
+        if self._executor is not None:
+            await self._loop.run_in_executor(None, self._executor.shutdown)
+
+        if self._events is not None:
+            self._events.put(None)
+            await self._loop.run_in_executor(None, self._event_thread.join)
+            self._events.close()
+
+        for job in list(self._jobs.values()):
+            job._put(ServiceEvent(job.job_id, 'failed', {'error': 'the service was closed'}))
+        self._jobs.clear()
+
+    async def submit(self, image: bytes, wait: bool = False) -> ServiceJob:
+        # image is an encoded image file, invalid ones raise a ValueError right away
+        try:
+            with Image.open(io.BytesIO(image)) as opened:
+                width, height = opened.size
+        except Exception as error:
+            raise ValueError(f'Not an image: {error}') from error
+
+        job = ServiceJob(next(self._job_ids), bytes(image), width * height)
+        job._put(ServiceEvent(job.job_id, 'queued', {'waiting': self._queue.qsize()}))
+
+        # known before it is queued, its events can arrive as soon as the dispatcher takes it
+        self._jobs[job.job_id] = job
+
+        try:
+            if wait:
+                await self._queue.put(job)
+            else:
+                self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            del self._jobs[job.job_id]
+            raise ServiceBusy(f'{self._queue_size} requests are waiting already') from None
+        except BaseException:
+            del self._jobs[job.job_id]
+            raise
+
+        return job
+
+    async def _take(self) -> ServiceJob:
+        if self._held is not None:
+            job, self._held = self._held, None
+            return job
+
+        return await self._queue.get()
+
+    async def _next_batch(self, free_workers: int) -> List[ServiceJob]:
+        # free_workers includes the worker the batch is for
+        batch = [await self._take()]
+        if batch[0].pixels > self._small_image_pixels:
+            return batch
+
+        if free_workers > 1:
+            # the batch shares no work between its jobs, so the waiting ones are spread over the idle workers
+            # instead of waiting for more of them
+            batch_size = min(math.ceil((1 + self._queue.qsize()) / free_workers), self._max_batch_size)
+            while len(batch) < batch_size:
+                job = self._queue.get_nowait()
+                if job.pixels > self._small_image_pixels:
+                    self._held = job
+                    break
+
+                batch.append(job)
+
+            return batch
+
+        deadline = self._loop.time() + self._batch_window
+        while len(batch) < self._max_batch_size:
+            try:
+                job = await asyncio.wait_for(self._queue.get(), max(deadline - self._loop.time(), 0))
+            except asyncio.TimeoutError:
+                break
+
+            if job.pixels > self._small_image_pixels:
+                self._held = job
+                break
+
+            batch.append(job)
+
+        return batch
+
+    async def _dispatch(self):
+        # one batch per free worker, the rest waits in the bounded queue
+        slots = asyncio.Semaphore(self._workers)
+        self._free_workers = self._workers
+
+        while True:
+            await slots.acquire()
+            batch = await self._next_batch(self._free_workers)
+            self._free_workers -= 1
+
+            future = self._loop.run_in_executor(
+                self._executor, _run_jobs, [(job.job_id, job.image) for job in batch]
+            )
+            future.add_done_callback(lambda future, batch=batch: self._batch_finished(future, batch, slots))
+
+    def _batch_finished(self, future: asyncio.Future, batch: List[ServiceJob], slots: asyncio.Semaphore):
+        self._free_workers += 1
+        slots.release()
+
+        if future.cancelled() or future.exception() is None:
+            return
+
+        # the worker died (e.g. out of memory), the events of the jobs it finished are already forwarded
+        error = ''.join(traceback.format_exception(future.exception()))
+        for job in batch:
+            self._finish(ServiceEvent(job.job_id, 'failed', {'error': error}))
+
+    def _forward_events(self):
+        # runs on a thread, the multiprocessing queue has no asyncio interface
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+
+            self._loop.call_soon_threadsafe(self._finish, ServiceEvent(*event))
+
+    def _finish(self, event: ServiceEvent):
+        job = self._jobs.get(event.job_id)
+        if job is None:
+            return
+
+        job._put(event)
+        if event.finished:
+            del self._jobs[event.job_id]
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) < 2:
+        raise ValueError('Malformed request')
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+    return request_line[0], request_line[1], headers, body
+
+
+async def _respond(writer: asyncio.StreamWriter, status: str, body: dict):
+    data = json.dumps(body).encode()
+    writer.write(
+        f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n'
+        f'Connection: close\r\n\r\n'.encode() + data
+    )
+    await writer.drain()
+
+
+async def _handle_connection(service: GenerationService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        try:
+            method, path, headers, body = await _read_request(reader)
+        except (ValueError, asyncio.IncompleteReadError):
+            await _respond(writer, '400 Bad Request', {'error': 'malformed request'})
+            return
+
+        if (method, path) != ('POST', '/generate'):
+            await _respond(writer, '404 Not Found', {'error': f'{method} {path} is not served'})
+            return
+
+        try:
+            job = await service.submit(body)
+        except ServiceBusy as error:
+            await _respond(writer, '503 Service Unavailable', {'error': str(error)})
+            return
+        except ValueError as error:
+            await _respond(writer, '400 Bad Request', {'error': str(error)})
+            return
+
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n'
+            b'Connection: close\r\n\r\n'
+        )
+
+        # every event is one chunk, sent as soon as it arrives
+        async for event in job.events():
+            line = json.dumps(event.to_dict()).encode() + b'\n'
+            writer.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+            await writer.drain()
+
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service: GenerationService, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+    # port 0 picks a free port, see server.sockets[0].getsockname()
+    return await asyncio.start_server(
+        lambda reader, writer: _handle_connection(service, reader, writer), host, port
+    )
+
+
+class ServiceClient:
+    # HTTP client of serve(), e.g. for a server started in the same process in tests.
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8080):
+        self._host = host
+        self._port = port
+
+    async def generate(self, image: bytes) -> AsyncIterator[ServiceEvent]:
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+
+        try:
+            writer.write(
+                f'POST /generate HTTP/1.1\r\nHost: {self._host}\r\nContent-Type: application/octet-stream\r\n'
+                f'Content-Length: {len(image)}\r\nConnection: close\r\n\r\n'.encode() + image
+            )
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            if status != 200:
+                error = json.loads(await reader.readexactly(int(headers['content-length'])))['error']
+                if status == 503:
+                    raise ServiceBusy(error)
+                raise ValueError(error)
+
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                if size == 0:
+                    return
+
+                chunk = await reader.readexactly(size)
+                await reader.readexactly(2)
+                yield ServiceEvent.from_dict(json.loads(chunk))
+        finally:
+            writer.close()
@@ -0,0 +1,310 @@
+import os
+import tempfile
+
+import numpy as np
+
+from src.label_placement import LabelPlacer, LabelPlacement
+from src.paint_by_numbers_image_generator import PaintByNumbersImageGenerator
+from src.segmentation import ImageSegmenter
+from src.segmentation.palette_assignment import PaletteAssigner
+from src.output_writer import OutputWriter
+from src.rendering import Renderer, darken, find_boundaries
+from src.utility import legend_text, load_image_memmap, render_palette
+
+
+class TiledLabelMap:
+    def __init__(self, segment_labels, labels, colors, region_palette_indexes, region_areas):
+        # full resolution maps, memory-mapped
+        self.segment_labels: np.ndarray = segment_labels
+        self.labels: np.ndarray = labels
+        self.colors: np.ndarray = colors
+        # palette index and pixel count of every region label (index 0 is unused)
+        self.region_palette_indexes: np.ndarray = region_palette_indexes
+        self.region_areas: np.ndarray = region_areas
+
+
+class TiledPaintByNumbersImageGenerator(PaintByNumbersImageGenerator):
+    # Out-of-core variant for very large inputs. The palette is fitted on a subsample, afterwards the image
+    # is streamed through blur and palette assignment tile by tile. Connected components are labeled per tile
+    # and stitched across the tile seams with a union-find (graph components) over the seam label pairs.
+    # All full resolution arrays are memory-mapped files in the work directory, so the RAM needed per stage
+    # is bounded by the tile size (plus one entry per region). Small regions are dropped (no merge mode).
+    # Only generate_image is tiled, generate() takes an image that is in memory already and runs in memory.
+
+    # margin needed by the 5x5 Gaussian blur, tiles are blurred with it so the seams are identical
+    blur_margin = 2
+
+    def __init__(
+            self,
+            image_segmenter: ImageSegmenter,
+            label_placer: LabelPlacer = None,
+            tile_size: int = 2048,
+            sample_pixels: int = 2 ** 20,
+            min_size: int = 150,
+            lut_bits: int = None,
+            work_directory: str = None,
+            image_format: str = 'png',
+            png_compress_level: int = 6
+    ):
+        super().__init__(
+            image_segmenter, label_placer, min_size=min_size, image_format=image_format,
+            png_compress_level=png_compress_level
+        )
+
+        self._tile_size = tile_size
+        # pixels the palette is fitted on
+        self._sample_pixels = sample_pixels
+        self._lut_bits = lut_bits
+        self._work_directory = work_directory
+
+    def _tiles(self, height: int, width: int):
+        for y0 in range(0, height, self._tile_size):
+            for x0 in range(0, width, self._tile_size):
+                yield y0, min(y0 + self._tile_size, height), x0, min(x0 + self._tile_size, width)
+
+    def generate_image(self, image_path: str, output_folder: str = None, output_writer: OutputWriter = None) -> dict:
+        # The full resolution outputs are streamed from the memory maps into files, only the small ones use the
+        # writer. An output_writer must therefore write into a folder, it is left open for the caller to close.
+        timer = self._stage_timer
+        timer.clear()
+
+        owns_output_writer = output_writer is None
+        if owns_output_writer:
+            if output_folder is None:
+                raise ValueError('The tiled generator writes its outputs into a folder, output_folder is required')
+            output_writer = OutputWriter(output_folder, max_workers=1, png_compress_level=self._png_compress_level)
+        elif output_writer.in_memory:
+            raise ValueError('The tiled generator writes its outputs into a folder, not into an in-memory writer')
+
+        try:
+            with tempfile.TemporaryDirectory(dir=self._work_directory) as work_directory:
+                with timer.stage('load_image'):
+                    image_array = load_image_memmap(image_path, os.path.join(work_directory, 'image.npy'))
+
+                with timer.stage('segment'):
+                    label_map = self._segment_tiled(image_array, work_directory)
+
+                color_to_number = self._assign_numbers(label_map.colors)
+                output_writer.submit_image('pallete.jpg', render_palette(color_to_number))
+                output_writer.submit_text('legend.txt', legend_text(color_to_number))
+
+                with timer.stage('place_labels'):
+                    placements = self._place_labels_tiled(label_map)
+
+                output_image_path = output_writer.path(self.output_image_name)
+                with timer.stage('render'):
+                    self._render_tiled(
+                        label_map, placements, work_directory, output_image_path, output_writer.path('paint.jpg')
+                    )
+
+                # drop the references to the memory maps before the directory is removed
+                del image_array, label_map
+        finally:
+            # also when the run fails, so the writer threads and the queued outputs do not leak
+            if owns_output_writer:
+                with timer.stage('wait_for_outputs'):
+                    output_writer.close()
+
+        print(f"Paint-by-numbers image saved to {output_image_path}")
+        if owns_output_writer:
+            print(f"Legend saved to {output_writer.path('legend.txt')}")
+
+        return timer.report()
+
+    def _segment_tiled(self, image_array: np.ndarray, work_directory: str) -> TiledLabelMap:
+        import cv2
+        from skimage.measure import label
+
+        height, width = image_array.shape[:2]
+
+        step = max(int(np.ceil(np.sqrt(height * width / self._sample_pixels))), 1)
+        colors = np.asarray(self._image_segmenter.segment(np.ascontiguousarray(image_array[::step, ::step])).colors)
+        palette_assigner = PaletteAssigner(colors, lut_bits=self._lut_bits)
+
+        segment_labels = np.lib.format.open_memmap(
+            os.path.join(work_directory, 'segment_labels.npy'), mode='w+',
+            dtype=np.uint8 if len(colors) <= 256 else np.uint16, shape=(height, width)
+        )
+        labels = np.lib.format.open_memmap(
+            os.path.join(work_directory, 'labels.npy'), mode='w+', dtype=np.uint32, shape=(height, width)
+        )
+
+        component_palette_indexes = [np.zeros(1, dtype=segment_labels.dtype)]
+        seam_pairs = []
+        next_label = 1
+        margin = self.blur_margin
+
+        for y0, y1, x0, x1 in self._stage_timer.progress(list(self._tiles(height, width)), 'segment tiles'):
+            py0, py1 = max(y0 - margin, 0), min(y1 + margin, height)
+            px0, px1 = max(x0 - margin, 0), min(x1 + margin, width)
+
+            blurred = cv2.GaussianBlur(np.asarray(image_array[py0:py1, px0:px1]), (5, 5), 0)
+            tile_segment_labels = palette_assigner.assign(blurred[y0 - py0:y1 - py0, x0 - px0:x1 - px0])
+            segment_labels[y0:y1, x0:x1] = tile_segment_labels
+
+            tile_labels, number_of_components = label(
+                tile_segment_labels.astype(np.int32), background=-1, connectivity=1, return_num=True
+            )
+            tile_palette_indexes = np.zeros(number_of_components + 1, dtype=segment_labels.dtype)
+            tile_palette_indexes[tile_labels.ravel()] = tile_segment_labels.ravel()
+
+            tile_labels = (tile_labels + (next_label - 1)).astype(np.uint32)
+            labels[y0:y1, x0:x1] = tile_labels
+            component_palette_indexes.append(tile_palette_indexes[1:])
+            next_label += number_of_components
+
+            # the tiles to the left and above are done, connect equal colors across the seams
+            if x0 > 0:
+                same = segment_labels[y0:y1, x0 - 1] == tile_segment_labels[:, 0]
+                seam_pairs.append(np.stack((labels[y0:y1, x0 - 1][same], tile_labels[:, 0][same])))
+            if y0 > 0:
+                same = segment_labels[y0 - 1, x0:x1] == tile_segment_labels[0]
+                seam_pairs.append(np.stack((labels[y0 - 1, x0:x1][same], tile_labels[0][same])))
+
+        component_palette_indexes = np.concatenate(component_palette_indexes)
+        component_regions = self._stitch_components(next_label, seam_pairs)
+
+        # areas of the stitched regions, then drop the small ones with one more lookup table
+        region_areas = np.zeros(int(component_regions.max()) + 1, dtype=np.int64)
+        for y0, y1, x0, x1 in self._tiles(height, width):
+            region_areas += np.bincount(component_regions[labels[y0:y1, x0:x1]].ravel(), minlength=len(region_areas))
+
+        keep = region_areas >= self._min_size
+        keep[0] = False
+        region_lookup = np.zeros(len(region_areas), dtype=np.uint32)
+        region_lookup[keep] = np.arange(1, np.count_nonzero(keep) + 1)
+
+        region_palette_indexes = np.zeros(np.count_nonzero(keep) + 1, dtype=component_palette_indexes.dtype)
+        region_palette_indexes[region_lookup[component_regions]] = component_palette_indexes
+        region_palette_indexes[0] = 0
+
+        lookup = region_lookup[component_regions]
+        for y0, y1, x0, x1 in self._tiles(height, width):
+            labels[y0:y1, x0:x1] = lookup[labels[y0:y1, x0:x1]]
+
+        segment_labels.flush()
+        labels.flush()
+
+        return TiledLabelMap(
+            segment_labels=segment_labels,
+            labels=labels,
+            colors=colors,
+            region_palette_indexes=region_palette_indexes,
+            region_areas=np.r_[0, region_areas[keep]]
+        )
+
+    @staticmethod
+    def _stitch_components(number_of_labels: int, seam_pairs) -> np.ndarray:
+        # region (1 based) of every tile component label, label 0 stays 0
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        if seam_pairs:
+            pairs = np.unique(np.concatenate(seam_pairs, axis=1), axis=1)
+        else:
+            pairs = np.zeros((2, 0), dtype=np.uint32)
+
+        graph = coo_matrix(
+            (np.ones(pairs.shape[1], dtype=np.int8), (pairs[0], pairs[1])),
+            shape=(number_of_labels, number_of_labels)
+        )
+        _, components = connected_components(graph, directed=False)
+
+        # renumber so that label 0 is region 0 and the others start at 1
+        _, regions = np.unique(components[1:], return_inverse=True)
+        return np.r_[0, regions.ravel() + 1]
+
+    def _place_labels_tiled(self, label_map: TiledLabelMap):
+        # every region gets the placement with the largest clearance over the tiles it appears in
+        height, width = label_map.labels.shape
+        best = {}
+
+        for y0, y1, x0, x1 in self._tiles(height, width):
+            tile_labels = np.asarray(label_map.labels[y0:y1, x0:x1])
+            region_labels = np.flatnonzero(np.bincount(tile_labels.ravel()))
+
+            region_numbers = {
+                region_label: int(label_map.region_palette_indexes[region_label]) + 1
+                for region_label in region_labels.tolist()
+                if region_label != 0
+            }
+
+            for placement in self._label_placer.place_labels(tile_labels, region_numbers):
+                current = best.get(placement.region_label)
+                score = (not placement.leader, placement.clearance or 0)
+
+                if current is None or score > (not current.leader, current.clearance or 0):
+                    best[placement.region_label] = self._shifted(placement, x0, y0)
+
+        return [best[region_label] for region_label in sorted(best)]
+
+    @staticmethod
+    def _shifted(placement: LabelPlacement, dx: int, dy: int) -> LabelPlacement:
+        return LabelPlacement(
+            region_label=placement.region_label,
+            number=placement.number,
+            position=(placement.position[0] + dx, placement.position[1] + dy),
+            anchor=(placement.anchor[0] + dx, placement.anchor[1] + dy),
+            font=placement.font,
+            leader=placement.leader,
+            clearance=placement.clearance
+        )
+
+    def _render_tiled(self, label_map: TiledLabelMap, placements, work_directory, output_image_path, outline_path):
+        import cv2
+
+        height, width = label_map.labels.shape
+        palette_bgr = np.asarray(label_map.colors).astype('uint8')[:, ::-1]
+
+        colored = np.lib.format.open_memmap(
+            os.path.join(work_directory, 'colored.npy'), mode='w+', dtype=np.uint8, shape=(height, width, 3)
+        )
+        outline = np.lib.format.open_memmap(
+            os.path.join(work_directory, 'outline.npy'), mode='w+', dtype=np.uint8, shape=(height, width)
+        )
+
+        # the labels of all tiles are blitted from the same glyph atlases
+        renderer = Renderer()
+
+        # label boxes, to find the labels that reach into a tile
+        boxes = np.array([
+            (*placement.position, *renderer.atlas(placement.font).text_size(str(placement.number)))
+            for placement in placements
+        ]).reshape(-1, 4)
+
+        for y0, y1, x0, x1 in self._tiles(height, width):
+            # one pixel margin so the boundaries at the seams match the full image
+            py0, py1 = max(y0 - 1, 0), min(y1 + 1, height)
+            px0, px1 = max(x0 - 1, 0), min(x1 + 1, width)
+
+            boundaries = find_boundaries(
+                np.asarray(label_map.labels[py0:py1, px0:px1])
+            )[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+            colored_tile = palette_bgr[label_map.segment_labels[y0:y1, x0:x1]]
+            outline_tile = np.where(boundaries, 0, 255).astype(np.uint8)
+
+            # leader lines can reach one text box further than the box itself
+            reach = boxes[:, 2:].max(initial=0) + 1
+            visible = np.flatnonzero(
+                (boxes[:, 0] < x1 + reach) & (boxes[:, 0] + boxes[:, 2] > x0 - reach) &
+                (boxes[:, 1] < y1 + reach) & (boxes[:, 1] + boxes[:, 3] > y0 - reach)
+            )
+
+            # the labels are blitted once into a layer that is composited onto both tiles
+            label_ink = renderer.label_layer(
+                [self._shifted(placements[index], -x0, -y0) for index in visible.tolist()], (y1 - y0, x1 - x0)
+            )
+            covered = np.flatnonzero(label_ink)
+            darken(colored_tile, covered, label_ink.ravel()[covered])
+            darken(outline_tile, covered, label_ink.ravel()[covered])
+
+            colored[y0:y1, x0:x1] = colored_tile
+            outline[y0:y1, x0:x1] = outline_tile
+
+        # cv2 encodes straight from the memory maps (BGR order), no full size copy is made
+        options = []
+        if output_image_path.lower().endswith('.png'):
+            options = [cv2.IMWRITE_PNG_COMPRESSION, self._png_compress_level]
+        cv2.imwrite(output_image_path, colored, options)
+        cv2.imwrite(outline_path, outline)
@@ -1,17 +1,5 @@
-import tqdm
-from PIL import Image
 import numpy as np
-from matplotlib import pyplot as plt
-from sklearn.cluster import KMeans
-from PIL import ImageDraw, ImageFont
-from skimage.measure import label, regionprops
-import cv2
-import os
-from typing import Tuple
-import random
-from tqdm import tqdm
-
-from src.sections import RegionDetector
+from PIL import Image, ImageDraw, ImageFont
 
 
 def load_image(image_path) -> np.ndarray:
@@ -19,17 +7,64 @@ def load_image(image_path) -> np.ndarray:
     return np.array(image)
 
 
-def get_color_pallete(color_to_number_dict):
-    fig, axs = plt.subplots(1, len(color_to_number_dict), figsize=(len(color_to_number_dict) * 3, 4))
+def read_only(array: np.ndarray) -> np.ndarray:
+    # view that the segmenters must not write to, for arrays the caller still needs unchanged
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
+
+
+def load_image_memmap(image_path, memmap_path, strip_height: int = 256) -> np.ndarray:
+    # RGB image as a memory-mapped array. .npy files are mapped directly, everything else is decoded
+    # by PIL and copied over strip by strip, so no converted full size copy is made.
+    if str(image_path).endswith('.npy'):
+        return np.load(image_path, mmap_mode='r')
+
+    with Image.open(image_path) as image:
+        width, height = image.size
+        image_memmap = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=np.uint8, shape=(height, width, 3))
+
+        for y in range(0, height, strip_height):
+            strip = image.crop((0, y, width, min(y + strip_height, height))).convert('RGB')
+            image_memmap[y:y + strip_height] = np.asarray(strip)
+
+    image_memmap.flush()
+    return image_memmap
+
+
+def render_palette(color_to_number_dict, swatch_size: int = 100, columns: int = 10) -> Image.Image:
+    # palette swatches with their number and RGB value below, drawn directly instead of with a pyplot figure
+    font = ImageFont.load_default()
+    captions = [
+        f"{label_number}: RGB: {[int(value) for value in rgb_255]}"
+        for rgb_255, label_number in color_to_number_dict.items()
+    ]
+
+    caption_width = max((font.getsize(caption)[0] for caption in captions), default=0)
+    caption_height = font.getsize('0')[1]
+    cell_width = max(swatch_size, caption_width) + 20
+    cell_height = swatch_size + caption_height + 20
+
+    columns = max(min(columns, len(captions)), 1)
+    rows = -(-len(captions) // columns)
+
+    swatches = np.full((rows * cell_height, columns * cell_width, 3), 255, dtype=np.uint8)
+    for index, rgb_255 in enumerate(color_to_number_dict):
+        top = (index // columns) * cell_height + 10
+        left = (index % columns) * cell_width + (cell_width - swatch_size) // 2
+        swatches[top:top + swatch_size, left:left + swatch_size] = np.asarray(rgb_255, dtype=np.uint8)
+
+    image = Image.fromarray(swatches)
+    draw = ImageDraw.Draw(image)
+
+    for index, caption in enumerate(captions):
+        top = (index // columns) * cell_height + swatch_size + 15
+        left = (index % columns) * cell_width + (cell_width - font.getsize(caption)[0]) // 2
+        draw.text((left, top), caption, fill='black', font=font)
 
-    for ax, (rgb_255, label_number) in zip(axs, color_to_number_dict.items()):
-        rgb_normalized = tuple(c / 255 for c in rgb_255)
+    return image
 
-        img = np.full((10, 10, 3), rgb_normalized)
-        ax.imshow(img)
-        ax.axis('off')
-        ax.set_title(f"{label_number}: RGB: {[int(value) for value in rgb_255]}")
 
-    fig.tight_layout()
+def legend_text(color_to_number_dict) -> str:
+    return ''.join(f"{number}: RGB{color}\n" for color, number in color_to_number_dict.items())
 
-    return fig, axs
@@ -0,0 +1,331 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+import numpy as np
+
+from src.label_placement import LabelPlacement
+
+# label of the area around the image, the image border is a boundary like any other
+OUTSIDE = -1
+
+
+def _order_linked(successors: np.ndarray):
+    # Orders items that are linked into paths and cycles (successor -1 ends a path). Returns the order, in
+    # which every path / cycle is contiguous and in link order, and the start of every group in it.
+    # Cycles start at their smallest item.
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    successors = successors.copy()
+    number_of_items = len(successors)
+
+    linked = np.flatnonzero(successors >= 0)
+    graph = coo_matrix(
+        (np.ones(len(linked), dtype=np.int8), (linked, successors[linked])),
+        shape=(number_of_items, number_of_items)
+    )
+    _, group_ids = connected_components(graph, directed=False)
+
+    is_path = np.zeros(group_ids.max() + 1, dtype=bool)
+    is_path[group_ids[successors < 0]] = True
+
+    first_items = np.full(len(is_path), number_of_items, dtype=np.intp)
+    np.minimum.at(first_items, group_ids, np.arange(number_of_items))
+
+    predecessors = np.full(number_of_items, -1, dtype=np.intp)
+    predecessors[successors[linked]] = linked
+    successors[predecessors[first_items[~is_path]]] = -1
+
+    # distance to the end by pointer jumping
+    distances = (successors >= 0).astype(np.int64)
+    jumps = successors
+    while True:
+        active = np.flatnonzero(jumps >= 0)
+        if len(active) == 0:
+            break
+        next_jumps = jumps[active]
+        distances[active] += distances[next_jumps]
+        jumps[active] = jumps[next_jumps]
+
+    # the distances in a group are 0 .. size - 1, so the position of every item follows directly
+    group_sizes = np.bincount(group_ids)
+    group_starts = np.r_[0, np.cumsum(group_sizes)[:-1]]
+
+    order = np.empty(number_of_items, dtype=np.intp)
+    order[group_starts[group_ids] + group_sizes[group_ids] - 1 - distances] = np.arange(number_of_items)
+
+    return order, group_starts
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray, steps: np.ndarray = None) -> np.ndarray:
+    # concatenation of start, start + step, ... (length values each), step 1 by default
+    total = int(lengths.sum())
+    group_offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+    positions = np.arange(total) - np.repeat(group_offsets, lengths)
+
+    if steps is not None:
+        positions = positions * np.repeat(steps, lengths)
+
+    return np.repeat(starts, lengths) + positions
+
+
+def _first_argmax(values: np.ndarray, owners: np.ndarray, group_starts: np.ndarray) -> np.ndarray:
+    # index of the first maximum of every contiguous group
+    maxima = np.maximum.reduceat(values, group_starts)
+    candidates = np.flatnonzero(values == maxima[owners])
+    return candidates[np.r_[True, owners[candidates][1:] != owners[candidates][:-1]]]
+
+
+def _douglas_peucker(points: np.ndarray, offsets: np.ndarray, tolerance: float) -> np.ndarray:
+    # Douglas-Peucker on all polylines at once, level by level. Returns the mask of the kept points,
+    # the end points are always kept.
+    keep = np.zeros(len(points), dtype=bool)
+    firsts = offsets[:-1]
+    lasts = offsets[1:] - 1
+    keep[firsts] = True
+    keep[lasts] = True
+
+    points = points.astype(np.float64)
+
+    # closed polylines have equal end points, they are split at the point furthest from them first
+    closed = np.all(points[firsts] == points[lasts], axis=1) & (lasts - firsts >= 3)
+    if closed.any():
+        closed_firsts, closed_lasts = firsts[closed], lasts[closed]
+        lengths = closed_lasts - closed_firsts - 1
+        indexes = _ranges(closed_firsts + 1, lengths)
+        owners = np.repeat(np.arange(len(closed_firsts)), lengths)
+        distances = np.abs(points[indexes] - points[np.repeat(closed_firsts, lengths)]).sum(axis=1)
+
+        furthest = indexes[_first_argmax(distances, owners, np.r_[0, np.cumsum(lengths)[:-1]])]
+        keep[furthest] = True
+
+        firsts = np.concatenate((firsts[~closed], closed_firsts, furthest))
+        lasts = np.concatenate((lasts[~closed], furthest, closed_lasts))
+
+    while True:
+        pending = lasts - firsts >= 2
+        firsts, lasts = firsts[pending], lasts[pending]
+        if len(firsts) == 0:
+            return keep
+
+        lengths = lasts - firsts - 1
+        indexes = _ranges(firsts + 1, lengths)
+        owners = np.repeat(np.arange(len(firsts)), lengths)
+
+        starts = points[firsts][owners]
+        directions = points[lasts][owners] - starts
+        offsets_to_start = points[indexes] - starts
+
+        norms = np.hypot(directions[:, 0], directions[:, 1])
+        crosses = np.abs(directions[:, 0] * offsets_to_start[:, 1] - directions[:, 1] * offsets_to_start[:, 0])
+        distances = np.where(
+            norms > 0,
+            crosses / np.where(norms > 0, norms, 1),
+            np.hypot(offsets_to_start[:, 0], offsets_to_start[:, 1])
+        )
+
+        furthest = _first_argmax(distances, owners, np.r_[0, np.cumsum(lengths)[:-1]])
+        split = distances[furthest] > tolerance
+        splits = indexes[furthest][split]
+        keep[splits] = True
+
+        firsts, lasts = np.concatenate((firsts[split], splits)), np.concatenate((splits, lasts[split]))
+
+
+class BoundaryGraph:
+    # The planar graph of the borders between the regions of a label image, extracted in one pass.
+    #
+    # Boundaries run along the pixel edges, the vertices are pixel corners. A chain is a maximal path of
+    # boundary edges between the same two labels, it ends at junctions (corners where three or more edges meet)
+    # or is closed. Every shared border is one chain, so simplifying the chains (with fixed end points) keeps
+    # neighbouring regions watertight and every border is only drawn once.
+
+    def __init__(self, shape, points, offsets, chain_labels, chain_ends):
+        self.shape = shape
+        # (x, y) corner coordinates of all chains, chain i is points[offsets[i]:offsets[i + 1]]
+        self.points: np.ndarray = points
+        self.offsets: np.ndarray = offsets
+        # (left, right) label of every chain, seen in the direction of its points (y pointing down)
+        self.chain_labels: np.ndarray = chain_labels
+        # (first, last) corner id of every chain
+        self.chain_ends: np.ndarray = chain_ends
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def chain(self, index: int) -> np.ndarray:
+        return self.points[self.offsets[index]:self.offsets[index + 1]]
+
+    @classmethod
+    def from_labels(cls, labeled_regions: np.ndarray) -> 'BoundaryGraph':
+        height, width = labeled_regions.shape
+        padded = np.pad(labeled_regions.astype(np.int64), 1, constant_values=OUTSIDE)
+
+        def corner_ids(y, x):
+            return y * (width + 1) + x
+
+        # vertical edges between horizontally adjacent pixels, edge (y, x) runs from corner (y, x) to (y + 1, x)
+        west, east = padded[1:-1, :-1], padded[1:-1, 1:]
+        vertical_y, vertical_x = np.nonzero(west != east)
+        vertical_west, vertical_east = west[vertical_y, vertical_x], east[vertical_y, vertical_x]
+
+        # horizontal edges between vertically adjacent pixels, edge (y, x) runs from corner (y, x) to (y, x + 1)
+        north, south = padded[:-1, 1:-1], padded[1:, 1:-1]
+        horizontal_y, horizontal_x = np.nonzero(north != south)
+        horizontal_north, horizontal_south = north[horizontal_y, horizontal_x], south[horizontal_y, horizontal_x]
+
+        # Orient every edge so that the smaller label is on its left. Going down the east pixel is on the left,
+        # going right the north pixel is. Along a chain the labels do not change, so the orientation is consistent.
+        down = vertical_east < vertical_west
+        right = horizontal_north < horizontal_south
+
+        starts = np.concatenate((
+            np.where(down, corner_ids(vertical_y, vertical_x), corner_ids(vertical_y + 1, vertical_x)),
+            np.where(right, corner_ids(horizontal_y, horizontal_x), corner_ids(horizontal_y, horizontal_x + 1))
+        ))
+        ends = np.concatenate((
+            np.where(down, corner_ids(vertical_y + 1, vertical_x), corner_ids(vertical_y, vertical_x)),
+            np.where(right, corner_ids(horizontal_y, horizontal_x + 1), corner_ids(horizontal_y, horizontal_x))
+        ))
+        lefts = np.concatenate((
+            np.minimum(vertical_west, vertical_east), np.minimum(horizontal_north, horizontal_south)
+        ))
+        rights = np.concatenate((
+            np.maximum(vertical_west, vertical_east), np.maximum(horizontal_north, horizontal_south)
+        ))
+
+        number_of_edges = len(starts)
+        if number_of_edges == 0:
+            return cls((height, width), np.zeros((0, 2), dtype=np.int64), np.zeros(1, dtype=np.intp),
+                       np.zeros((0, 2), dtype=np.int64), np.zeros((0, 2), dtype=np.int64))
+
+        # corners with two edges continue a chain, the others are junctions
+        degrees = np.bincount(np.concatenate((starts, ends)), minlength=(height + 1) * (width + 1))
+        outgoing = np.full(len(degrees), -1, dtype=np.intp)
+        continues = degrees[starts] == 2
+        outgoing[starts[continues]] = np.flatnonzero(continues)
+
+        successors = np.where(degrees[ends] == 2, outgoing[ends], -1)
+
+        order, chain_starts = _order_linked(successors)
+        last_edges = order[np.r_[chain_starts[1:] - 1, number_of_edges - 1]]
+
+        # chain corners: the start corners of the edges plus the end corner of the last edge
+        corners = np.insert(starts[order], np.r_[chain_starts[1:], number_of_edges], ends[last_edges])
+        offsets = np.r_[chain_starts, number_of_edges] + np.arange(len(chain_starts) + 1)
+
+        corner_y, corner_x = np.divmod(corners, width + 1)
+        points = np.stack((corner_x, corner_y), axis=1)
+
+        first_edges_in_order = order[chain_starts]
+        chain_labels = np.stack((lefts[first_edges_in_order], rights[first_edges_in_order]), axis=1)
+        chain_ends = np.stack((corners[offsets[:-1]], corners[offsets[1:] - 1]), axis=1)
+
+        return cls((height, width), points, offsets, chain_labels, chain_ends)
+
+    def simplified(self, tolerance: float = 0.75) -> 'BoundaryGraph':
+        # Douglas-Peucker on every chain, the junctions stay where they are. Straight runs are reduced to
+        # their end points first, so the per chain work is proportional to the number of turns.
+        if len(self) == 0:
+            return self
+
+        points = self.points
+        chain_index = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+        is_first = np.zeros(len(points), dtype=bool)
+        is_first[self.offsets[:-1]] = True
+        is_last = np.zeros(len(points), dtype=bool)
+        is_last[self.offsets[1:] - 1] = True
+
+        incoming = np.zeros_like(points)
+        incoming[1:] = points[1:] - points[:-1]
+        outgoing = np.zeros_like(points)
+        outgoing[:-1] = points[1:] - points[:-1]
+
+        turns = is_first | is_last | np.any(incoming != outgoing, axis=1)
+        points = points[turns]
+        counts = np.bincount(chain_index[turns], minlength=len(self))
+        offsets = np.r_[0, np.cumsum(counts)]
+
+        keep = _douglas_peucker(points, offsets, tolerance)
+        counts = np.bincount(np.repeat(np.arange(len(self)), counts)[keep], minlength=len(self))
+
+        return BoundaryGraph(
+            self.shape,
+            points[keep],
+            np.r_[0, np.cumsum(counts)],
+            self.chain_labels,
+            self.chain_ends
+        )
+
+    def region_rings(self) -> Dict[int, List[np.ndarray]]:
+        # Closed rings of every region (OUTSIDE excluded), each one with the region on its left. Outer borders
+        # and holes run in opposite directions, so filled with the nonzero rule the rings cover exactly the
+        # region. The first point of a ring is not repeated at its end.
+        #
+        # Every chain is used twice, forward by its left region and backward by its right one. A ring continues
+        # with a piece of the same region that starts where the last one ended, pieces are matched to their
+        # successors by sorting on (region, corner); at corners a region touches twice any matching is valid.
+        number_of_chains = len(self)
+        regions = np.concatenate((self.chain_labels[:, 0], self.chain_labels[:, 1]))
+        piece_starts = np.concatenate((self.chain_ends[:, 0], self.chain_ends[:, 1]))
+        piece_ends = np.concatenate((self.chain_ends[:, 1], self.chain_ends[:, 0]))
+
+        inside = np.flatnonzero(regions != OUTSIDE)
+        if len(inside) == 0:
+            return {}
+
+        by_start = inside[np.lexsort((piece_starts[inside], regions[inside]))]
+        by_end = inside[np.lexsort((piece_ends[inside], regions[inside]))]
+
+        # successors as positions in inside
+        positions = np.zeros(len(regions), dtype=np.intp)
+        positions[inside] = np.arange(len(inside))
+        successors = np.zeros(len(regions), dtype=np.intp)
+        successors[by_end] = positions[by_start]
+
+        order, ring_starts = _order_linked(successors[inside])
+        pieces = inside[order]
+
+        # every piece without its last point, backward pieces read their chain from the end
+        reverse = pieces >= number_of_chains
+        chains = np.where(reverse, pieces - number_of_chains, pieces)
+        lengths = self.offsets[chains + 1] - self.offsets[chains] - 1
+        point_indexes = _ranges(
+            np.where(reverse, self.offsets[chains + 1] - 1, self.offsets[chains]),
+            lengths,
+            np.where(reverse, -1, 1)
+        )
+
+        ring_lengths = np.add.reduceat(lengths, ring_starts)
+        rings = np.split(self.points[point_indexes], np.cumsum(ring_lengths)[:-1])
+
+        region_rings: Dict[int, List[np.ndarray]] = {}
+        for region, ring in zip(regions[pieces[ring_starts]].tolist(), rings):
+            region_rings.setdefault(region, []).append(ring)
+
+        return region_rings
+
+
+class VectorWriter(ABC):
+    # file extension of the output, e.g. 'svg'
+    extension: str = None
+
+    @abstractmethod
+    def encode(
+            self,
+            boundary_graph: BoundaryGraph,
+            region_colors: Dict[int, tuple],
+            placements: List[LabelPlacement]
+    ) -> bytes:
+        raise NotImplementedError()
+
+    def write(
+            self,
+            path: str,
+            boundary_graph: BoundaryGraph,
+            region_colors: Dict[int, tuple],
+            placements: List[LabelPlacement]
+    ):
+        with open(path, 'wb') as f:
+            f.write(self.encode(boundary_graph, region_colors, placements))
@@ -0,0 +1,126 @@
+import io
+import zlib
+from typing import Dict, List
+
+from src.label_placement import LabelPlacement
+from src.vector_output import BoundaryGraph, VectorWriter
+
+# average advance of the Helvetica digits, in units of the font size
+_HELVETICA_DIGIT_WIDTH = 0.556
+
+
+def _path_operators(polylines, closed: bool = False) -> List[str]:
+    operators = []
+
+    for polyline in polylines:
+        if len(polyline) < 2:
+            continue
+
+        coordinates = polyline.tolist()
+        operators.append(f'{coordinates[0][0]} {coordinates[0][1]} m')
+        operators.extend(f'{x} {y} l' for x, y in coordinates[1:])
+
+        if closed:
+            operators.append('h')
+
+    return operators
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+class PdfWriter(VectorWriter):
+    # Single page PDF, one point per pixel, written without a PDF library: a flate compressed content stream
+    # with the same paths as the SVG output and the labels in Helvetica.
+
+    extension = 'pdf'
+
+    def __init__(self, filled: bool = False, stroke_width: float = 1.0):
+        self._filled = filled
+        self._stroke_width = stroke_width
+
+    def encode(
+            self,
+            boundary_graph: BoundaryGraph,
+            region_colors: Dict[int, tuple],
+            placements: List[LabelPlacement]
+    ) -> bytes:
+        height, width = boundary_graph.shape
+
+        # image coordinates, y pointing down
+        operators = ['q', f'1 0 0 -1 0 {height} cm', '1 j', '1 J']
+
+        if self._filled:
+            rings_by_color = {}
+            for region, rings in boundary_graph.region_rings().items():
+                if region in region_colors:
+                    color = tuple(int(channel) for channel in region_colors[region])
+                    rings_by_color.setdefault(color, []).extend(rings)
+
+            for color, rings in rings_by_color.items():
+                operators.append('{:.4g} {:.4g} {:.4g} rg'.format(*(channel / 255 for channel in color)))
+                operators.extend(_path_operators(rings, closed=True))
+                operators.append('f')
+
+        operators.append(f'0 G {self._stroke_width:g} w')
+        operators.extend(_path_operators(boundary_graph.chain(index) for index in range(len(boundary_graph))))
+        operators.append('S')
+
+        leaders = [placement for placement in placements if placement.leader]
+        if leaders:
+            operators.append(f'{self._stroke_width / 2:g} w')
+
+            for placement in leaders:
+                text_width, text_height = placement.font.getsize(str(placement.number))
+                x, y = placement.position
+                closest_x = min(max(placement.anchor[0], x), x + text_width)
+                closest_y = min(max(placement.anchor[1], y), y + text_height)
+                operators.append(f'{placement.anchor[0]} {placement.anchor[1]} m {closest_x} {closest_y} l')
+
+            operators.append('S')
+
+        operators.extend(['Q', '0 g', 'BT'])
+
+        for placement in placements:
+            text = str(placement.number)
+            text_width, text_height = placement.font.getsize(text)
+            x, y = placement.position
+
+            # centered on the text box of the raster output, the baseline is a third of the size below the center
+            size = text_height
+            center_x, center_y = x + text_width / 2, y + text_height / 2
+            text_x = center_x - len(text) * size * _HELVETICA_DIGIT_WIDTH / 2
+            baseline = height - (center_y + size / 3)
+
+            operators.append(f'/F1 {size} Tf 1 0 0 1 {text_x:.1f} {baseline:.1f} Tm ({_escape(text)}) Tj')
+
+        operators.append('ET')
+
+        content = zlib.compress('\n'.join(operators).encode('latin-1'))
+
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] /Contents 4 0 R '
+            f'/Resources << /Font << /F1 5 0 R >> >> >>'.encode(),
+            f'<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n'.encode() + content + b'\nendstream',
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        ]
+
+        with io.BytesIO() as f:
+            f.write(b'%PDF-1.4\n')
+            object_offsets = []
+
+            for number, body in enumerate(objects, start=1):
+                object_offsets.append(f.tell())
+                f.write(f'{number} 0 obj\n'.encode() + body + b'\nendobj\n')
+
+            xref_offset = f.tell()
+            f.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode())
+            for offset in object_offsets:
+                f.write(f'{offset:010d} 00000 n \n'.encode())
+
+            f.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode())
+
+            return f.getvalue()
@@ -0,0 +1,96 @@
+import io
+from html import escape
+from typing import Dict, List
+
+import numpy as np
+
+from src.label_placement import LabelPlacement
+from src.vector_output import BoundaryGraph, VectorWriter
+
+
+def _path_data(polylines, closed: bool = False) -> str:
+    # absolute move to the first point, relative lines afterwards, the corner coordinates are integers
+    parts = []
+
+    for polyline in polylines:
+        if len(polyline) < 2:
+            continue
+
+        steps = np.diff(polyline, axis=0)
+        parts.append(f'M{polyline[0][0]} {polyline[0][1]}l' + ' '.join(f'{dx} {dy}' for dx, dy in steps.tolist()))
+
+        if closed:
+            parts.append('z')
+
+    return ''.join(parts)
+
+
+def _hex_color(color) -> str:
+    return '#{:02x}{:02x}{:02x}'.format(*(int(channel) for channel in color))
+
+
+class SvgWriter(VectorWriter):
+    # Every border is one subpath of a single outline path, the fills are one path per palette color.
+
+    extension = 'svg'
+
+    def __init__(self, filled: bool = False, stroke_width: float = 1.0):
+        # fill the regions with their colors, otherwise a white template to paint on
+        self._filled = filled
+        self._stroke_width = stroke_width
+
+    def encode(
+            self,
+            boundary_graph: BoundaryGraph,
+            region_colors: Dict[int, tuple],
+            placements: List[LabelPlacement]
+    ) -> bytes:
+        height, width = boundary_graph.shape
+
+        with io.StringIO() as f:
+            f.write(
+                f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                f'viewBox="0 0 {width} {height}">\n'
+                f'<rect width="{width}" height="{height}" fill="white"/>\n'
+            )
+
+            if self._filled:
+                rings_by_color = {}
+                for region, rings in boundary_graph.region_rings().items():
+                    if region in region_colors:
+                        rings_by_color.setdefault(_hex_color(region_colors[region]), []).extend(rings)
+
+                for color, rings in rings_by_color.items():
+                    f.write(f'<path fill="{color}" d="{_path_data(rings, closed=True)}"/>\n')
+
+            outline = _path_data(boundary_graph.chain(index) for index in range(len(boundary_graph)))
+            f.write(
+                f'<path fill="none" stroke="black" stroke-width="{self._stroke_width}" '
+                f'stroke-linejoin="round" d="{outline}"/>\n'
+            )
+
+            leaders = []
+            f.write('<g font-family="sans-serif" text-anchor="middle" dominant-baseline="central">\n')
+
+            for placement in placements:
+                text = str(placement.number)
+                text_width, text_height = placement.font.getsize(text)
+                x, y = placement.position
+
+                f.write(f'<text x="{x + text_width / 2:g}" y="{y + text_height / 2:g}" font-size="{text_height}">'
+                        f'{escape(text)}</text>\n')
+
+                if placement.leader:
+                    closest_x = min(max(placement.anchor[0], x), x + text_width)
+                    closest_y = min(max(placement.anchor[1], y), y + text_height)
+                    leaders.append(f'M{placement.anchor[0]} {placement.anchor[1]}L{closest_x} {closest_y}')
+
+            f.write('</g>\n')
+
+            if leaders:
+                f.write(f'<path fill="none" stroke="black" stroke-width="{self._stroke_width / 2:g}" '
+                        f'd="{"".join(leaders)}"/>\n')
+
+            f.write('</svg>\n')
+
+            return f.getvalue().encode()
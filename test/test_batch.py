@@ -0,0 +1,93 @@
+import functools
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from src.batch import collect_images, create_generator, is_completed, plan_jobs, run_batch
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_folder = os.path.join(self.directory.name, 'input')
+        self.output_root = os.path.join(self.directory.name, 'output')
+        os.makedirs(self.input_folder)
+
+        rng = np.random.default_rng(0)
+        for name in ('first.png', 'second.png'):
+            blocks = rng.integers(0, 256, size=(4, 4, 3), dtype=np.uint8)
+            Image.fromarray(np.kron(blocks, np.ones((20, 20, 1), dtype=np.uint8))).save(
+                os.path.join(self.input_folder, name)
+            )
+
+        with open(os.path.join(self.input_folder, 'broken.jpg'), 'w') as f:
+            f.write('not an image')
+
+        with open(os.path.join(self.input_folder, 'notes.txt'), 'w') as f:
+            f.write('ignored')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_collect_images(self):
+        names = [os.path.basename(path) for path in collect_images(self.input_folder)]
+        self.assertEqual(['broken.jpg', 'first.png', 'second.png'], names)
+
+        manifest_path = os.path.join(self.directory.name, 'manifest.txt')
+        with open(manifest_path, 'w') as f:
+            f.write('# uploads\ninput/second.png\n\ninput/first.png\n')
+
+        self.assertEqual(
+            [os.path.join(self.directory.name, 'input', name) for name in ('second.png', 'first.png')],
+            collect_images(manifest_path)
+        )
+
+    def test_plan_jobs_rejects_shared_output_folders(self):
+        with self.assertRaises(ValueError):
+            plan_jobs(['a/cat.jpg', 'b/cat.png'], self.output_root)
+
+    def test_preprocessing_replaces_the_blur_only_with_a_filter(self):
+        self.assertEqual(5, create_generator(preprocessing=['downscale:0.5', 'label_median'])._image_segmenter._blur_size)
+        self.assertIsNone(create_generator(preprocessing=['downscale:0.5', 'bilateral'])._image_segmenter._blur_size)
+
+    def test_tiled_rejects_unsupported_options(self):
+        for options in (
+                {'merge_small_regions': True}, {'vector_formats': ['svg']}, {'compact': True},
+                {'preprocessing': ['bilateral']}, {'render_scale': 2}
+        ):
+            with self.subTest(**options), self.assertRaises(ValueError):
+                create_generator(tiled=True, **options)
+
+    def test_run_batch(self):
+        jobs = plan_jobs(collect_images(self.input_folder), self.output_root)
+        generator_factory = functools.partial(create_generator, segmenter='octree', number_of_colors=4)
+        report_path = os.path.join(self.directory.name, 'report.jsonl')
+
+        results = run_batch(jobs, generator_factory, workers=2, report_path=report_path)
+        statuses = {os.path.basename(result.image_path): result.status for result in results}
+
+        self.assertEqual({'broken.jpg': 'failed', 'first.png': 'done', 'second.png': 'done'}, statuses)
+        self.assertTrue(is_completed(os.path.join(self.output_root, 'first')))
+        stage_names = [stage['name'] for stage in next(result for result in results if result.stages).stages['stages']]
+        self.assertIn('segment', stage_names)
+        self.assertIn('place_labels', stage_names)
+        self.assertFalse(is_completed(os.path.join(self.output_root, 'broken')))
+        self.assertIn('UnidentifiedImageError', next(result.error for result in results if result.status == 'failed'))
+
+        # the completed images are skipped, the failed one is tried again
+        results = run_batch(jobs, generator_factory, workers=1, report_path=report_path)
+        statuses = {os.path.basename(result.image_path): result.status for result in results}
+
+        self.assertEqual({'broken.jpg': 'failed', 'first.png': 'skipped', 'second.png': 'skipped'}, statuses)
+
+        with open(report_path) as f:
+            self.assertEqual(6, len([json.loads(line) for line in f]))
+
+
+if __name__ == '__main__':
+    unittest.main()
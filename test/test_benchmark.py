@@ -0,0 +1,87 @@
+import unittest
+
+from skimage.measure import label
+
+from src.benchmark import (
+    CALIBRATION_CASE, BenchmarkConfig, BenchmarkResult, compare_to_baseline, run_benchmarks, worst_case_masks
+)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_worst_case_masks(self):
+        masks = worst_case_masks(8)
+
+        self.assertEqual(1, label(masks['giant_region'], connectivity=1).max())
+        self.assertEqual(1, label(masks['comb'], connectivity=1).max())
+        self.assertEqual(32, label(masks['checkerboard'], connectivity=1).max())
+        self.assertEqual(8, label(masks['blocks_2x2'], connectivity=1).max())
+
+    def test_compare_to_baseline(self):
+        baseline = {
+            'fast': {'p50': 1.0, 'peak_rss': 100},
+            'slow': {'p50': 1.0, 'peak_rss': 100},
+            'removed': {'p50': 1.0, 'peak_rss': 100},
+        }
+        results = {
+            'fast': {'p50': 1.1, 'peak_rss': 100},
+            'slow': {'p50': 1.5, 'peak_rss': 90},
+            'added': {'p50': 1.0, 'peak_rss': 100},
+        }
+
+        comparison = compare_to_baseline(results, baseline, threshold=0.25)
+
+        self.assertFalse(comparison['passed'])
+        self.assertEqual(['slow'], list(comparison['regressions']))
+        self.assertEqual(['added'], comparison['new_cases'])
+        self.assertEqual(['removed'], comparison['missing_cases'])
+
+        self.assertTrue(compare_to_baseline(results, baseline, threshold=0.6)['passed'])
+
+    def test_compare_relative_to_calibration(self):
+        baseline = {
+            CALIBRATION_CASE: {'p50': 1.0, 'peak_rss': 100},
+            'case': {'p50': 2.0, 'peak_rss': 100},
+        }
+
+        # everything twice as slow on a slower host
+        slower_host = {
+            CALIBRATION_CASE: {'p50': 2.0, 'peak_rss': 100},
+            'case': {'p50': 4.0, 'peak_rss': 100},
+        }
+        comparison = compare_to_baseline(slower_host, baseline)
+        self.assertTrue(comparison['passed'])
+        self.assertEqual(2.0, comparison['host_speed'])
+
+        slower_host['case']['p50'] = 6.0
+        self.assertEqual(['case'], list(compare_to_baseline(slower_host, baseline)['regressions']))
+
+    def test_tail_percentile_needs_enough_runs(self):
+        self.assertIsNone(BenchmarkResult('case', 1, [1.0, 2.0, 3.0], 0).to_dict()['p90'])
+        self.assertAlmostEqual(90.1, BenchmarkResult('case', 1, [float(i) for i in range(1, 101)], 0).to_dict()['p90'])
+
+    def test_run_benchmarks(self):
+        config = BenchmarkConfig(
+            images=['two_adventureres.jpg'], scales=(0.1,), palette_sizes=(4,), repeats=2, mask_size=16,
+            end_to_end=False
+        )
+
+        results = run_benchmarks(config)
+
+        self.assertIn(CALIBRATION_CASE, results)
+        self.assertIn('get_regions/checkerboard@16', results)
+        self.assertIn('segment/two_adventureres.jpg@0.1/k=4', results)
+        self.assertIn('segment_compact/two_adventureres.jpg@0.1/k=4', results)
+        self.assertIn('place_labels/two_adventureres.jpg@0.1/k=4', results)
+        self.assertIn('preprocess/bilateral/two_adventureres.jpg@0.1', results)
+        self.assertIn('label_median/two_adventureres.jpg@0.1/k=4', results)
+        self.assertIn('label_layer/two_adventureres.jpg@0.1/k=4', results)
+
+        result = results['segment/two_adventureres.jpg@0.1/k=4']
+        self.assertEqual(2, len(result['latencies']))
+        self.assertNotIn('p99', result)
+        self.assertGreater(result['megapixels_per_second'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from src.segmentation.k_means import KMeansSegmenter
+from src.segmentation.median_cut import MedianCutSegmenter
+from src.segmentation.octree import OctreeSegmenter
+
+
+class TestHistogramSegmenters(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        colors = np.array([[200, 30, 30], [30, 200, 30], [30, 30, 200], [220, 220, 220]], dtype=np.uint8)
+
+        self.image_array = np.repeat(np.repeat(colors[rng.integers(0, 4, (12, 16))], 8, axis=0), 8, axis=1)
+
+    def test_segment(self):
+        k_means_result = KMeansSegmenter(4).segment(self.image_array)
+
+        for segmenter_class in [OctreeSegmenter, MedianCutSegmenter]:
+            with self.subTest(segmenter_class.__name__):
+                result = segmenter_class(4).segment(self.image_array)
+
+                self.assertEqual((4, 3), result.colors.shape)
+                self.assertEqual(self.image_array.shape[:2], result.segment_labels.shape)
+                np.testing.assert_array_equal(
+                    result.colors.astype('uint8')[result.segment_labels], result.quantized_image
+                )
+
+                self.assertLess(result.quantization_error, 1.05 * k_means_result.quantization_error)
+
+    def test_fewer_colors_than_requested(self):
+        image_array = np.full((20, 30, 3), [10, 120, 240], dtype=np.uint8)
+
+        for segmenter_class in [OctreeSegmenter, MedianCutSegmenter]:
+            with self.subTest(segmenter_class.__name__):
+                result = segmenter_class(16).segment(image_array)
+
+                np.testing.assert_array_equal([[10, 120, 240]], result.colors)
+                self.assertEqual(0, result.quantization_error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules a worker or the CLI imports before it knows what it will run
+ENTRY_MODULES = (
+    'src.paint_by_numbers_image_generator',
+    'src.tiled_paint_by_numbers_image_generator',
+    'src.segmentation.k_means',
+    'src.segmentation.octree',
+    'src.segmentation.median_cut',
+    'src.segmentation.superpixel',
+    'src.vector_output.svg',
+    'src.vector_output.pdf',
+    'src.batch',
+)
+
+# loaded on first use only
+HEAVY_MODULES = ('sklearn', 'matplotlib', 'scipy', 'skimage', 'cv2', 'tqdm')
+
+# seconds for all entry modules in a fresh interpreter, numpy and PIL take most of it
+IMPORT_TIME_BUDGET = 0.5
+
+
+def import_times(modules) -> dict:
+    # cumulative import time in seconds of every module loaded, as reported by python -X importtime,
+    # and whether the module was imported at the top level (nested imports are indented)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(cumulative) / 1e6, not name[1:].startswith(' '))
+
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_heavy_modules_are_lazy(self):
+        loaded = {name.split('.')[0] for name in import_times(ENTRY_MODULES)}
+        self.assertEqual(set(), loaded & set(HEAVY_MODULES))
+
+    def test_import_time_budget(self):
+        times = import_times(ENTRY_MODULES)
+        total = sum(cumulative for cumulative, top_level in times.values() if top_level)
+
+        self.assertLess(total, IMPORT_TIME_BUDGET, sorted(times.items(), key=lambda item: -item[1][0])[:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import instrumentation
+from src.instrumentation import StageHook, StageTimer
+
+
+class RecordingHook(StageHook):
+    def __init__(self):
+        self.events = []
+
+    def stage_started(self, name):
+        self.events.append(('started', name))
+
+    def stage_finished(self, record):
+        self.events.append(('finished', record.name))
+
+    def progress(self, iterable, description=None, total=None):
+        self.events.append(('progress', description))
+        return iterable
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def test_nested_stages(self):
+        hook = RecordingHook()
+        timer = StageTimer(hooks=[hook], trace_allocations=True)
+
+        with timer.stage('outer'):
+            with timer.stage('inner'):
+                array = np.ones((256, 1024))
+                timer.record_array('ones', array)
+
+            self.assertEqual(3, sum(timer.progress([1, 1, 1], 'count')))
+
+        outer, inner = timer.records
+
+        self.assertEqual((0, 1), (outer.depth, inner.depth))
+        self.assertEqual({'ones': 256 * 1024 * 8}, inner.arrays)
+        self.assertEqual(0, outer.allocated_bytes)
+        self.assertGreaterEqual(outer.wall_time, inner.wall_time)
+        self.assertGreaterEqual(outer.peak_rss, inner.peak_rss)
+        self.assertGreaterEqual(inner.peak_allocated, array.nbytes)
+        self.assertGreaterEqual(outer.peak_allocated, array.nbytes)
+
+        self.assertEqual(
+            [('started', 'outer'), ('started', 'inner'), ('finished', 'inner'), ('progress', 'count'),
+             ('finished', 'outer')],
+            hook.events
+        )
+
+    def test_stage_is_recorded_on_error(self):
+        timer = StageTimer()
+
+        with self.assertRaises(ValueError):
+            with timer.stage('failing'):
+                raise ValueError()
+
+        self.assertEqual(['failing'], [record.name for record in timer.records])
+
+        with timer.stage('next'):
+            pass
+
+        self.assertEqual([0, 0], [record.depth for record in timer.records])
+
+    def test_peak_is_not_reset_by_concurrent_timers(self):
+        first, second = StageTimer(), StageTimer()
+
+        with mock.patch.object(instrumentation, '_reset_peak_rss') as reset_peak_rss:
+            with first.stage('first'):
+                with second.stage('second'):
+                    with first.stage('nested'):
+                        pass
+            self.assertEqual(1, reset_peak_rss.call_count)
+
+            with second.stage('alone'):
+                pass
+            self.assertEqual(2, reset_peak_rss.call_count)
+
+    def test_report_as_json(self):
+        timer = StageTimer()
+
+        with timer.stage('first'):
+            pass
+        with timer.stage('second'):
+            pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            timer.dump_json(path)
+
+            with open(path) as f:
+                report = json.load(f)
+
+        self.assertEqual(['first', 'second'], [stage['name'] for stage in report['stages']])
+        self.assertGreater(report['peak_rss'], 0)
+
+        timer.clear()
+        self.assertEqual([], timer.report()['stages'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+
+from src.segmentation.k_means import KMeansSegmenter, relative_quality_loss
+
+
+class TestKMeansSegmenter(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        colors = np.array([[200, 30, 30], [30, 200, 30], [30, 30, 200]], dtype=np.uint8)
+
+        self.image_array = np.repeat(np.repeat(colors[rng.integers(0, 3, (12, 16))], 8, axis=0), 8, axis=1)
+
+    def test_fast_mode_matches_full_fit(self):
+        full_result = KMeansSegmenter(3).segment(self.image_array)
+        fast_result = KMeansSegmenter(3, sample_size=2000, batch_size=256, max_memory_bytes=16000).segment(self.image_array)
+
+        self.assertEqual(self.image_array.shape[:2], fast_result.segment_labels.shape)
+        self.assertEqual(self.image_array.shape, fast_result.quantized_image.shape)
+        self.assertLess(relative_quality_loss(fast_result, full_result), 0.05)
+
+        # both runs find the same partition of the image, only the palette order can differ
+        pairs = np.unique(
+            np.stack((full_result.segment_labels.ravel(), fast_result.segment_labels.ravel()), axis=1), axis=0
+        )
+        self.assertEqual(3, len(pairs))
+
+    def test_stratified_sample(self):
+        # every pixel holds its own coordinates
+        rows, cols = np.mgrid[0:45, 0:62]
+        coordinates = np.stack((rows, cols), axis=-1)
+
+        sample = KMeansSegmenter._stratified_sample(coordinates, 60)
+        cells = sample // 7
+
+        # one pixel from every cell of the 7 pixel grid, the offsets differ between the cells of a row
+        self.assertEqual(7 * 9, len(np.unique(cells, axis=0)))
+        self.assertEqual(len(sample), len(cells))
+        self.assertGreater(len(np.unique(sample[cells[:, 0] == 0, 0])), 1)
+
+    def test_compact_mode(self):
+        image_array = self.image_array.copy()
+        result = KMeansSegmenter(3).segment(self.image_array)
+        compact_result = KMeansSegmenter(3, compact=True, blur_in_place=True).segment(image_array)
+
+        self.assertEqual(np.uint8, compact_result.segment_labels.dtype)
+        self.assertLess(abs(relative_quality_loss(compact_result, result)), 0.01)
+        # the blurred image replaced the input
+        self.assertFalse(np.array_equal(self.image_array, image_array))
+
+        pairs = np.unique(
+            np.stack((result.segment_labels.ravel(), compact_result.segment_labels.ravel()), axis=1), axis=0
+        )
+        self.assertEqual(3, len(pairs))
+
+    def test_read_only_image_blurred_into_copy(self):
+        image_array = self.image_array.copy()
+        image_array.flags.writeable = False
+
+        result = KMeansSegmenter(3, compact=True, blur_in_place=True).segment(image_array)
+
+        np.testing.assert_array_equal(self.image_array, image_array)
+        self.assertEqual(self.image_array.shape[:2], result.segment_labels.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from src.label_placement.distance_transform import DistanceTransformLabelPlacer
+from src.label_placement.row_center import RowCenterLabelPlacer
+
+
+class TestDistanceTransformLabelPlacer(unittest.TestCase):
+
+    def test_label_box_inside_region(self):
+        labeled_regions = np.ones((60, 80), dtype=int)
+        labeled_regions[:, 50:] = 2
+        labeled_regions[20:40, 10:30] = 3
+
+        placements = DistanceTransformLabelPlacer().place_labels(labeled_regions, {1: 4, 2: 12, 3: 7})
+
+        self.assertEqual([1, 2, 3], [placement.region_label for placement in placements])
+
+        for placement in placements:
+            self.assertFalse(placement.leader)
+
+            text_width, text_height = placement.font.getsize(str(placement.number))
+            x, y = placement.position
+
+            self.assertGreaterEqual(x, 0)
+            self.assertGreaterEqual(y, 0)
+            self.assertTrue(
+                (labeled_regions[y:y + text_height, x:x + text_width] == placement.region_label).all()
+            )
+
+        # the inner square is labeled at its pole
+        self.assertEqual((19, 29), placements[2].anchor)
+
+    def test_leader_for_small_region(self):
+        labeled_regions = np.ones((40, 40), dtype=int)
+        labeled_regions[10:13, 10:13] = 2
+
+        placements = DistanceTransformLabelPlacer().place_labels(labeled_regions, {1: 1, 2: 2})
+
+        self.assertFalse(placements[0].leader)
+        self.assertTrue(placements[1].leader)
+        self.assertEqual((11, 11), placements[1].anchor)
+
+    def test_stable_under_distance_jitter(self):
+        labeled_regions = np.ones((40, 60), dtype=int)
+        labeled_regions[:, 30:] = 2
+
+        distance_transform = cv2.distanceTransform
+        calls = []
+
+        def jittered_distance_transform(*args):
+            distance = distance_transform(*args)
+            calls.append(None)
+            if len(calls) == 2:
+                # the last of the tied maxima comes out a little larger, as the precise transform can
+                distance.ravel()[np.flatnonzero(distance == distance.max())[-1]] += np.float32(5e-7)
+            return distance
+
+        placer = DistanceTransformLabelPlacer()
+        with mock.patch('cv2.distanceTransform', side_effect=jittered_distance_transform):
+            first = placer.place_labels(labeled_regions, {1: 1, 2: 2})
+            second = placer.place_labels(labeled_regions, {1: 1, 2: 2})
+
+        self.assertEqual(
+            [placement.position for placement in first], [placement.position for placement in second]
+        )
+
+
+class TestRowCenterLabelPlacer(unittest.TestCase):
+
+    def test_place_labels(self):
+        labeled_regions = np.ones((40, 40), dtype=int)
+        labeled_regions[:, 20:] = 2
+
+        placements = RowCenterLabelPlacer().place_labels(labeled_regions, {1: 1, 2: 2})
+
+        self.assertEqual([(9, 5), (29, 5)], [placement.anchor for placement in placements])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from src.output_writer import OutputWriter
+from src.utility import render_palette
+
+
+class TestOutputWriter(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.image = rng.integers(0, 4, size=(64, 96, 3)).astype(np.uint8) * 60
+
+    def test_in_memory(self):
+        with OutputWriter() as output_writer:
+            output_writer.submit_image('image.png', self.image)
+            output_writer.submit_image('image.jpg', self.image)
+            output_writer.submit_text('legend.txt', '1: RGB(0, 0, 0)\n')
+
+        buffers = output_writer.buffers
+        self.assertTrue(output_writer.in_memory)
+        self.assertEqual({'image.png', 'image.jpg', 'legend.txt'}, set(buffers))
+
+        np.testing.assert_array_equal(self.image, np.asarray(Image.open(io.BytesIO(buffers['image.png']))))
+        self.assertEqual('JPEG', Image.open(io.BytesIO(buffers['image.jpg'])).format)
+        self.assertEqual(b'1: RGB(0, 0, 0)\n', buffers['legend.txt'])
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with OutputWriter(os.path.join(directory, 'output')) as output_writer:
+                output_writer.submit_image('palette.jpg', render_palette({(255, 0, 0): 1, (0, 0, 255): 2}))
+                output_writer.submit('data.bin', lambda: b'\x00\x01')
+
+            path = output_writer.path('data.bin')
+            self.assertEqual({'palette.jpg': output_writer.path('palette.jpg'), 'data.bin': path}, output_writer.paths)
+
+            with open(path, 'rb') as f:
+                self.assertEqual(b'\x00\x01', f.read())
+
+    def test_png_compress_level(self):
+        sizes = []
+        for compress_level in (0, 9):
+            with OutputWriter(png_compress_level=compress_level) as output_writer:
+                output_writer.submit_image('image.png', self.image)
+
+            sizes.append(len(output_writer.buffers['image.png']))
+
+        self.assertGreater(sizes[0], sizes[1])
+
+    def test_errors_are_raised_on_close(self):
+        def fail():
+            raise ValueError('encoding failed')
+
+        output_writer = OutputWriter()
+        output_writer.submit('broken', fail)
+        output_writer.submit_text('legend.txt', 'ok')
+
+        with self.assertRaises(ValueError):
+            output_writer.close()
+
+        self.assertEqual({'legend.txt'}, set(output_writer.buffers))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+from src.instrumentation import StageTimer
+from src.output_writer import OutputWriter
+from src.paint_by_numbers_image_generator import PaintByNumbersImageGenerator
+from src.segmentation import ImageSegmenter, SegmentationResult
+from src.segmentation.k_means import KMeansSegmenter
+from src.segmentation.palette_assignment import PaletteAssigner
+
+
+class FixedPaletteSegmenter(ImageSegmenter):
+    def __init__(self, colors):
+        self.colors = np.asarray(colors)
+
+    def segment(self, image_array: np.ndarray) -> SegmentationResult:
+        segment_labels = PaletteAssigner(self.colors).assign(image_array)
+        return SegmentationResult(segment_labels, self.colors, self.colors[segment_labels].astype(np.uint8))
+
+
+class TestFilterSmallRegions(unittest.TestCase):
+
+    def setUp(self):
+        self.labeled_image = np.array([
+            [1, 1, 1, 1, 2, 2],
+            [1, 1, 3, 1, 2, 2],
+            [1, 1, 1, 1, 2, 2],
+            [4, 4, 4, 5, 2, 2],
+        ])
+        self.generator = PaintByNumbersImageGenerator(image_segmenter=None)
+
+    def test_drop_small_regions(self):
+        filtered = self.generator._filter_small_regions(self.labeled_image, min_size=4)
+
+        np.testing.assert_array_equal(
+            np.array([
+                [1, 1, 1, 1, 2, 2],
+                [1, 1, 0, 1, 2, 2],
+                [1, 1, 1, 1, 2, 2],
+                [0, 0, 0, 0, 2, 2],
+            ]),
+            filtered
+        )
+
+    def test_merge_small_regions(self):
+        filtered = self.generator._filter_small_regions(self.labeled_image, min_size=4, merge=True)
+
+        # 3 is enclosed by 1, 4 touches 1 the most and 5 touches 1, 2 and 4 once each and goes to the largest
+        np.testing.assert_array_equal(
+            np.array([
+                [1, 1, 1, 1, 2, 2],
+                [1, 1, 1, 1, 2, 2],
+                [1, 1, 1, 1, 2, 2],
+                [1, 1, 1, 1, 2, 2],
+            ]),
+            filtered
+        )
+
+
+class TestDetectRegionsByColor(unittest.TestCase):
+
+    def test_components_and_palette_indexes(self):
+        segment_labels = np.array([
+            [0, 0, 1, 1],
+            [2, 0, 1, 0],
+            [2, 2, 0, 0],
+        ])
+
+        generator = PaintByNumbersImageGenerator(image_segmenter=None)
+        labeled_image, palette_indexes = generator._detect_regions_by_color(segment_labels)
+
+        np.testing.assert_array_equal(
+            np.array([
+                [1, 1, 2, 2],
+                [3, 1, 2, 4],
+                [3, 3, 4, 4],
+            ]),
+            labeled_image
+        )
+        np.testing.assert_array_equal(np.array([0, 0, 1, 2, 0]), palette_indexes)
+
+
+class TestGenerate(unittest.TestCase):
+
+    def setUp(self):
+        self.colors = np.array([[0, 0, 0], [255, 0, 0], [0, 255, 0], [255, 255, 255]])
+        self.generator = PaintByNumbersImageGenerator(FixedPaletteSegmenter(self.colors))
+
+        rng = np.random.default_rng(0)
+        self.images = [
+            np.kron(self.colors[rng.integers(0, len(self.colors), size=(4, 5))], np.ones((30, 30, 1))).astype(np.uint8)
+            for _ in range(3)
+        ]
+
+    def test_result(self):
+        image = self.images[0]
+        result = self.generator.generate(image)
+
+        regions = np.unique(result.labeled_regions)
+        self.assertEqual(regions[regions != 0].tolist(), sorted(p.region_label for p in result.placements))
+
+        kept = result.labeled_regions != 0
+        region_colors = result.palette[result.region_palette_indexes]
+        np.testing.assert_array_equal(image[kept], region_colors[result.labeled_regions][kept])
+        self.assertEqual(image.shape[:2], result.boundaries.shape)
+        self.assertEqual(image.shape[:2], result.colored_image.size[::-1])
+        self.assertEqual(len(self.colors), len(result.legend.splitlines()))
+        self.assertIn('place_labels', [stage['name'] for stage in result.stages['stages']])
+
+    def test_encoded_image(self):
+        buffer = io.BytesIO()
+        Image.fromarray(self.images[0]).save(buffer, format='PNG')
+
+        result = self.generator.generate(buffer.getvalue())
+        np.testing.assert_array_equal(self.generator.generate(self.images[0]).labeled_regions, result.labeled_regions)
+
+    def test_compact(self):
+        image = self.images[0]
+        result = self.generator.generate(image)
+        compact_result = PaintByNumbersImageGenerator(FixedPaletteSegmenter(self.colors), compact=True).generate(image)
+
+        np.testing.assert_array_equal(result.labeled_regions, compact_result.labeled_regions)
+        self.assertEqual(np.uint8, compact_result.labeled_regions.dtype)
+
+        arrays = {stage['name']: stage['arrays'] for stage in result.stages['stages']}
+        compact_arrays = {stage['name']: stage['arrays'] for stage in compact_result.stages['stages']}
+        self.assertLess(
+            compact_arrays['filter_small_regions']['labeled_regions'], arrays['filter_small_regions']['labeled_regions']
+        )
+
+    def test_compact_peak_memory(self):
+        rng = np.random.default_rng(0)
+        blocks = np.kron(self.colors[rng.integers(0, len(self.colors), size=(20, 25))], np.ones((20, 20, 1)))
+        image = np.clip(blocks + rng.normal(0, 10, blocks.shape), 0, 255).astype(np.uint8)
+
+        peaks = []
+        for compact in (False, True):
+            # several chunks on the small image
+            with mock.patch('src.paint_by_numbers_image_generator.COMPACT_CHUNK_PIXELS', 2 ** 14):
+                generator = PaintByNumbersImageGenerator(
+                    KMeansSegmenter(len(self.colors), compact=compact),
+                    compact=compact,
+                    stage_timer=StageTimer(trace_allocations=True)
+                )
+            # the first run includes one-time allocations of sklearn
+            generator.generate(image)
+            stages = generator.generate(image).stages['stages']
+            peaks.append({stage['name']: stage['peak_allocated'] for stage in stages})
+
+        default_peaks, compact_peaks = peaks
+        for name, ratio in (('segment', 0.7), ('filter_small_regions', 0.75), ('find_boundaries', 0.75)):
+            self.assertLess(compact_peaks[name], ratio * default_peaks[name], name)
+
+    def test_image_left_unchanged(self):
+        generator = PaintByNumbersImageGenerator(KMeansSegmenter(3, compact=True, blur_in_place=True))
+        rng = np.random.default_rng(1)
+        image = np.clip(self.images[0] + rng.normal(0, 20, self.images[0].shape), 0, 255).astype(np.uint8)
+
+        read_only_image = image.copy()
+        read_only_image.flags.writeable = False
+
+        for image_array in (image.copy(), read_only_image):
+            generator.generate(image_array)
+            np.testing.assert_array_equal(image, image_array)
+
+    def test_shared_generator(self):
+        # runs do not leak into each other, also when they share the generator across threads
+        expected = [
+            PaintByNumbersImageGenerator(FixedPaletteSegmenter(self.colors)).generate(image) for image in self.images
+        ]
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(executor.map(self.generator.generate, self.images * 3))
+
+        for index, result in enumerate(results):
+            reference = expected[index % len(self.images)]
+            np.testing.assert_array_equal(reference.labeled_regions, result.labeled_regions)
+            self.assertEqual(
+                [(p.number, p.position) for p in reference.placements],
+                [(p.number, p.position) for p in result.placements]
+            )
+
+    def test_output_writer_closed_on_failure(self):
+        output_writers = []
+
+        class RecordingOutputWriter(OutputWriter):
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.closed = False
+                output_writers.append(self)
+
+            def close(self):
+                self.closed = True
+                super().close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, 'image.png')
+            Image.fromarray(self.images[0]).save(image_path)
+
+            with mock.patch('src.paint_by_numbers_image_generator.OutputWriter', RecordingOutputWriter), \
+                    mock.patch.object(self.generator, 'build_result', side_effect=RuntimeError('failed')):
+                self.assertRaises(
+                    RuntimeError, self.generator.generate_image, image_path, os.path.join(directory, 'output')
+                )
+
+        self.assertEqual([True], [output_writer.closed for output_writer in output_writers])
+
+
+if __name__ == '__main__':
+    unittest.main()
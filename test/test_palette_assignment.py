@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from src.segmentation.palette_assignment import PaletteAssigner
+
+
+class TestPaletteAssigner(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+
+        self.palette = rng.integers(0, 256, (12, 3))
+        self.image_array = rng.integers(0, 256, (37, 53, 3), dtype=np.uint8)
+
+        distances = ((self.image_array[:, :, None, :].astype(float) - self.palette) ** 2).sum(axis=-1)
+        self.expected_labels = distances.argmin(axis=-1)
+        self.expected_squared_error = distances.min(axis=-1).sum()
+
+    def test_assign_in_tiles(self):
+        # a tiny memory cap forces many tiles
+        palette_assigner = PaletteAssigner(self.palette, max_memory_bytes=1000)
+
+        labels, squared_error = palette_assigner.assign(self.image_array, return_squared_error=True)
+
+        self.assertEqual(np.uint8, labels.dtype)
+        np.testing.assert_array_equal(self.expected_labels, labels)
+        self.assertAlmostEqual(1, squared_error / self.expected_squared_error, places=4)
+
+    def test_assign_with_lut(self):
+        palette_assigner = PaletteAssigner(self.palette, max_memory_bytes=1000, lut_bits=6)
+
+        labels = palette_assigner.assign(self.image_array)
+
+        self.assertEqual(self.image_array.shape[:2], labels.shape)
+        # pixels are matched by their cube cell, almost all of them still get the nearest color
+        self.assertGreater((labels == self.expected_labels).mean(), 0.95)
+
+    def test_assign_no_pixels(self):
+        for lut_bits in (None, 5):
+            labels, squared_error = PaletteAssigner(self.palette, lut_bits=lut_bits).assign(
+                np.zeros((0, 4, 3), dtype=np.uint8), return_squared_error=True
+            )
+
+            self.assertEqual((0, 4), labels.shape)
+            self.assertEqual(0, squared_error)
+
+
+if __name__ == '__main__':
+    unittest.main()
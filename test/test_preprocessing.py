@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from src.instrumentation import StageTimer
+from src.paint_by_numbers_image_generator import PaintByNumbersImageGenerator
+from src.segmentation.k_means import KMeansSegmenter
+from src.segmentation.preprocessing import (
+    BilateralFilter, Downscale, GaussianBlur, Preprocessor, in_bands, median_filter_labels, parse_preprocessor,
+    quantization_error
+)
+
+
+class TestPreprocessor(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        colors = np.array([[200, 40, 40], [40, 180, 40], [40, 40, 200]])
+
+        # blocks of three colors with texture noise on top
+        blocks = np.kron(colors[rng.integers(0, 3, (6, 8))], np.ones((24, 24, 1)))
+        self.image_array = np.clip(blocks + rng.normal(0, 28, blocks.shape), 0, 255).astype(np.uint8)
+        self.generator = PaintByNumbersImageGenerator(KMeansSegmenter(3, blur_size=None))
+
+    def number_of_color_regions(self, preprocessor: Preprocessor = None) -> int:
+        segmented_image = self.generator.segment(self.image_array, preprocessor=preprocessor)
+        return int(segmented_image.color_regions.max())
+
+    def test_fewer_fragments(self):
+        unfiltered = self.number_of_color_regions()
+        filtered = self.number_of_color_regions(Preprocessor([BilateralFilter()]))
+        median_filtered = self.number_of_color_regions(Preprocessor([BilateralFilter()], label_median_size=5))
+
+        self.assertLess(filtered, unfiltered)
+        self.assertLess(median_filtered, filtered)
+
+    def test_downscale_restores_size(self):
+        timer = StageTimer()
+        preprocessor = Preprocessor([Downscale(megapixels=0.01), GaussianBlur()], label_median_size=3)
+        result = preprocessor.segment(KMeansSegmenter(3, blur_size=None), self.image_array, timer)
+
+        self.assertEqual(self.image_array.shape[:2], result.segment_labels.shape)
+        self.assertEqual(self.image_array.shape, result.quantized_image.shape)
+        self.assertEqual(
+            ['downscale', 'gaussian_blur', 'segment_preprocessed', 'upscale_labels', 'label_median'],
+            [record.name for record in timer.records]
+        )
+
+    def test_image_not_blurred_in_place(self):
+        image_array = self.image_array.copy()
+        segmenter = KMeansSegmenter(3, compact=True, blur_in_place=True)
+
+        # no step copies the image, the error is still measured against the unblurred one
+        result = Preprocessor(label_median_size=3).segment(segmenter, image_array)
+
+        np.testing.assert_array_equal(self.image_array, image_array)
+        self.assertAlmostEqual(quantization_error(self.image_array, result.quantized_image), result.quantization_error)
+
+    def test_median_keeps_labels_present(self):
+        labels = np.array([[0, 0, 1], [2, 2, 1], [0, 2, 1]], dtype=np.int64)
+        filtered = median_filter_labels(np.kron(labels, np.ones((4, 4), dtype=np.int64)), 3, np.eye(3) * 255)
+
+        self.assertEqual(np.int64, filtered.dtype)
+        self.assertTrue(set(np.unique(filtered)) <= {0, 1, 2})
+
+    def test_bands_match_single_run(self):
+        step = GaussianBlur(5)
+        np.testing.assert_array_equal(
+            step.apply(self.image_array), in_bands(step.apply, self.image_array, overlap=2, bands=4)
+        )
+
+    def test_parse_preprocessor(self):
+        preprocessor = parse_preprocessor(['downscale:2', 'bilateral', 'label_median:7'])
+
+        self.assertEqual([Downscale, BilateralFilter], [type(step) for step in preprocessor.steps])
+        self.assertEqual(7, preprocessor._label_median_size)
+        self.assertRaises(ValueError, parse_preprocessor, ['sharpen'])
+        self.assertRaises(ValueError, parse_preprocessor, ['label_median:4'])
+
+    def test_smoothing(self):
+        self.assertFalse(parse_preprocessor(['downscale:0.5', 'label_median']).smoothing)
+        self.assertTrue(parse_preprocessor(['downscale:0.5', 'guided']).smoothing)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+
+from src.preview import PreviewSession, pyramid_factor, scaled_min_size
+from src.segmentation.k_means import KMeansSegmenter
+
+
+class CountingSegmenterFactory:
+    def __init__(self):
+        self.segmenters = []
+
+    def __call__(self, number_of_colors):
+        segmenter = KMeansSegmenter(number_of_colors)
+        self.segmenters.append(segmenter)
+        return segmenter
+
+
+class TestPreviewSession(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        colors = np.array([[200, 30, 30], [30, 200, 30], [30, 30, 200], [230, 230, 230]], dtype=np.uint8)
+        self.image = np.kron(colors[rng.integers(0, len(colors), size=(8, 8))], np.ones((32, 32, 1), dtype=np.uint8))
+
+    def test_scales(self):
+        self.assertEqual(1, pyramid_factor(100 * 100, 100 * 100))
+        self.assertEqual(4, pyramid_factor(256 * 256, 64 * 64))
+        self.assertEqual(150 // 16, scaled_min_size(150, 4))
+        self.assertEqual(1, scaled_min_size(3, 8))
+
+    def test_preview_and_render(self):
+        segmenter_factory = CountingSegmenterFactory()
+        session = PreviewSession(self.image, segmenter_factory, preview_pixels=64 * 64)
+
+        try:
+            preview = session.preview(number_of_colors=4, min_size=1024)
+            self.assertEqual(4, session.preview_factor)
+            self.assertEqual((64, 64), preview.labeled_regions.shape)
+
+            # min_size only changes the regions, the segmentation is reused
+            small_regions_dropped = session.preview(number_of_colors=4, min_size=4096)
+            self.assertEqual(1, len(segmenter_factory.segmenters))
+            self.assertLess(len(small_regions_dropped.placements), len(preview.placements))
+
+            render = session.start_render(number_of_colors=4, min_size=1024).result()
+            self.assertEqual(self.image.shape[:2], render.labeled_regions.shape)
+            self.assertEqual(2, len(segmenter_factory.segmenters))
+
+            # seeded with the preview palette, the colors keep their numbers
+            distances = np.linalg.norm(preview.palette[:, None].astype(float) - render.palette[None], axis=-1)
+            np.testing.assert_array_equal(np.arange(4), distances.argmin(axis=1))
+
+            # a region is kept at both scales or at none
+            self.assertEqual(len(preview.placements), len(render.placements))
+        finally:
+            session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 
 import numpy as np
 
-from src.sections import RegionDetector
+from src.sections import Region, RegionDetector
 
 
 class TestRegionDetector(unittest.TestCase):
@@ -66,6 +66,43 @@ class TestRegionDetector(unittest.TestCase):
 
         pass
 
+    def test_get_regions_pixels(self):
+        test_binary_mask = np.array([
+            [True, True, False, True],
+            [False, True, False, True],
+            [True, False, False, False],
+            [True, True, True, False],
+        ])
+
+        region_detector = RegionDetector()
+
+        regions = region_detector.get_regions(test_binary_mask)
+
+        region_pixels = sorted(sorted(region._region_pixels) for region in regions)
+
+        self.assertEqual(
+            [
+                [(0, 0), (1, 0), (1, 1)],
+                [(0, 2), (0, 3), (1, 3), (2, 3)],
+                [(3, 0), (3, 1)],
+            ],
+            region_pixels
+        )
+
+    def test_region_summary(self):
+        region = Region([(1, 0), (2, 0), (4, 0), (1, 1), (2, 1), (3, 1)])
+
+        self.assertEqual(6, region.area)
+        self.assertEqual((1, 0, 4, 1), region.bounding_box)
+        self.assertEqual((13 / 6, 0.5), region.centroid)
+        self.assertEqual([[0, 1, 2], [0, 4, 4], [1, 1, 3]], region.runs.tolist())
+        self.assertEqual([(2, 0), (2, 1)], region.get_region_center_middle_positions())
+
+    def test_get_regions_empty_mask(self):
+        region_detector = RegionDetector()
+
+        self.assertEqual([], region_detector.get_regions(np.zeros((4, 4), dtype=bool)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from src.label_placement import LabelPlacement
+from src.paint_by_numbers_image_generator import PaintByNumbersResult
+from src.rendering import GlyphAtlas, Renderer, edge_mask, find_boundaries
+
+
+class TestFindBoundaries(unittest.TestCase):
+
+    def test_matches_skimage(self):
+        from skimage.segmentation import find_boundaries as skimage_find_boundaries
+
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            labels = rng.integers(0, 4, size=rng.integers(1, 12, size=2)).astype(np.int32)
+            np.testing.assert_array_equal(skimage_find_boundaries(labels, mode='outer'), find_boundaries(labels))
+
+    def test_edge_mask(self):
+        labels = np.array([[1, 1, 2], [1, 1, 2]])
+
+        np.testing.assert_array_equal([[False, False, True], [False, False, True]], edge_mask(labels))
+        self.assertEqual((4, 6), edge_mask(labels, scale=2).shape)
+        self.assertEqual(4, np.count_nonzero(edge_mask(labels, scale=2)))
+
+
+class TestGlyphAtlas(unittest.TestCase):
+
+    def test_blit_matches_draw(self):
+        font = ImageFont.load_default()
+        texts = ['1', '12', '7', '12']
+        # the last label is cut off by the border of the layer, none of them overlap
+        positions = np.array([[3, 4], [20, 4], [3, 20], [30, 24]])
+
+        drawn = Image.new('L', (40, 30), 0)
+        draw = ImageDraw.Draw(drawn)
+        for text, position in zip(texts, positions.tolist()):
+            draw.text(tuple(position), text, fill=255, font=font)
+
+        atlas = GlyphAtlas(font)
+        layer = np.zeros((30, 40), dtype=np.uint8)
+        atlas.blit(layer, texts, positions)
+
+        np.testing.assert_array_equal(np.asarray(drawn), layer)
+        # rasterized once per text
+        self.assertIs(atlas.glyph('12'), atlas.glyph('12'))
+
+    def test_blit_keeps_maximum_on_overlap(self):
+        font = ImageFont.load_default()
+        texts = ['7', '12']
+        positions = np.array([[3, 20], [-5, 25]])
+
+        drawn = np.zeros((30, 40), dtype=np.uint8)
+        for text, position in zip(texts, positions.tolist()):
+            label = Image.new('L', (40, 30), 0)
+            ImageDraw.Draw(label).text(tuple(position), text, fill=255, font=font)
+            drawn = np.maximum(drawn, np.asarray(label))
+
+        layer = np.zeros((30, 40), dtype=np.uint8)
+        GlyphAtlas(font).blit(layer, texts, positions)
+
+        np.testing.assert_array_equal(drawn, layer)
+
+
+class TestRenderer(unittest.TestCase):
+
+    def setUp(self):
+        labeled_regions = np.ones((40, 60), dtype=np.int64)
+        labeled_regions[:, 30:] = 2
+        palette = np.array([[200, 0, 0], [0, 0, 200]], dtype=np.uint8)
+        region_palette_indexes = np.array([0, 0, 1])
+
+        self.result = PaintByNumbersResult(
+            labeled_regions,
+            palette,
+            region_palette_indexes,
+            palette[region_palette_indexes[labeled_regions]],
+            find_boundaries(labeled_regions),
+            placements=[
+                LabelPlacement(1, 1, (10, 15), (12, 20), ImageFont.load_default()),
+                LabelPlacement(2, 2, (40, 15), (42, 20), ImageFont.load_default()),
+            ],
+            color_to_number={(200, 0, 0): 1, (0, 0, 200): 2}
+        )
+
+    def test_default(self):
+        colored_image, outline_image = Renderer().render(self.result)
+        outline = np.asarray(outline_image)
+        colored = np.asarray(colored_image)
+
+        self.assertEqual((40, 60), outline.shape)
+        np.testing.assert_array_equal(0, outline[:, 29:31])
+        # the labels darken the same pixels of both images
+        labels = (outline < 255) & ~self.result.boundaries
+        self.assertTrue(labels.any())
+        np.testing.assert_array_equal(labels, (colored != self.result.quantized_image).any(axis=2))
+
+    def test_print_resolution(self):
+        renderer = Renderer(scale=2, line_width=2, antialias=True, dpi=300)
+        colored_image, outline_image = renderer.render(self.result)
+
+        self.assertEqual((120, 80), colored_image.size)
+        self.assertEqual((300, 300), outline_image.info['dpi'])
+
+        ink = renderer.outline_ink(self.result.labeled_regions)
+        # a two pixel line centered on a pixel covers half of the pixels next to it
+        np.testing.assert_array_equal(255, ink[:, 60])
+        np.testing.assert_array_equal(128, ink[:, [59, 61]])
+
+    def test_line_width(self):
+        thin = Renderer(scale=2, line_width=1).outline_ink(self.result.labeled_regions)
+        thick = Renderer(scale=2, line_width=5).outline_ink(self.result.labeled_regions)
+
+        self.assertEqual(80, np.count_nonzero(thin))
+        self.assertEqual(5 * 80, np.count_nonzero(thick))
+
+
+if __name__ == '__main__':
+    unittest.main()
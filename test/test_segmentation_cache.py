@@ -0,0 +1,153 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.segmentation import ImageSegmenter, SegmentationResult
+from src.segmentation.cache import CachingSegmenter, SegmentationCache
+from src.segmentation.k_means import KMeansSegmenter
+
+
+class CountingSegmenter(ImageSegmenter):
+
+    def __init__(self, number_of_colors=2):
+        self._number_of_colors = number_of_colors
+        self.calls = 0
+        self.warm_start_palettes = []
+
+    @property
+    def number_of_colors(self):
+        return self._number_of_colors
+
+    def cache_key(self) -> str:
+        return f'counting;{self._number_of_colors}'
+
+    def warm_started(self, palette):
+        self.warm_start_palettes.append(palette)
+        return self
+
+    def segment(self, image_array: np.ndarray) -> SegmentationResult:
+        self.calls += 1
+        labels = (image_array[:, :, 0] > 127).astype(np.uint8)
+        colors = np.array([[0, 0, 0], [255, 255, 255]], dtype=float)
+
+        return SegmentationResult(labels, colors, colors.astype('uint8')[labels], quantization_error=1.5)
+
+
+class TestSegmentationCache(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.image_array = rng.integers(0, 256, (8, 10, 3), dtype=np.uint8)
+        self.other_image_array = rng.integers(0, 256, (8, 10, 3), dtype=np.uint8)
+
+    def test_memory_hit(self):
+        segmenter = CountingSegmenter()
+        caching_segmenter = CachingSegmenter(segmenter)
+
+        first = caching_segmenter.segment(self.image_array)
+        second = caching_segmenter.segment(self.image_array.copy())
+
+        self.assertIs(first, second)
+        self.assertEqual(1, segmenter.calls)
+
+    def test_disk_store_and_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            segmenter = CountingSegmenter()
+            CachingSegmenter(segmenter, SegmentationCache(directory)).segment(self.image_array)
+
+            # a fresh cache reads the result back from disk
+            result = CachingSegmenter(segmenter, SegmentationCache(directory)).segment(self.image_array)
+
+            self.assertEqual(1, segmenter.calls)
+            self.assertEqual(1.5, result.quantization_error)
+            np.testing.assert_array_equal(self.image_array[:, :, 0] > 127, result.segment_labels)
+
+            cache = SegmentationCache(directory, max_entries=1, max_disk_entries=1)
+            CachingSegmenter(segmenter, cache).segment(self.other_image_array)
+
+            self.assertEqual(1, len(os.listdir(directory)))
+            self.assertIsNone(cache.get(SegmentationCache.key(self.image_array, segmenter)))
+
+    def test_entry_evicted_while_read(self):
+        with tempfile.TemporaryDirectory() as directory:
+            segmenter = CountingSegmenter()
+            CachingSegmenter(segmenter, SegmentationCache(directory)).segment(self.image_array)
+
+            cache = SegmentationCache(directory)
+            with mock.patch('os.utime', side_effect=FileNotFoundError):
+                self.assertIsNone(cache.get(SegmentationCache.key(self.image_array, segmenter)))
+
+    def test_key_depends_on_segmenter(self):
+        self.assertNotEqual(
+            SegmentationCache.key(self.image_array, KMeansSegmenter(4)),
+            SegmentationCache.key(self.image_array, KMeansSegmenter(5))
+        )
+
+    def test_key_from_primitive_parameters(self):
+        self.assertEqual(KMeansSegmenter(4).cache_key(), KMeansSegmenter(4).cache_key())
+
+        # numpy scalars give the key of the python value
+        self.assertEqual(KMeansSegmenter(4).cache_key(), KMeansSegmenter(np.int64(4)).cache_key())
+        self.assertEqual(
+            KMeansSegmenter(4, sample_size=1000).cache_key(), KMeansSegmenter(4, sample_size=np.int32(1000)).cache_key()
+        )
+
+        segmenter = KMeansSegmenter(4)
+        segmenter.assigner = object()
+        self.assertRaises(TypeError, segmenter.cache_key)
+
+    def test_warm_started_results_are_kept_apart(self):
+        cache = SegmentationCache()
+        caching_segmenter = CachingSegmenter(KMeansSegmenter(2), cache, warm_start=True)
+
+        caching_segmenter.segment(self.image_array)
+        # starts from the palette of the first image
+        caching_segmenter.segment(self.other_image_array)
+
+        self.assertIsNotNone(cache.get(SegmentationCache.key(self.image_array, KMeansSegmenter(2))))
+        self.assertIsNone(cache.get(SegmentationCache.key(self.other_image_array, KMeansSegmenter(2))))
+
+    def test_warm_start(self):
+        segmenter = CountingSegmenter()
+        caching_segmenter = CachingSegmenter(segmenter, warm_start=True)
+
+        caching_segmenter.segment(self.image_array)
+        caching_segmenter.segment(self.other_image_array)
+
+        self.assertEqual(2, segmenter.calls)
+        self.assertEqual(1, len(segmenter.warm_start_palettes))
+
+    def test_warm_started_rerender_hits(self):
+        with tempfile.TemporaryDirectory() as directory:
+            segmenter = CountingSegmenter()
+            caching_segmenter = CachingSegmenter(segmenter, SegmentationCache(directory), warm_start=True)
+
+            caching_segmenter.segment(self.other_image_array)
+            first = caching_segmenter.segment(self.image_array)
+            second = caching_segmenter.segment(self.image_array)
+
+            self.assertIs(first, second)
+            self.assertEqual(2, segmenter.calls)
+
+            # a fresh cache finds the warm started result through the recorded key on disk
+            CachingSegmenter(segmenter, SegmentationCache(directory), warm_start=True).segment(self.image_array)
+            self.assertEqual(2, segmenter.calls)
+
+
+class TestKMeansWarmStart(unittest.TestCase):
+
+    def test_warm_started(self):
+        colors = np.array([[200, 30, 30], [30, 200, 30], [30, 30, 200]], dtype=np.uint8)
+        image_array = np.repeat(np.repeat(colors[np.arange(12).reshape(3, 4) % 3], 8, axis=0), 8, axis=1)
+
+        result = KMeansSegmenter(3).warm_started(colors).segment(image_array)
+
+        # starting from the palette keeps its order
+        np.testing.assert_array_equal(np.arange(3), result.segment_labels[0, 0:24:8])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import io
+import json
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from src.batch import create_generator
+from src.service import GenerationService, ServiceBusy, ServiceClient, serve
+
+
+def encoded_image(seed: int, size: int = 120) -> bytes:
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, size=(4, 4, 3), dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.kron(blocks, np.ones((size // 4, size // 4, 1), dtype=np.uint8))).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class TestGenerationService(unittest.TestCase):
+
+    def setUp(self):
+        self.generator_factory = functools.partial(create_generator, segmenter='octree', number_of_colors=4)
+
+    def test_streamed_over_http(self):
+        async def run():
+            async with GenerationService(self.generator_factory, workers=1) as service:
+                server = await serve(service, port=0)
+                client = ServiceClient(port=server.sockets[0].getsockname()[1])
+
+                async with server:
+                    events = [event async for event in client.generate(encoded_image(0))]
+
+                    with self.assertRaises(ValueError):
+                        [event async for event in client.generate(b'not an image')]
+
+            return events
+
+        events = asyncio.run(run())
+        kinds = [event.kind for event in events]
+        artifacts = [event.info['name'] for event in events if event.kind == 'artifact']
+
+        self.assertEqual(['queued', 'started'], kinds[:2])
+        self.assertEqual('done', kinds[-1])
+        self.assertIn('place_labels', [event.info['name'] for event in events if event.kind == 'stage'])
+
+        # quantized preview first, then outlines and labels
+        self.assertEqual(
+            ['preview.png', 'outline.png', 'labels.json', 'paint_by_numbers.png', 'paint.png', 'legend.txt'],
+            artifacts
+        )
+
+        data = {event.info['name']: event.data for event in events if event.kind == 'artifact'}
+        self.assertEqual((120, 120), Image.open(io.BytesIO(data['paint_by_numbers.png'])).size)
+        labels = json.loads(data['labels.json'])
+        self.assertTrue(labels)
+        self.assertTrue(all(1 <= label['number'] <= 4 for label in labels))
+
+    def test_batching_and_backpressure(self):
+        async def run():
+            async with GenerationService(
+                    self.generator_factory, workers=1, queue_size=4, batch_window=0.5
+            ) as service:
+                jobs = [await service.submit(encoded_image(seed)) for seed in range(4)]
+
+                with self.assertRaises(ServiceBusy):
+                    await service.submit(encoded_image(4))
+
+                events = []
+                for job in jobs:
+                    events.append([event async for event in job.events()])
+
+                # room again once the queue is drained
+                artifacts = await (await service.submit(encoded_image(5))).artifacts()
+
+            return events, artifacts
+
+        events, artifacts = asyncio.run(run())
+
+        self.assertTrue(all(job_events[-1].kind == 'done' for job_events in events))
+        self.assertIn('legend.txt', artifacts)
+
+        # the small requests that arrived together ran as one batch
+        self.assertEqual([4, 4, 4, 4], [job_events[1].info['batch_size'] for job_events in events])
+
+    def test_requests_spread_over_free_workers(self):
+        async def run():
+            async with GenerationService(self.generator_factory, workers=4, batch_window=0.5) as service:
+                jobs = [await service.submit(encoded_image(seed)) for seed in range(8)]
+                return [[event async for event in job.events()] for job in jobs]
+
+        events = asyncio.run(run())
+        started = [job_events[1].info for job_events in events]
+
+        self.assertTrue(all(job_events[-1].kind == 'done' for job_events in events))
+        # two per free worker instead of one batch of eight
+        self.assertEqual([2] * 8, [info['batch_size'] for info in started])
+        self.assertGreater(len({info['worker'] for info in started}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import unittest
+
+import numpy as np
+from skimage.measure import label
+
+from src.segmentation.k_means import KMeansSegmenter
+from src.segmentation.superpixel import SuperpixelSegmenter
+from src.utility import load_image
+
+IMAGE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test-images-mnz')
+
+
+class TestSuperpixelSegmenter(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        colors = np.array([[200, 30, 30], [30, 200, 30], [30, 30, 200]], dtype=np.int16)
+
+        # noisy blocks, K-means on the pixels splits them into speckles
+        blocks = np.repeat(np.repeat(colors[rng.integers(0, 3, (6, 8))], 16, axis=0), 16, axis=1)
+        self.image_array = np.clip(blocks + rng.normal(0, 40, blocks.shape), 0, 255).astype(np.uint8)
+
+    def test_segment(self):
+        result = SuperpixelSegmenter(3, number_of_superpixels=200).segment(self.image_array)
+
+        self.assertEqual(self.image_array.shape[:2], result.segment_labels.shape)
+        self.assertEqual(3, len(result.colors))
+        np.testing.assert_array_equal(result.colors.astype('uint8')[result.segment_labels], result.quantized_image)
+
+        # the error from the superpixel sums matches the one measured on the pixels
+        difference = self.image_array.astype(float) - result.colors[result.segment_labels]
+        self.assertAlmostEqual(np.mean(np.sum(difference ** 2, axis=-1)), result.quantization_error, places=6)
+
+    def test_fewer_regions_than_pixel_k_means(self):
+        image_array = load_image(os.path.join(IMAGE_FOLDER, 'two_adventureres.jpg'))
+
+        superpixel_labels = SuperpixelSegmenter(12).segment(image_array).segment_labels
+        pixel_labels = KMeansSegmenter(12).segment(image_array).segment_labels
+
+        superpixel_regions = label(superpixel_labels, background=-1, connectivity=1).max()
+        pixel_regions = label(pixel_labels, background=-1, connectivity=1).max()
+
+        self.assertLess(superpixel_regions * 10, pixel_regions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from src.output_writer import OutputWriter
+from src.paint_by_numbers_image_generator import PaintByNumbersImageGenerator
+from src.segmentation import ImageSegmenter, SegmentationResult
+from src.segmentation.palette_assignment import PaletteAssigner
+from src.tiled_paint_by_numbers_image_generator import TiledPaintByNumbersImageGenerator
+
+
+class FixedPaletteSegmenter(ImageSegmenter):
+    def __init__(self, colors):
+        self.colors = np.asarray(colors)
+
+    def segment(self, image_array: np.ndarray) -> SegmentationResult:
+        segment_labels = PaletteAssigner(self.colors).assign(image_array)
+        return SegmentationResult(segment_labels, self.colors, self.colors.astype(np.uint8)[segment_labels])
+
+
+class TestTiledSegmentation(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.colors = np.array([[0, 0, 0], [255, 0, 0], [0, 255, 0], [0, 0, 255], [255, 255, 255]])
+
+        # blobs of random palette colors, large enough to span several tiles
+        small = rng.integers(0, len(self.colors), size=(12, 15))
+        self.image = self.colors[cv2.resize(small.astype(np.uint8), (150, 120), interpolation=cv2.INTER_NEAREST)]
+        self.image = self.image.astype(np.uint8)
+
+    def _non_tiled_labels(self, min_size):
+        generator = PaintByNumbersImageGenerator(image_segmenter=None)
+
+        blurred = cv2.GaussianBlur(self.image, (5, 5), 0)
+        segment_labels = PaletteAssigner(self.colors).assign(blurred)
+        color_regions, _ = generator._detect_regions_by_color(segment_labels)
+
+        return segment_labels, generator._filter_small_regions(color_regions, min_size=min_size)
+
+    def test_same_partition_as_non_tiled(self):
+        generator = TiledPaintByNumbersImageGenerator(
+            FixedPaletteSegmenter(self.colors), tile_size=32, min_size=20
+        )
+
+        with tempfile.TemporaryDirectory() as work_directory:
+            label_map = generator._segment_tiled(self.image, work_directory)
+            tiled_segment_labels = np.array(label_map.segment_labels)
+            tiled_labels = np.array(label_map.labels)
+            region_palette_indexes = label_map.region_palette_indexes
+            del label_map
+
+        segment_labels, labels = self._non_tiled_labels(min_size=20)
+
+        np.testing.assert_array_equal(segment_labels, tiled_segment_labels)
+        np.testing.assert_array_equal(labels == 0, tiled_labels == 0)
+
+        # same regions, possibly numbered differently
+        pairs = np.unique(np.stack((labels.ravel(), tiled_labels.ravel())), axis=1)
+        self.assertEqual(len(np.unique(pairs[0])), pairs.shape[1])
+        self.assertEqual(len(np.unique(pairs[1])), pairs.shape[1])
+
+        kept = tiled_labels != 0
+        np.testing.assert_array_equal(segment_labels[kept], region_palette_indexes[tiled_labels[kept]])
+
+    def test_single_tile(self):
+        generator = TiledPaintByNumbersImageGenerator(
+            FixedPaletteSegmenter(self.colors), tile_size=1024, min_size=20
+        )
+
+        with tempfile.TemporaryDirectory() as work_directory:
+            label_map = generator._segment_tiled(self.image, work_directory)
+            tiled_labels = np.array(label_map.labels)
+            del label_map
+
+        _, labels = self._non_tiled_labels(min_size=20)
+        np.testing.assert_array_equal(labels, tiled_labels)
+
+    def test_generate(self):
+        generator = TiledPaintByNumbersImageGenerator(
+            FixedPaletteSegmenter(self.colors), tile_size=32, min_size=20
+        )
+        result = generator.generate(self.image)
+
+        self.assertEqual(self.image.shape[:2], result.labeled_regions.shape)
+        self.assertEqual(self.image.shape[:2][::-1], result.colored_image.size)
+        self.assertTrue(result.placements)
+
+    def _image_path(self, directory):
+        image_path = os.path.join(directory, 'image.png')
+        cv2.imwrite(image_path, self.image[:, :, ::-1])
+        return image_path
+
+    def test_generate_image(self):
+        generator = TiledPaintByNumbersImageGenerator(
+            FixedPaletteSegmenter(self.colors), tile_size=32, min_size=20, image_format='webp'
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            output_folder = os.path.join(directory, 'output')
+            generator.generate_image(self._image_path(directory), output_folder)
+
+            self.assertEqual(
+                ['legend.txt', 'paint.jpg', 'paint_by_numbers_output.webp', 'pallete.jpg'],
+                sorted(os.listdir(output_folder))
+            )
+
+            with self.assertRaises(ValueError):
+                generator.generate_image(self._image_path(directory), output_writer=OutputWriter())
+
+    def test_output_writer_closed_on_failure(self):
+        generator = TiledPaintByNumbersImageGenerator(FixedPaletteSegmenter(self.colors), tile_size=32)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(OutputWriter, 'close', autospec=True, side_effect=OutputWriter.close) as close, \
+                    mock.patch.object(generator, '_segment_tiled', side_effect=RuntimeError('failed')):
+                self.assertRaises(
+                    RuntimeError, generator.generate_image, self._image_path(directory), os.path.join(directory, 'out')
+                )
+
+        self.assertEqual(1, close.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
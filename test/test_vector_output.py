@@ -0,0 +1,135 @@
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+from PIL import ImageFont
+
+from src.label_placement import LabelPlacement
+from src.vector_output import OUTSIDE, BoundaryGraph
+from src.vector_output.pdf import PdfWriter
+from src.vector_output.svg import SvgWriter
+
+
+def signed_area(ring):
+    x, y = ring[:, 0].astype(float), ring[:, 1].astype(float)
+    return 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+
+
+class TestBoundaryGraph(unittest.TestCase):
+
+    def setUp(self):
+        # 1 encloses 2, 3 and 4 meet 1 at a junction, 5 touches 3 only diagonally
+        self.labeled_regions = np.array([
+            [1, 1, 1, 1, 3, 3],
+            [1, 2, 2, 1, 3, 3],
+            [1, 2, 2, 1, 4, 4],
+            [1, 1, 1, 1, 4, 4],
+            [0, 0, 5, 5, 4, 4],
+        ])
+
+    def test_every_border_is_one_chain(self):
+        boundary_graph = BoundaryGraph.from_labels(self.labeled_regions)
+
+        pairs = [tuple(pair) for pair in boundary_graph.chain_labels.tolist()]
+        self.assertIn((1, 2), pairs)
+        self.assertIn((1, 3), pairs)
+        self.assertNotIn((3, 5), pairs)
+
+        # the border of 2 is a closed chain
+        enclosed = boundary_graph.chain(pairs.index((1, 2)))
+        np.testing.assert_array_equal(enclosed[0], enclosed[-1])
+        self.assertEqual(8 + 1, len(enclosed))
+
+        # every pixel edge between different labels is in exactly one chain
+        padded = np.pad(self.labeled_regions, 1, constant_values=OUTSIDE)
+        pixel_edges = np.count_nonzero(padded[1:-1, :-1] != padded[1:-1, 1:]) + \
+            np.count_nonzero(padded[:-1, 1:-1] != padded[1:, 1:-1])
+        self.assertEqual(pixel_edges, len(boundary_graph.points) - len(boundary_graph))
+
+    def test_rings_cover_the_regions(self):
+        rng = np.random.default_rng(0)
+        labeled_regions = np.kron(rng.integers(0, 6, size=(9, 11)), np.ones((3, 2), dtype=int))
+        labeled_regions[rng.random(labeled_regions.shape) < 0.05] = 7
+
+        rings = BoundaryGraph.from_labels(labeled_regions).region_rings()
+        self.assertEqual(set(np.unique(labeled_regions).tolist()), set(rings))
+
+        # all rings have the region on the same side, the holes subtract
+        areas = [sum(signed_area(ring) for ring in region_rings) for region_rings in rings.values()]
+        self.assertEqual(1, len({np.sign(area) for area in areas}))
+
+        for region, area in zip(rings, areas):
+            self.assertEqual(np.count_nonzero(labeled_regions == region), abs(area))
+
+        simplified_rings = BoundaryGraph.from_labels(labeled_regions).simplified(0.75).region_rings()
+        self.assertEqual(set(rings), set(simplified_rings))
+
+    def test_simplification_keeps_the_junctions(self):
+        labeled_regions = np.zeros((40, 40), dtype=int)
+        rows, cols = np.indices(labeled_regions.shape)
+        labeled_regions[rows > cols] = 1
+        labeled_regions[(rows - 20) ** 2 + (cols - 20) ** 2 < 100] = 2
+
+        boundary_graph = BoundaryGraph.from_labels(labeled_regions)
+        simplified = boundary_graph.simplified(1.0)
+
+        self.assertEqual(len(boundary_graph), len(simplified))
+        self.assertLess(len(simplified.points), len(boundary_graph.points) / 3)
+
+        for index in range(len(boundary_graph)):
+            np.testing.assert_array_equal(boundary_graph.chain(index)[[0, -1]], simplified.chain(index)[[0, -1]])
+
+
+class TestVectorWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.labeled_regions = np.array([
+            [1, 1, 2, 2],
+            [1, 1, 2, 2],
+            [3, 3, 3, 3],
+        ])
+        self.boundary_graph = BoundaryGraph.from_labels(self.labeled_regions)
+        self.region_colors = {1: (255, 0, 0), 2: (0, 255, 0), 3: (0, 0, 255)}
+
+        font = ImageFont.load_default()
+        self.placements = [
+            LabelPlacement(1, 1, (0, 0), (1, 1), font),
+            LabelPlacement(2, 2, (4, 0), (3, 1), font, leader=True),
+        ]
+
+    def test_svg(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.svg')
+            SvgWriter(filled=True).write(path, self.boundary_graph, self.region_colors, self.placements)
+
+            root = ElementTree.parse(path).getroot()
+
+        namespace = '{http://www.w3.org/2000/svg}'
+        paths = root.findall(f'{namespace}path')
+        fills = [element.get('fill') for element in paths]
+
+        self.assertEqual({'#ff0000', '#00ff00', '#0000ff', 'none'}, set(fills))
+        self.assertEqual(['1', '2'], [element.text for element in root.iter(f'{namespace}text')])
+
+    def test_pdf(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.pdf')
+            PdfWriter(filled=True).write(path, self.boundary_graph, self.region_colors, self.placements)
+
+            with open(path, 'rb') as f:
+                data = f.read()
+
+        self.assertTrue(data.startswith(b'%PDF-1.4'))
+        self.assertTrue(data.endswith(b'%%EOF\n'))
+
+        # the cross reference table points at the objects
+        xref_offset = int(data[data.rindex(b'startxref') + 10:].split()[0])
+        offsets = [int(line.split()[0]) for line in data[xref_offset:].split(b'\n')[3:8]]
+        for number, offset in enumerate(offsets, start=1):
+            self.assertTrue(data[offset:].startswith(f'{number} 0 obj'.encode()))
+
+
+if __name__ == '__main__':
+    unittest.main()